@@ -1,24 +1,196 @@
+import asyncio
 import httpx
+import ipaddress
 import os
+import time
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime, timezone
+from typing import Awaitable
 from fastapi import Request
 
+from breaker import CircuitBreaker
+from cache import SingleFlight, TTLCache
+from database import get_cached_aqi, get_recent_aqi_cells, is_db_open, save_aqi_cache
+from log import get_logger
+from metrics import (
+    AQI_CHAIN_SKIPS,
+    AQI_RESOLUTIONS,
+    CACHE_LOOKUPS,
+    FLAGGED_DEVICE_READINGS,
+    UPSTREAM_ERRORS,
+)
+
+log = get_logger("aqi_service")
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 DEFAULT_LAT = float(os.getenv("DEFAULT_LAT", 6.5244))
 DEFAULT_LON = float(os.getenv("DEFAULT_LON", 3.3792))
 AQI_TIMEOUT = float(os.getenv("AQI_TIMEOUT_SECONDS", 3))
+AQI_LATENCY_BUDGET = float(os.getenv("AQI_LATENCY_BUDGET_SECONDS", 2.5))   # whole fallback chain
+AQI_RESOLUTION_MODE = os.getenv("AQI_RESOLUTION_MODE", "concurrent")       # or "sequential"
+AQI_HEDGE_DELAY     = float(os.getenv("AQI_HEDGE_DELAY_SECONDS", 0))       # 0 disables hedged requests
+
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+BREAKER_WINDOW       = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS    = int(os.getenv("BREAKER_MIN_CALLS", 5))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))
+
+HTTP_MAX_CONNECTIONS  = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE    = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", 60))
+HTTP2_ENABLED         = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+AQI_CACHE_TTL         = float(os.getenv("AQI_CACHE_TTL_SECONDS", 900))
+AQI_CACHE_GRID        = float(os.getenv("AQI_CACHE_GRID_DEGREES", 0.1))
+AQI_CACHE_MAX_ENTRIES = int(os.getenv("AQI_CACHE_MAX_ENTRIES", 1024))
+
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", 3600))
+FORECAST_DAYS      = int(os.getenv("FORECAST_DAYS", 3))   # must cover today + the 48 h horizon
+
+AQI_REFRESH_INTERVAL    = float(os.getenv("AQI_REFRESH_INTERVAL_SECONDS", 600))   # 0 disables the refresher
+AQI_REFRESH_IDLE        = float(os.getenv("AQI_REFRESH_IDLE_SECONDS", 6 * 3600))
+AQI_REFRESH_CONCURRENCY = int(os.getenv("AQI_REFRESH_CONCURRENCY", 4))
+AQI_REFRESH_MAX_CELLS   = int(os.getenv("AQI_REFRESH_MAX_CELLS", AQI_CACHE_MAX_ENTRIES))
+
+IP_GEO_CACHE_TTL         = float(os.getenv("IP_GEO_CACHE_TTL_SECONDS", 86400))
+IP_GEO_NEGATIVE_TTL      = float(os.getenv("IP_GEO_NEGATIVE_TTL_SECONDS", 600))
+IP_GEO_CACHE_MAX_ENTRIES = int(os.getenv("IP_GEO_CACHE_MAX_ENTRIES", 4096))
+
+# Overridable so benchmarks and tests can point at a local stub
+OPEN_METEO_BASE_URL = os.getenv("OPEN_METEO_BASE_URL", "https://air-quality-api.open-meteo.com")
+IP_GEO_BASE_URL     = os.getenv("IP_GEO_BASE_URL", "http://ip-api.com")
 
 OPEN_METEO_URL = (
-    "https://air-quality-api.open-meteo.com/v1/air-quality"
+    OPEN_METEO_BASE_URL + "/v1/air-quality"
     "?latitude={lat}&longitude={lon}"
     "&current=pm2_5,pm10,us_aqi"
 )
 
-IP_GEO_URL = "http://ip-api.com/json/{ip}?fields=status,lat,lon,city"
+IP_GEO_URL = IP_GEO_BASE_URL + "/json/{ip}?fields=status,lat,lon,city"
+
+# Addresses ip-api can never locate: private, loopback, link-local, CGNAT.
+UNROUTABLE_NETWORKS = tuple(ipaddress.ip_network(net) for net in (
+    "0.0.0.0/8",
+    "10.0.0.0/8",
+    "100.64.0.0/10",
+    "127.0.0.0/8",
+    "169.254.0.0/16",
+    "172.16.0.0/12",
+    "192.168.0.0/16",
+    "::1/128",
+    "fc00::/7",
+    "fe80::/10",
+))
+
+# ---------------------------------------------------------------------------
+# Shared HTTP client
+# ---------------------------------------------------------------------------
+# One pooled client for every outbound call, so Open-Meteo and ip-api
+# connections are kept alive instead of paying DNS + TCP + TLS each time.
+# Opened and closed by the FastAPI lifespan.
+
+_client: httpx.AsyncClient | None = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            log.warning("http2_unavailable", extra={"reason": "h2 not installed, using HTTP/1.1"})
+            http2 = False
+
+    return httpx.AsyncClient(
+        timeout=AQI_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def open_http_client():
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _http() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first use outside the app (scripts, tests)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+async def _get(url: str) -> httpx.Response:
+    """
+    GET through the shared client. With AQI_HEDGE_DELAY_SECONDS set, an
+    identical second request goes out if the first has not answered by
+    then, and whichever succeeds first wins — cuts the tail when a single
+    connection stalls. The loser is cancelled.
+    """
+    if AQI_HEDGE_DELAY <= 0:
+        return await _http().get(url)
+
+    requests = [asyncio.create_task(_http().get(url))]
+    try:
+        done, _ = await asyncio.wait(requests, timeout=AQI_HEDGE_DELAY)
+        if not done:
+            requests.append(asyncio.create_task(_http().get(url)))
+        pending = set(requests)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for request in done:
+                if request.exception() is None:
+                    return request.result()
+        return requests[0].result()   # every attempt failed: raise the first error
+    finally:
+        for request in requests:
+            request.cancel()
+
+
+# ---------------------------------------------------------------------------
+# Circuit breakers
+# ---------------------------------------------------------------------------
+# One per upstream. While a breaker is open, calls to that upstream return
+# None immediately instead of each waiting out AQI_TIMEOUT, so the fallback
+# chain drops through to cached data at once.
+
+def _breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_rate=BREAKER_FAILURE_RATE,
+        window=BREAKER_WINDOW,
+        min_calls=BREAKER_MIN_CALLS,
+        open_seconds=BREAKER_OPEN_SECONDS,
+    )
+
+
+_open_meteo_breaker = _breaker("open-meteo")
+_ip_geo_breaker = _breaker("ip-api")
+
+
+def upstream_health() -> dict:
+    """Breaker state per upstream, for /health."""
+    return {
+        breaker.name: breaker.snapshot()
+        for breaker in (_open_meteo_breaker, _ip_geo_breaker)
+    }
 
-UNROUTABLE_PREFIXES = ("127.", "192.168.", "10.", "172.", "::1")
 
 # ---------------------------------------------------------------------------
 # AQI validation
@@ -39,72 +211,180 @@ def is_device_aqi_valid(aqi: int) -> bool:
 # Step 1: IP geolocation
 # ---------------------------------------------------------------------------
 
+# Devices report from the same IP for weeks, so successful lookups are kept
+# for a day and failures for a few minutes (negative caching) before ip-api
+# is asked again.
+
+_ip_geo_cache = TTLCache(maxsize=IP_GEO_CACHE_MAX_ENTRIES, ttl=IP_GEO_CACHE_TTL)
+_ip_geo_flight = SingleFlight()
+_NOT_CACHED = object()
+
+
+def is_unroutable_ip(ip: str) -> bool:
+    """True for anything ip-api cannot geolocate, including malformed addresses."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return True
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return any(address in network for network in UNROUTABLE_NETWORKS)
+
+
 async def get_location_from_ip(request: Request) -> dict | None:
     """
     Extracts the client IP from the request and attempts to geolocate it.
     Returns lat/lon dict or None if the IP is local or lookup fails.
     """
     forwarded_for = request.headers.get("x-forwarded-for")
-    ip = forwarded_for.split(",")[0].strip() if forwarded_for else request.client.host
+    if forwarded_for:
+        ip = forwarded_for.split(",")[0].strip()
+    else:
+        ip = request.client.host if request.client else ""
 
-    if any(ip.startswith(prefix) for prefix in UNROUTABLE_PREFIXES):
-        print(f"[aqi_service] Local IP detected ({ip}), skipping IP geolocation.")
+    if is_unroutable_ip(ip):
+        log.debug("ip_geolocation_skipped", extra={"ip": ip, "reason": "unroutable"})
         return None
 
+    location = _ip_geo_cache.get(ip, _NOT_CACHED)
+    CACHE_LOOKUPS.inc(cache="ip_geo", result="miss" if location is _NOT_CACHED else "hit")
+    if location is _NOT_CACHED:
+        location = await _ip_geo_flight.do(ip, lambda: _lookup_ip(ip))
+    return dict(location) if location else None
+
+
+async def _lookup_ip(ip: str) -> dict | None:
+    if not _ip_geo_breaker.allow():
+        return None   # not cached: the address itself is fine
     try:
-        async with httpx.AsyncClient(timeout=AQI_TIMEOUT) as client:
-            response = await client.get(IP_GEO_URL.format(ip=ip))
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("status") != "success":
-                print(f"[aqi_service] IP geolocation failed for {ip}: {data}")
-                return None
-
-            return {
-                "latitude":  data["lat"],
-                "longitude": data["lon"],
-                "city":      data.get("city", "Unknown"),
-                "source":    "ip",
-            }
+        response = await _get(IP_GEO_URL.format(ip=ip))
+        response.raise_for_status()
+        data = response.json()
+        _ip_geo_breaker.record_success()
+
+        if data.get("status") != "success":
+            log.warning("ip_geolocation_failed", extra={"ip": ip, "response": data})
+            _ip_geo_cache.set(ip, None, ttl=IP_GEO_NEGATIVE_TTL)
+            return None
+
+        location = {
+            "latitude":  data["lat"],
+            "longitude": data["lon"],
+            "city":      data.get("city", "Unknown"),
+            "source":    "ip",
+        }
+        _ip_geo_cache.set(ip, location)
+        return location
 
     except Exception as e:
-        print(f"[aqi_service] IP geolocation error: {e}")
+        log.warning("ip_geolocation_error", extra={"ip": ip, "error": str(e)})
+        UPSTREAM_ERRORS.inc(upstream="ip-api", kind=_error_kind(e))
+        _ip_geo_breaker.record_failure()
+        _ip_geo_cache.set(ip, None, ttl=IP_GEO_NEGATIVE_TTL)
         return None
 
 
 # ---------------------------------------------------------------------------
 # Step 2: Fetch AQI from Open-Meteo
 # ---------------------------------------------------------------------------
+# Open-Meteo's current values only change hourly, so every lookup inside the
+# same grid cell shares one upstream call. Tier 1 is an in-process LRU; tier 2
+# is the aqi_cache table, which keeps the cache warm across restarts.
+# Concurrent misses for a cell are coalesced into a single request.
+
+_aqi_cache = TTLCache(maxsize=AQI_CACHE_MAX_ENTRIES, ttl=AQI_CACHE_TTL)
+_aqi_flight = SingleFlight()
+
+
+def coordinate_cell(lat: float, lon: float) -> tuple[str, float, float]:
+    """
+    Snaps coordinates to the AQI_CACHE_GRID_DEGREES grid.
+    Returns (cell key, cell latitude, cell longitude).
+    """
+    if AQI_CACHE_GRID > 0:
+        lat = round(round(lat / AQI_CACHE_GRID) * AQI_CACHE_GRID, 4)
+        lon = round(round(lon / AQI_CACHE_GRID) * AQI_CACHE_GRID, 4)
+    return f"{lat:.4f},{lon:.4f}", lat, lon
+
 
 async def fetch_aqi(lat: float, lon: float) -> dict | None:
+    """
+    Returns current AQI for the grid cell containing (lat, lon).
+    Served from cache when fresh; otherwise calls Open-Meteo once per cell.
+    Returns a copy the caller may modify, or None if nothing is available.
+    """
+    cell, cell_lat, cell_lon = coordinate_cell(lat, lon)
+    _track_cell(cell, cell_lat, cell_lon, "aqi")
+    result = _aqi_cache.get(cell)
+    CACHE_LOOKUPS.inc(cache="aqi_memory", result="miss" if result is None else "hit")
+    if result is None:
+        result = await _aqi_flight.do(cell, lambda: _load_aqi_cell(cell, cell_lat, cell_lon))
+    return dict(result) if result else None
+
+
+async def _load_aqi_cell(cell: str, lat: float, lon: float) -> dict | None:
+    if is_db_open():
+        try:
+            hit = await get_cached_aqi(cell, AQI_CACHE_TTL)
+        except Exception as e:
+            log.warning("aqi_cache_lookup_failed", extra={"cell": cell, "error": str(e)})
+            hit = None
+        CACHE_LOOKUPS.inc(cache="aqi_db", result="hit" if hit else "miss")
+        if hit:
+            result, age = hit
+            _aqi_cache.set(cell, result, ttl=AQI_CACHE_TTL - age)
+            return result
+
+    return await _refresh_aqi_cell(cell, lat, lon)
+
+
+async def _refresh_aqi_cell(cell: str, lat: float, lon: float) -> dict | None:
+    """Fetches a cell from Open-Meteo and writes it through both cache tiers."""
+    result = await _fetch_aqi_upstream(lat, lon)
+    if result:
+        _aqi_cache.set(cell, result)
+        if is_db_open():
+            try:
+                await save_aqi_cache(result, cell=cell)
+            except Exception as e:
+                log.error("aqi_cache_persist_failed", extra={"cell": cell, "error": str(e)})
+    return result
+
+
+async def _fetch_aqi_upstream(lat: float, lon: float) -> dict | None:
     """
     Calls Open-Meteo with coordinates.
     Returns clean AQI dict or None if the call fails.
     """
+    if not _open_meteo_breaker.allow():
+        return None
     url = OPEN_METEO_URL.format(lat=lat, lon=lon)
     try:
-        async with httpx.AsyncClient(timeout=AQI_TIMEOUT) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            current = data.get("current", {})
-
-            return {
-                "aqi":        current.get("us_aqi"),
-                "pm2_5":      current.get("pm2_5"),
-                "pm10":       current.get("pm10"),
-                "latitude":   data.get("latitude"),
-                "longitude":  data.get("longitude"),
-                "fetched_at": datetime.now(timezone.utc).isoformat(),
-                "source":     "open-meteo",
-            }
+        response = await _get(url)
+        response.raise_for_status()
+        data = response.json()
+        current = data.get("current", {})
+        _open_meteo_breaker.record_success()
+
+        return {
+            "aqi":        current.get("us_aqi"),
+            "pm2_5":      current.get("pm2_5"),
+            "pm10":       current.get("pm10"),
+            "latitude":   data.get("latitude"),
+            "longitude":  data.get("longitude"),
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "source":     "open-meteo",
+        }
 
     except httpx.TimeoutException:
-        print(f"[aqi_service] Open-Meteo timed out for ({lat}, {lon}).")
+        log.warning("open_meteo_timeout", extra={"lat": lat, "lon": lon})
+        UPSTREAM_ERRORS.inc(upstream="open-meteo", kind="timeout")
+        _open_meteo_breaker.record_failure()
         return None
     except Exception as e:
-        print(f"[aqi_service] Open-Meteo error: {e}")
+        log.warning("open_meteo_error", extra={"lat": lat, "lon": lon, "error": str(e)})
+        UPSTREAM_ERRORS.inc(upstream="open-meteo", kind="error")
+        _open_meteo_breaker.record_failure()
         return None
 
 
@@ -125,55 +405,156 @@ async def get_aqi_with_fallback(
         3. Default .env coordinates (Lagos)           → open-meteo
         4. Last known good value from database        → last_known
         5. Nothing available                          → unavailable
+    Steps 1–3 share one AQI_LATENCY_BUDGET_SECONDS budget; once it is spent
+    the chain goes straight to last_known. result["resolution"] says which
+    step answered and why the earlier ones did not.
+    In AQI_RESOLUTION_MODE=concurrent (default) steps 2 and 3 start together,
+    since the default-coordinate fetch does not need the IP lookup; the
+    IP result still wins whenever it arrives within the budget.
     """
+    started = time.monotonic()
+    deadline = started + AQI_LATENCY_BUDGET
+    attempts = []
+
+    def resolved(result: dict, step: str) -> dict:
+        AQI_RESOLUTIONS.inc(source=result["source"], coordinate_source=result["coordinate_source"])
+        result["resolution"] = {
+            "step":       step,
+            "attempts":   attempts,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        return result
+
     caller_provided_coordinates = lat is not None and lon is not None
 
     # 1. Frontend sent GPS coordinates
     if caller_provided_coordinates:
-        result = await fetch_aqi(lat, lon)
+        result = await _attempt("gps", fetch_aqi(lat, lon), deadline, attempts, _open_meteo_breaker)
         if result:
             result["coordinate_source"] = "gps"
-            return result
-        print("[aqi_service] Provided coordinates failed. Skipping to last known.")
+            return resolved(result, "gps")
+        log.info("aqi_gps_failed", extra={"lat": lat, "lon": lon})
         if last_known:
             last_known["source"] = "last_known"
             last_known["coordinate_source"] = "cached"
-            return last_known
-        return {
-            "aqi":               None,
-            "pm2_5":             None,
-            "pm10":              None,
-            "source":            "unavailable",
-            "coordinate_source": "none",
-            "fetched_at":        datetime.now(timezone.utc).isoformat(),
-        }
+            return resolved(last_known, "last_known")
+        return resolved(_unavailable(), "unavailable")
 
-    # 2. Try IP geolocation
+    # 2. IP geolocation, then 3. default Lagos coordinates
+    steps = []
     if request is not None:
-        location = await get_location_from_ip(request)
-        if location:
-            result = await fetch_aqi(location["latitude"], location["longitude"])
-            if result:
-                result["coordinate_source"] = "ip"
-                result["city"] = location.get("city")
-                return result
-
-    # 3. Default Lagos coordinates
-    print("[aqi_service] Falling back to default Lagos coordinates.")
-    result = await fetch_aqi(DEFAULT_LAT, DEFAULT_LON)
+        steps.append(("ip", _ip_step(request, deadline, attempts)))
+    steps.append(("default", _default_step(deadline, attempts)))
+    step, result = await _first_success(steps, concurrent=AQI_RESOLUTION_MODE == "concurrent")
     if result:
-        result["coordinate_source"] = "default"
-        return result
+        if step == "default":
+            log.info("aqi_default_coordinates_used")
+        return resolved(result, step)
 
     # 4. Last known good from database
     if last_known:
-        print("[aqi_service] Using last known good AQI from database.")
+        log.info("aqi_last_known_used")
         last_known["source"] = "last_known"
         last_known["coordinate_source"] = "cached"
-        return last_known
+        return resolved(last_known, "last_known")
 
     # 5. Nothing worked
-    print("[aqi_service] No AQI data available from any source.")
+    log.warning("aqi_unavailable", extra={"attempts": attempts})
+    return resolved(_unavailable(), "unavailable")
+
+
+async def _attempt(
+    step: str,
+    lookup: Awaitable,
+    deadline: float,
+    attempts: list,
+    breaker: CircuitBreaker,
+):
+    """
+    Runs one step of the chain within what is left of the budget. Returns
+    its result, or None after noting in attempts why it gave nothing.
+    Lookups run under SingleFlight, so a timed-out one keeps going in the
+    background and still fills the cache for the next caller.
+    """
+    # Checked up front: a lookup that fails and trips the breaker is a
+    # failed call, not one the breaker refused
+    refused = breaker.refusing()
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        lookup.close()
+        outcome = "budget_exhausted"
+    else:
+        try:
+            result = await asyncio.wait_for(lookup, remaining)
+        except asyncio.TimeoutError:
+            outcome = "budget_exhausted"
+        else:
+            if result:
+                return result
+            outcome = "breaker_open" if refused else "no_result"
+    attempts.append({"step": step, "outcome": outcome})
+    AQI_CHAIN_SKIPS.inc(step=step, outcome=outcome)
+    return None
+
+
+def _error_kind(error: Exception) -> str:
+    return "timeout" if isinstance(error, httpx.TimeoutException) else "error"
+
+
+async def _ip_step(request: Request, deadline: float, attempts: list) -> dict | None:
+    location = await _attempt("ip", get_location_from_ip(request), deadline, attempts, _ip_geo_breaker)
+    if not location:
+        return None
+    result = await _attempt(
+        "ip", fetch_aqi(location["latitude"], location["longitude"]),
+        deadline, attempts, _open_meteo_breaker,
+    )
+    if result:
+        result["coordinate_source"] = "ip"
+        result["city"] = location.get("city")
+    return result
+
+
+async def _default_step(deadline: float, attempts: list) -> dict | None:
+    result = await _attempt("default", fetch_aqi(DEFAULT_LAT, DEFAULT_LON), deadline, attempts, _open_meteo_breaker)
+    if result:
+        result["coordinate_source"] = "default"
+    return result
+
+
+async def _first_success(
+    steps: list[tuple[str, Awaitable]],
+    concurrent: bool,
+) -> tuple[str | None, dict | None]:
+    """
+    Returns (name, result) of the first step, in priority order, that gave
+    a result. Sequentially each step only starts once the one before it
+    came up empty. Concurrently they all start at once and lower-priority
+    steps are cancelled as soon as a higher one answers — the upstream
+    fetches behind them are shared and still land in the cache.
+    """
+    if not concurrent:
+        for i, (name, step) in enumerate(steps):
+            result = await step
+            if result:
+                for _, skipped in steps[i + 1:]:
+                    skipped.close()
+                return name, result
+        return None, None
+
+    tasks = [(name, asyncio.create_task(step)) for name, step in steps]
+    try:
+        for name, task in tasks:
+            result = await task
+            if result:
+                return name, result
+        return None, None
+    finally:
+        for _, task in tasks:
+            task.cancel()
+
+
+def _unavailable() -> dict:
     return {
         "aqi":               None,
         "pm2_5":             None,
@@ -199,6 +580,7 @@ async def resolve_aqi_from_device(
     If invalid, runs the full fallback chain and flags the bad reading.
     """
     if is_device_aqi_valid(device_aqi):
+        AQI_RESOLUTIONS.inc(source="device", coordinate_source="none")
         return {
             "aqi":               device_aqi,
             "pm2_5":             None,   # device doesn't break this down
@@ -210,51 +592,232 @@ async def resolve_aqi_from_device(
         }
 
     # Device AQI is suspicious — log it and run fallback
-    print(f"[aqi_service] Device AQI {device_aqi} flagged as invalid. Running fallback.")
+    log.info("device_aqi_flagged", extra={"device_aqi": device_aqi})
+    FLAGGED_DEVICE_READINGS.inc()
     result = await get_aqi_with_fallback(request=request, last_known=last_known)
     result["flagged_device_aqi"] = True
     result["raw_device_aqi"] = device_aqi
     return result
 
 # ---------------------------------------------------------------------------
-# Forecast — 6 hour air quality prediction (AI prevention feature)
+# Forecast — hourly air quality prediction (AI prevention feature)
 # ---------------------------------------------------------------------------
+# Open-Meteo returns every hour of the requested days and only updates its
+# model output a few times a day, so the full forecast is cached per grid
+# cell for FORECAST_CACHE_TTL and callers slice the horizon they need.
+# Concurrent misses for a cell share one upstream call.
 
 FORECAST_URL = (
-    "https://air-quality-api.open-meteo.com/v1/air-quality"
+    OPEN_METEO_BASE_URL + "/v1/air-quality"
     "?latitude={lat}&longitude={lon}"
     "&hourly=pm2_5,pm10,us_aqi"
-    "&forecast_days=1"
+    "&forecast_days={days}"
 )
 
-async def fetch_aqi_forecast(lat: float, lon: float) -> list | None:
+_forecast_cache = TTLCache(maxsize=AQI_CACHE_MAX_ENTRIES, ttl=FORECAST_CACHE_TTL)
+_forecast_flight = SingleFlight()
+
+
+async def fetch_aqi_forecast(lat: float, lon: float) -> dict | None:
     """
-    Fetches hourly AQI forecast for the next 6 hours.
+    Returns the cached hourly forecast for the grid cell containing (lat, lon):
+        {"cell", "latitude", "longitude", "fetched_at", "hours": [...]}
+    hours covers FORECAST_DAYS days from 00:00 UTC today. The dict is shared
+    between callers — slice it with forecast_window(), don't modify it.
+    Returns None if there is no cached forecast and the call fails.
+    """
+    cell, cell_lat, cell_lon = coordinate_cell(lat, lon)
+    _track_cell(cell, cell_lat, cell_lon, "forecast")
+    forecast = _forecast_cache.get(cell)
+    CACHE_LOOKUPS.inc(cache="forecast", result="miss" if forecast is None else "hit")
+    if forecast is None:
+        forecast = await _forecast_flight.do(
+            cell, lambda: _load_forecast_cell(cell, cell_lat, cell_lon)
+        )
+    return forecast
+
+
+async def _load_forecast_cell(cell: str, lat: float, lon: float) -> dict | None:
+    hours = await _fetch_forecast_upstream(lat, lon)
+    if not hours:
+        return None
+    forecast = {
+        "cell":       cell,
+        "latitude":   lat,
+        "longitude":  lon,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "hours":      hours,
+    }
+    _forecast_cache.set(cell, forecast)
+    return forecast
+
+
+def forecast_window(forecast: dict, hours: int, now: datetime | None = None) -> list:
+    """The `hours` forecast hours starting at the current UTC hour."""
+    now = now or datetime.now(timezone.utc)
+    current_hour = now.strftime("%Y-%m-%dT%H:00")
+    start = bisect_left(forecast["hours"], current_hour, key=lambda hour: hour["time"])
+    return forecast["hours"][start:start + hours]
+
+
+async def _fetch_forecast_upstream(lat: float, lon: float) -> list | None:
+    """
+    Fetches the hourly AQI forecast for FORECAST_DAYS days.
     Returns list of hourly readings or None if call fails.
     """
-    url = FORECAST_URL.format(lat=lat, lon=lon)
+    if not _open_meteo_breaker.allow():
+        return None
+    url = FORECAST_URL.format(lat=lat, lon=lon, days=FORECAST_DAYS)
     try:
-        async with httpx.AsyncClient(timeout=AQI_TIMEOUT) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-
-            hourly = data.get("hourly", {})
-            times  = hourly.get("time", [])
-            aqis   = hourly.get("us_aqi", [])
-            pm25s  = hourly.get("pm2_5", [])
-            pm10s  = hourly.get("pm10", [])
-
-            forecast = []
-            for i in range(min(6, len(times))):
-                forecast.append({
-                    "time":  times[i],
-                    "aqi":   aqis[i]  if i < len(aqis)  else None,
-                    "pm2_5": pm25s[i] if i < len(pm25s) else None,
-                    "pm10":  pm10s[i] if i < len(pm10s) else None,
-                })
-            return forecast
+        response = await _get(url)
+        response.raise_for_status()
+        data = response.json()
+        _open_meteo_breaker.record_success()
+
+        hourly = data.get("hourly", {})
+        times  = hourly.get("time", [])
+        aqis   = hourly.get("us_aqi", [])
+        pm25s  = hourly.get("pm2_5", [])
+        pm10s  = hourly.get("pm10", [])
+
+        forecast = []
+        for i in range(len(times)):
+            forecast.append({
+                "time":  times[i],
+                "aqi":   aqis[i]  if i < len(aqis)  else None,
+                "pm2_5": pm25s[i] if i < len(pm25s) else None,
+                "pm10":  pm10s[i] if i < len(pm10s) else None,
+            })
+        return forecast
 
     except Exception as e:
-        print(f"[aqi_service] Forecast error: {e}")
-        return None
\ No newline at end of file
+        log.warning("forecast_error", extra={"lat": lat, "lon": lon, "error": str(e)})
+        UPSTREAM_ERRORS.inc(upstream="open-meteo", kind=_error_kind(e))
+        _open_meteo_breaker.record_failure()
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Background refresher
+# ---------------------------------------------------------------------------
+# Every cell a request has asked about in the last AQI_REFRESH_IDLE seconds
+# (plus the default cell, always) is re-fetched before its cache entry runs
+# out, so request paths answer from memory and only a never-seen location
+# waits on Open-Meteo. Forecasts are refreshed only for cells that asked
+# for one. At most AQI_REFRESH_MAX_CELLS are tracked; past that the cell
+# seen least recently is dropped. Started and stopped by the FastAPI lifespan.
+
+_tracked_cells: OrderedDict[str, dict] = OrderedDict()   # least recently seen first
+_refresher_task: asyncio.Task | None = None
+
+
+def _track_cell(cell: str, lat: float, lon: float, kind: str):
+    """Notes that a request wanted `kind` ("aqi" or "forecast") for this cell."""
+    tracked = _tracked_cells.get(cell)
+    if tracked is None:
+        tracked = _tracked_cells[cell] = {"latitude": lat, "longitude": lon, "aqi": None, "forecast": None}
+    tracked[kind] = time.monotonic()
+    _tracked_cells.move_to_end(cell)
+
+    if len(_tracked_cells) > AQI_REFRESH_MAX_CELLS:
+        default_cell, _, _ = coordinate_cell(DEFAULT_LAT, DEFAULT_LON)
+        for stale in list(_tracked_cells):
+            if len(_tracked_cells) <= AQI_REFRESH_MAX_CELLS:
+                break
+            if stale != default_cell and stale != cell:
+                del _tracked_cells[stale]
+
+
+def _parse_cell(cell: str) -> tuple[float, float]:
+    lat, lon = cell.split(",")
+    return float(lat), float(lon)
+
+
+def _age_seconds(fetched_at: str) -> float:
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(fetched_at)).total_seconds()
+
+
+async def start_aqi_refresher():
+    global _refresher_task
+    if _refresher_task is not None or AQI_REFRESH_INTERVAL <= 0:
+        return
+
+    default_cell, default_lat, default_lon = coordinate_cell(DEFAULT_LAT, DEFAULT_LON)
+    _track_cell(default_cell, default_lat, default_lon, "aqi")
+    _track_cell(default_cell, default_lat, default_lon, "forecast")
+
+    # Pick up where the last process left off
+    if is_db_open():
+        try:
+            for cell in await get_recent_aqi_cells(AQI_REFRESH_IDLE):
+                if cell not in _tracked_cells:
+                    _track_cell(cell, *_parse_cell(cell), "aqi")
+        except Exception as e:
+            log.warning("aqi_recent_cells_failed", extra={"error": str(e)})
+
+    _refresher_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_aqi_refresher():
+    global _refresher_task
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except asyncio.CancelledError:
+            pass
+        _refresher_task = None
+
+
+async def _refresh_loop():
+    while True:
+        try:
+            counts = await refresh_tracked_cells()
+            if counts["failed"]:
+                log.warning("aqi_refresh_pass", extra=counts)
+        except Exception:
+            log.exception("aqi_refresh_failed")
+        await asyncio.sleep(AQI_REFRESH_INTERVAL)
+
+
+async def refresh_tracked_cells() -> dict:
+    """
+    One refresher pass: drops idle cells, then re-fetches every AQI and
+    forecast entry that would expire before the next pass. Goes through the
+    same single-flight as request misses, so the two never double up.
+    Returns counts of what was refreshed.
+    """
+    now = time.monotonic()
+    default_cell, _, _ = coordinate_cell(DEFAULT_LAT, DEFAULT_LON)
+    for cell, tracked in list(_tracked_cells.items()):
+        last_seen = max(tracked["aqi"] or 0, tracked["forecast"] or 0)
+        if cell != default_cell and now - last_seen > AQI_REFRESH_IDLE:
+            del _tracked_cells[cell]
+
+    jobs = []
+    for cell, tracked in _tracked_cells.items():
+        lat, lon = tracked["latitude"], tracked["longitude"]
+        if tracked["aqi"] is not None:
+            cached = _aqi_cache.get(cell)
+            if cached is None or _age_seconds(cached["fetched_at"]) >= AQI_CACHE_TTL - AQI_REFRESH_INTERVAL:
+                jobs.append(("aqi", cell, lambda c=cell, la=lat, lo=lon: _refresh_aqi_cell(c, la, lo)))
+        if tracked["forecast"] is not None:
+            cached = _forecast_cache.get(cell)
+            if cached is None or _age_seconds(cached["fetched_at"]) >= FORECAST_CACHE_TTL - AQI_REFRESH_INTERVAL:
+                jobs.append(("forecast", cell, lambda c=cell, la=lat, lo=lon: _load_forecast_cell(c, la, lo)))
+
+    limit = asyncio.Semaphore(AQI_REFRESH_CONCURRENCY)
+    flights = {"aqi": _aqi_flight, "forecast": _forecast_flight}
+
+    async def run(kind: str, cell: str, fn) -> bool:
+        async with limit:
+            return bool(await flights[kind].do(cell, fn))
+
+    results = await asyncio.gather(*(run(*job) for job in jobs), return_exceptions=True)
+    counts = {"cells": len(_tracked_cells), "aqi": 0, "forecast": 0, "failed": 0}
+    for (kind, _, _), ok in zip(jobs, results):
+        if ok is True:
+            counts[kind] += 1
+        else:
+            counts["failed"] += 1
+    return counts
@@ -0,0 +1,304 @@
+"""
+End-to-end ingest load test. Runs entirely offline.
+
+Starts the upstream stub and the backend with uvicorn on a temp SQLite
+file, then for --duration seconds:
+    - N simulated ESP32s POST /sensor-data every --interval seconds
+      (the firmware's 5 s cadence), --invalid-share of them sending
+      AQI 0 so resolve_aqi_from_device runs the fallback chain
+    - M simulated dashboards poll /risk-level and /history
+
+Prints (or writes to --output) a JSON report: per-endpoint throughput and
+p50/p95/p99 latency, DB size growth, and mean time per /sensor-data stage
+from /metrics.
+
+    cd backend
+    python bench/load_test.py --devices 200 --dashboards 20 --duration 60
+
+--max-p99-ms / --max-error-rate make it exit non-zero, for catching
+regressions in CI.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+# ---------------------------------------------------------------------------
+# Processes
+# ---------------------------------------------------------------------------
+
+def _start_uvicorn(app: str, port: int, env: dict, app_dir: Path) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--app-dir", str(app_dir),
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--log-level", "warning",
+            "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+
+
+async def _wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def _db_bytes(db_path: Path) -> int:
+    """
+    Size of the main DB file after folding the WAL into it, so samples taken
+    while the backend runs and after it has shut down measure the same thing.
+    """
+    db = sqlite3.connect(db_path, timeout=30)
+    try:
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        db.close()
+    return db_path.stat().st_size
+
+
+# ---------------------------------------------------------------------------
+# Simulated clients
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+async def _device(client, recorder, index: int, invalid: bool, interval: float, stop_at: float):
+    device_id = f"bench-{index:04d}"
+    # Documentation range (TEST-NET-3): routable as far as the backend can tell
+    ip = f"203.0.113.{index % 254 + 1}"
+    await _sleep_until_next(random.uniform(0, interval), stop_at)   # devices don't boot in lockstep
+    while time.monotonic() < stop_at:
+        payload = {
+            "temperature": round(random.uniform(24, 38), 1),
+            "humidity":    round(random.uniform(40, 95), 1),
+            "aqi":         0 if invalid else random.randint(20, 220),
+            "device_id":   device_id,
+        }
+        await recorder.request(
+            client, "POST /sensor-data", "POST", "/sensor-data",
+            json=payload, headers={"x-forwarded-for": ip},
+        )
+        await _sleep_until_next(interval, stop_at)
+
+
+async def _dashboard(client, recorder, interval: float, stop_at: float):
+    await _sleep_until_next(random.uniform(0, interval), stop_at)
+    while time.monotonic() < stop_at:
+        await recorder.request(client, "GET /risk-level", "GET", "/risk-level")
+        await recorder.request(client, "GET /history", "GET", "/history")
+        await _sleep_until_next(interval, stop_at)
+
+
+async def _sleep_until_next(interval: float, stop_at: float):
+    await asyncio.sleep(max(0.0, min(interval, stop_at - time.monotonic())))
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _endpoint_report(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests":       len(ordered),
+        "errors":         errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2),
+        "p50_ms":         round(_percentile(ordered, 50) * 1000, 2),
+        "p95_ms":         round(_percentile(ordered, 95) * 1000, 2),
+        "p99_ms":         round(_percentile(ordered, 99) * 1000, 2),
+        "max_ms":         round((ordered[-1] if ordered else 0) * 1000, 2),
+    }
+
+
+_STAGE_LINE = re.compile(r'^ecobreathe_sensor_data_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+
+def _stage_means(metrics_text: str) -> dict:
+    totals: dict[str, dict[str, float]] = {}
+    for line in metrics_text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            totals.setdefault(stage, {})[kind] = float(value)
+    return {
+        stage: round(values["sum"] / values["count"] * 1000, 3)
+        for stage, values in sorted(totals.items())
+        if values.get("count")
+    }
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+async def run(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="ecobreathe-bench-"))
+    db_path = workdir / "bench.db"
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.port}"
+
+    stub = _start_uvicorn(
+        "stub_upstream:app", args.stub_port,
+        {"STUB_LATENCY_MS": str(args.stub_latency_ms), "STUB_ERROR_RATE": str(args.stub_error_rate)},
+        BACKEND_DIR / "bench",
+    )
+    backend = _start_uvicorn(
+        "main:app", args.port,
+        {
+            "DB_PATH":             str(db_path),
+            "ARCHIVE_DIR":         str(workdir / "archive"),
+            "OPEN_METEO_BASE_URL": stub_url,
+            "IP_GEO_BASE_URL":     stub_url,
+            "LOG_LEVEL":           "WARNING",
+        },
+        BACKEND_DIR,
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.devices + 2 * args.dashboards + 10)
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=30) as client:
+            await _wait_until_up(client, f"{stub_url}/json/203.0.113.1")
+            await _wait_until_up(client, "/health")
+
+            db_start = _db_bytes(db_path)
+            recorder = Recorder()
+            started = time.monotonic()
+            stop_at = started + args.duration
+            invalid_devices = round(args.devices * args.invalid_share)
+
+            await asyncio.gather(
+                *(
+                    _device(client, recorder, i, i < invalid_devices, args.interval, stop_at)
+                    for i in range(args.devices)
+                ),
+                *(_dashboard(client, recorder, args.dashboard_interval, stop_at) for _ in range(args.dashboards)),
+            )
+            elapsed = time.monotonic() - started
+            metrics_text = (await client.get("/metrics")).text
+    finally:
+        for process in (backend, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    db_end = _db_bytes(db_path)   # after shutdown, so the ingest queue has drained
+    readings = len(recorder.latencies.get("POST /sensor-data", [])) - recorder.errors.get("POST /sensor-data", 0)
+    return {
+        "config": {
+            "devices":              args.devices,
+            "invalid_share":        args.invalid_share,
+            "interval_s":           args.interval,
+            "dashboards":           args.dashboards,
+            "dashboard_interval_s": args.dashboard_interval,
+            "duration_s":           args.duration,
+            "stub_latency_ms":      args.stub_latency_ms,
+            "stub_error_rate":      args.stub_error_rate,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {
+            name: _endpoint_report(latencies, recorder.errors.get(name, 0), elapsed)
+            for name, latencies in sorted(recorder.latencies.items())
+        },
+        "db": {
+            "start_bytes":       db_start,
+            "end_bytes":         db_end,
+            "growth_bytes":      db_end - db_start,
+            "readings_stored":   readings,
+            "bytes_per_reading": round((db_end - db_start) / readings, 1) if readings else None,
+        },
+        "sensor_data_stage_mean_ms": _stage_means(metrics_text),
+    }
+
+
+def _regressions(report: dict, args) -> list[str]:
+    problems = []
+    for name, endpoint in report["endpoints"].items():
+        if args.max_p99_ms is not None and endpoint["p99_ms"] > args.max_p99_ms:
+            problems.append(f"{name} p99 {endpoint['p99_ms']} ms > {args.max_p99_ms} ms")
+        if endpoint["requests"] and args.max_error_rate is not None:
+            rate = endpoint["errors"] / endpoint["requests"]
+            if rate > args.max_error_rate:
+                problems.append(f"{name} error rate {rate:.3f} > {args.max_error_rate}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EcoBreathe ingest load test")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--invalid-share", type=float, default=0.1, help="share of devices sending AQI 0")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between readings per device")
+    parser.add_argument("--dashboards", type=int, default=10)
+    parser.add_argument("--dashboard-interval", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any endpoint's p99 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if any endpoint's error rate exceeds this")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    problems = _regressions(report, args)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
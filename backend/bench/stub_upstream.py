@@ -0,0 +1,70 @@
+"""
+Local stand-in for Open-Meteo and ip-api, for benchmarks.
+
+    uvicorn stub_upstream:app --app-dir bench --port 8766
+
+Point the backend at it with OPEN_METEO_BASE_URL / IP_GEO_BASE_URL.
+STUB_LATENCY_MS adds a fixed delay to every response; STUB_ERROR_RATE
+makes that share of responses a 503.
+"""
+import asyncio
+import hashlib
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, HTTPException
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", 50))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", 0))
+
+app = FastAPI(title="EcoBreathe upstream stub")
+
+
+async def _respond_like_upstream():
+    if STUB_LATENCY_MS > 0:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    if STUB_ERROR_RATE and random.random() < STUB_ERROR_RATE:
+        raise HTTPException(status_code=503, detail="stub error")
+
+
+@app.get("/v1/air-quality")
+async def air_quality(
+    latitude: float,
+    longitude: float,
+    current: str = None,
+    hourly: str = None,
+    forecast_days: int = 1,
+):
+    await _respond_like_upstream()
+    if hourly:
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        hours = 24 * forecast_days
+        return {
+            "latitude":  latitude,
+            "longitude": longitude,
+            "hourly": {
+                "time":   [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)],
+                "us_aqi": [60 + (h * 7) % 90 for h in range(hours)],
+                "pm2_5":  [15.0 + (h % 12) for h in range(hours)],
+                "pm10":   [30.0 + (h % 12) for h in range(hours)],
+            },
+        }
+    return {
+        "latitude":  latitude,
+        "longitude": longitude,
+        "current":   {"us_aqi": random.randint(40, 160), "pm2_5": 25.0, "pm10": 50.0},
+    }
+
+
+@app.get("/json/{ip}")
+async def ip_geolocation(ip: str, fields: str = None):
+    await _respond_like_upstream()
+    # Stable per IP, spread over a few grid cells around Lagos
+    digest = hashlib.sha1(ip.encode()).digest()
+    return {
+        "status": "success",
+        "lat":    6.45 + digest[0] % 4 * 0.1,
+        "lon":    3.35 + digest[1] % 4 * 0.1,
+        "city":   "Lagos",
+    }
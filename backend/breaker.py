@@ -0,0 +1,105 @@
+import time
+from collections import deque
+
+from log import get_logger
+
+log = get_logger("breaker")
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker driven by the error rate of recent calls.
+
+        closed    → calls go through; outcomes are recorded in a rolling window
+        open      → calls are refused until open_seconds have passed
+        half_open → one probe call at a time; success closes, failure re-opens
+
+    The breaker trips once at least min_calls are in the window and the
+    share of failures reaches failure_rate. Only touched from the event
+    loop, so no locking.
+    """
+
+    CLOSED    = "closed"
+    OPEN      = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_started: float | None = None
+
+    def allow(self) -> bool:
+        """True if a call may go upstream now. Call record_* with its outcome."""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_started = None
+        if self.state == self.HALF_OPEN:
+            # A probe that never reported back is given up on after open_seconds
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                return False
+            self._probe_started = now
+        return True
+
+    def refusing(self) -> bool:
+        """True if allow() would refuse a call right now. Changes nothing."""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            return now - self._opened_at < self.open_seconds
+        if self.state == self.HALF_OPEN:
+            return self._probe_started is not None and now - self._probe_started < self.open_seconds
+        return False
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            log.info("breaker_closed", extra={"upstream": self.name})
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            self._probe_started = None
+        self._outcomes.append(True)
+
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._trip()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if (
+            self.state == self.CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and failures / len(self._outcomes) >= self.failure_rate
+        ):
+            self._trip()
+
+    def _trip(self):
+        log.warning("breaker_opened", extra={"upstream": self.name, "open_seconds": self.open_seconds})
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        failures = self._outcomes.count(False)
+        return {
+            "state":        self.state,
+            "recent_calls": len(self._outcomes),
+            "error_rate":   round(failures / len(self._outcomes), 2) if self._outcomes else 0.0,
+        }
@@ -0,0 +1,77 @@
+import json
+import os
+from typing import Any
+
+from log import get_logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+log = get_logger("codec")
+
+# ---------------------------------------------------------------------------
+# Serialization
+# ---------------------------------------------------------------------------
+# One place for every encode/decode on the hot paths: stored blobs
+# (sensor_data, risk_data, symptom entries, cached AQI) and pre-encoded
+# API responses. orjson is used when installed, the stdlib otherwise.
+# Both orjson and msgpack come with the optional "fast" extra:
+#     uv sync --extra fast        (or: pip install ".[fast]")
+#
+# BLOB_CODEC picks how new blobs are stored:
+#     json    — JSON text (default); readable with SQLite's json_* functions
+#     msgpack — MessagePack, stored as a BLOB; needs the msgpack package
+# Reads look at the stored type — TEXT is JSON, BLOB is MessagePack — so a
+# database can hold both and switching BLOB_CODEC needs no migration.
+
+BLOB_CODEC = os.getenv("BLOB_CODEC", "json")
+
+if BLOB_CODEC == "msgpack" and msgpack is None:
+    log.warning("msgpack_unavailable", extra={"fallback": "json"})
+    BLOB_CODEC = "json"
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_blob(value: Any) -> str | bytes:
+    """Value for a blob column, in the BLOB_CODEC format."""
+    if BLOB_CODEC == "msgpack":
+        return msgpack.packb(value)
+    return dumps(value).decode()
+
+
+def decode_blob(stored: str | bytes) -> Any:
+    """Reads a blob column whichever format it was written in."""
+    if isinstance(stored, bytes):
+        if msgpack is None:
+            raise RuntimeError(
+                "Row is stored as MessagePack but the msgpack package is not installed; "
+                "install the 'fast' extra to read it."
+            )
+        return msgpack.unpackb(stored)
+    return loads(stored)
+
+
+def blob_as_json(stored: str | bytes) -> str:
+    """A blob column as JSON text, for archives and logs that must stay readable."""
+    if isinstance(stored, bytes):
+        return dumps(decode_blob(stored)).decode()
+    return stored
@@ -1,37 +1,354 @@
 import aiosqlite
+import asyncio
+import gzip
 import json
 import os
-from datetime import datetime, timezone
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from codec import blob_as_json, decode_blob, dumps, encode_blob, loads
+from log import get_logger
+
+log = get_logger("database")
 
 DB_PATH = os.getenv("DB_PATH", "ecobreathe.db")
+DB_READ_POOL_SIZE  = int(os.getenv("DB_READ_POOL_SIZE", 4))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+DB_CACHE_SIZE_KB   = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE       = int(os.getenv("DB_MMAP_SIZE_BYTES", 128 * 1024 * 1024))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", 256))
+DB_MIGRATION_CHUNK = int(os.getenv("DB_MIGRATION_CHUNK_SIZE", 2000))
+
+RETENTION_DAYS       = int(os.getenv("RETENTION_DAYS", 0))    # 0 keeps raw readings forever
+ARCHIVE_DIR          = os.getenv("ARCHIVE_DIR", "archive")
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", 3600))
+VACUUM_STEP_PAGES    = int(os.getenv("VACUUM_STEP_PAGES", 1000))
+
+INGEST_ACK_MODE      = os.getenv("INGEST_ACK_MODE", "commit")   # or "enqueue": reply before the commit
+INGEST_QUEUE_MAX     = int(os.getenv("INGEST_QUEUE_MAX", 10000))  # queued requests; full → callers wait
+INGEST_LOG_PATH      = os.getenv("INGEST_LOG_PATH", "")            # empty disables the append-only log
+INGEST_LOG_FSYNC     = os.getenv("INGEST_LOG_FSYNC", "false").lower() in ("1", "true", "yes")
+INGEST_LOG_MAX_BYTES = int(os.getenv("INGEST_LOG_MAX_BYTES", 16 * 1024 * 1024))
+
+
+# ---------------------------------------------------------------------------
+# Connection manager
+# ---------------------------------------------------------------------------
+# Opened once from the FastAPI lifespan: one writer connection serialised by
+# a lock, plus a small pool of read-only connections. WAL mode lets the
+# readers run while the writer commits, so dashboard polls and ESP32 ingest
+# stop blocking each other.
+#
+# Scripts that never call open_db() still work — each call then falls back
+# to a short-lived connection, exactly like before.
+
+_writer: aiosqlite.Connection | None = None
+_write_lock = asyncio.Lock()
+_readers: asyncio.Queue | None = None
+_ingest_queue: asyncio.Queue | None = None
+_ingest_task: asyncio.Task | None = None
+_migration_task: asyncio.Task | None = None
+_maintenance_task: asyncio.Task | None = None
+_next_reading_id: int | None = None
+
+
+async def _connect(readonly: bool = False) -> aiosqlite.Connection:
+    if readonly:
+        uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+        db = await aiosqlite.connect(uri, uri=True)
+    else:
+        db = await aiosqlite.connect(DB_PATH)
+    db.row_factory = aiosqlite.Row
+
+    await db.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    await db.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    await db.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    await db.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        await db.execute("PRAGMA query_only = ON")
+    else:
+        # Only takes effect on a brand-new file; see run_maintenance()
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await db.execute("PRAGMA journal_mode = WAL")
+        # NORMAL is durable across application crashes in WAL mode; only an
+        # OS crash / power loss can roll back the last few commits.
+        await db.execute("PRAGMA synchronous = NORMAL")
+    return db
+
+
+async def open_db():
+    """Opens the shared writer and reader pool. Called once from lifespan."""
+    global _writer, _readers, _ingest_queue, _ingest_task, _migration_task, _maintenance_task
+    if _writer is not None:
+        return
+
+    _writer = await _connect()
+    await init_db()
+    await _open_ingest_log()
+    await _load_next_reading_id()
+
+    await _warm_hot_state()
+
+    _ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_MAX)
+    _ingest_task = asyncio.create_task(_ingest_writer())
+    _migration_task = asyncio.create_task(_migrate())
+    _maintenance_task = asyncio.create_task(_maintenance_loop())
+
+    if DB_READ_POOL_SIZE > 0 and DB_PATH != ":memory:":
+        _readers = asyncio.Queue()
+        for _ in range(DB_READ_POOL_SIZE):
+            _readers.put_nowait(await _connect(readonly=True))
+
+
+async def close_db():
+    """Flushes pending ingest and closes every pooled connection."""
+    global _writer, _readers, _ingest_queue, _ingest_task, _migration_task, _maintenance_task, _hot_loaded
+    _hot_loaded = False
+    for task in (_maintenance_task, _migration_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _maintenance_task = _migration_task = None
+    if _ingest_task is not None:
+        await _ingest_queue.join()
+        _ingest_task.cancel()
+        try:
+            await _ingest_task
+        except asyncio.CancelledError:
+            pass
+        _ingest_queue = _ingest_task = None
+    _close_ingest_log()
+    if _readers is not None:
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        _readers = None
+    if _writer is not None:
+        async with _write_lock:
+            await _writer.execute("PRAGMA optimize")
+            await _writer.close()
+        _writer = None
+
+
+@asynccontextmanager
+async def _writing():
+    """Yields the writer connection; rolls back if the block raises."""
+    if _writer is None:
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            yield db
+        return
+
+    async with _write_lock:
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+
+@asynccontextmanager
+async def _reading():
+    """Borrows a read-only connection from the pool for the block."""
+    if _readers is None:
+        if _writer is not None:
+            # Pool disabled (or in-memory DB) — share the writer.
+            async with _write_lock:
+                yield _writer
+            return
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            yield db
+        return
+
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+
+def is_db_open() -> bool:
+    return _writer is not None
+
+
+# ---------------------------------------------------------------------------
+# Hot state
+# ---------------------------------------------------------------------------
+# The latest reading, symptom entry and AQI cache row, kept in memory.
+# open_db() loads them once and every save below updates them after its
+# commit (write-through), so per-reading lookups and dashboard polls never
+# touch SQLite. A cold process without open_db() reads from the DB instead.
+# The per-device and per-user entries are filled the same way, plus lazily
+# on first lookup; each remembers its row id so a slow load never replaces
+# a newer write.
+
+_hot: dict = {
+    "latest_reading":   None,
+    "latest_symptoms":  None,
+    "last_known_aqi":   None,
+    "latest_by_device": {},   # device_id -> /latest-data view
+    "symptoms_by_user": {},   # user_id -> (symptom_logs id, entry or None)
+    "device_users":     {},   # device_id -> user_id, registered devices only
+}
+_hot_loaded = False
+_encoded_latest: dict = {}   # device_id (None = fleet) -> (reading id, JSON bytes)
+_reading_listeners: list[Callable[[dict], None]] = []
+
+
+async def _warm_hot_state():
+    global _hot_loaded
+    _hot["latest_reading"]   = await _load_latest_sensor_reading()
+    _hot["latest_symptoms"]  = await _load_latest_symptom_log()
+    _hot["last_known_aqi"]   = await _load_last_known_aqi()
+    _hot["device_users"]     = await _load_device_users()
+    _hot["latest_by_device"] = await _load_latest_per_device()
+    _hot["symptoms_by_user"] = {}
+    _hot_loaded = True
+
+
+def on_reading_saved(listener: Callable[[dict], None]):
+    """
+    Registers a callback that receives the /latest-data view of each stored
+    reading — the newest per device when a batch is saved. Runs on the event
+    loop right after the commit, so it must not block.
+    """
+    _reading_listeners.append(listener)
+
+
+def _copy(value: dict | None) -> dict | None:
+    """Callers are free to modify what they get back, so hand out copies."""
+    return dict(value) if value is not None else None
 
 
 # ---------------------------------------------------------------------------
 # Setup
 # ---------------------------------------------------------------------------
 
+async def _ensure_column(db: aiosqlite.Connection, table: str, column: str, decl: str):
+    """Adds a column to a table created by an older version of init_db()."""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    if column not in {row["name"] for row in await cursor.fetchall()}:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# Typed copies of the fields analytics filter and aggregate on. The JSON
+# blobs stay the source of truth for the full record.
+_READING_COLUMNS = (
+    ("epoch",              "INTEGER"),   # unix seconds of timestamp
+    ("device_id",          "TEXT"),
+    ("temperature",        "REAL"),
+    ("humidity",           "REAL"),
+    ("device_aqi",         "INTEGER"),   # raw ESP32 value, possibly flagged
+    ("aqi",                "INTEGER"),   # resolved value the risk was scored on
+    ("aqi_source",         "TEXT"),
+    ("health_score",       "INTEGER"),
+    ("overall_status",     "TEXT"),
+    ("heat_stress_risk",   "TEXT"),
+    ("respiratory_risk",   "TEXT"),
+    ("asthma_attack_risk", "TEXT"),
+    ("alert_flags",        "INTEGER"),   # ALERT_FLAGS bitmask of active_alerts
+)
+
+ALERT_FLAGS = {
+    "High Heat Stress":            1,
+    "Critical Air Quality":        2,
+    "Poor Air Quality":            4,
+    "Elevated Asthma Attack Risk": 8,
+}
+
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _writing() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS sensor_readings (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp   TEXT NOT NULL,
-                sensor_data TEXT NOT NULL,
-                risk_data   TEXT NOT NULL
+                id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp          TEXT NOT NULL,
+                sensor_data        TEXT NOT NULL,
+                risk_data          TEXT NOT NULL,
+                epoch              INTEGER,
+                device_id          TEXT,
+                temperature        REAL,
+                humidity           REAL,
+                device_aqi         INTEGER,
+                aqi                INTEGER,
+                aqi_source         TEXT,
+                health_score       INTEGER,
+                overall_status     TEXT,
+                heat_stress_risk   TEXT,
+                respiratory_risk   TEXT,
+                asthma_attack_risk TEXT,
+                alert_flags        INTEGER
+            )
+        """)
+        for column, decl in _READING_COLUMNS:
+            await _ensure_column(db, "sensor_readings", column, decl)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_ts "
+            "ON sensor_readings (device_id, timestamp)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_epoch "
+            "ON sensor_readings (epoch)"
+        )
+        # Per-device latest / recent history: a seek to the end of one device's range
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_id "
+            "ON sensor_readings (device_id, id)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id  TEXT PRIMARY KEY,
+                user_id    TEXT,
+                label      TEXT,
+                first_seen TEXT,
+                last_seen  TEXT
             )
         """)
+        for table in ROLLUP_TABLES.values():
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    device_id    TEXT NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    {", ".join(f"{column} {decl}" for column, decl in _ROLLUP_COLUMNS)},
+                    PRIMARY KEY (device_id, bucket_start)
+                ) WITHOUT ROWID
+            """)
+            await db.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket_start)"
+            )
         await db.execute("""
             CREATE TABLE IF NOT EXISTS symptom_logs (
                 id        INTEGER PRIMARY KEY AUTOINCREMENT,
                 logged_at TEXT NOT NULL,
-                entry     TEXT NOT NULL
+                entry     TEXT NOT NULL,
+                user_id   TEXT
             )
         """)
+        await _ensure_column(db, "symptom_logs", "user_id", "TEXT")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_symptom_logs_user ON symptom_logs (user_id, id)"
+        )
         await db.execute("""
             CREATE TABLE IF NOT EXISTS aqi_cache (
                 id         INTEGER PRIMARY KEY AUTOINCREMENT,
                 fetched_at TEXT NOT NULL,
-                aqi_data   TEXT NOT NULL
+                aqi_data   TEXT NOT NULL,
+                cell       TEXT
+            )
+        """)
+        await _ensure_column(db, "aqi_cache", "cell", "TEXT")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_aqi_cache_cell ON aqi_cache (cell, id)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
             )
         """)
         # inside init_db(), add this table:
@@ -44,6 +361,10 @@ async def init_db():
                 notes       TEXT
             )
         """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outcome_labels_reading "
+            "ON outcome_labels (reading_id, id)"
+        )
         await db.commit()
 
 
@@ -51,146 +372,1273 @@ async def init_db():
 # Sensor readings
 # ---------------------------------------------------------------------------
 
-async def save_sensor_reading(record: dict, risk: dict) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "INSERT INTO sensor_readings (timestamp, sensor_data, risk_data) VALUES (?, ?, ?)",
-            (
-                datetime.now(timezone.utc).isoformat(),
-                json.dumps(record),
-                json.dumps(risk),
-            )
+# id is NULL (SQLite assigns it) unless the ingest queue pre-assigned one
+_INSERT_READING_SQL = (
+    "INSERT INTO sensor_readings (id, timestamp, sensor_data, risk_data, "
+    + ", ".join(column for column, _ in _READING_COLUMNS)
+    + ") VALUES (" + ", ".join("?" * (4 + len(_READING_COLUMNS))) + ")"
+)
+
+
+def _reading_row(recorded_at: datetime, record: dict, risk: dict) -> tuple:
+    """Flattens a (record, risk) pair taken at recorded_at into the sensor_readings column order."""
+    readings = record.get("sensor_readings", {})
+    aqi_info = record.get("aqi_info", {})
+    return (
+        recorded_at.isoformat(),
+        encode_blob(record),
+        encode_blob(risk),
+        int(recorded_at.timestamp()),
+        readings.get("device_id"),
+        readings.get("temperature"),
+        readings.get("humidity"),
+        readings.get("aqi"),
+        aqi_info.get("aqi"),
+        aqi_info.get("source"),
+        risk.get("health_score"),
+        risk.get("overall_status"),
+        risk.get("heat_stress_risk"),
+        risk.get("respiratory_risk"),
+        risk.get("asthma_attack_risk"),
+        sum(ALERT_FLAGS.get(alert, 0) for alert in risk.get("active_alerts", [])),
+    )
+
+
+async def _insert_readings(
+    db: aiosqlite.Connection,
+    rows: list[tuple],
+    reading_ids: list[int] | None = None,
+) -> list[int]:
+    ids = []
+    for reading_id, row in zip(reading_ids or [None] * len(rows), rows):
+        cursor = await db.execute(_INSERT_READING_SQL, (reading_id, *row))
+        ids.append(cursor.lastrowid)
+    await _apply_rollups(db, rows)
+    await _touch_devices(db, rows)
+    return ids
+
+
+async def _touch_devices(db: aiosqlite.Connection, rows: list[tuple]):
+    """Registers unseen devices and moves last_seen forward, in the ingest transaction."""
+    seen = {}
+    for row in rows:
+        device_id, timestamp = row[_ROW_INDEX["device_id"]], row[_ROW_INDEX["timestamp"]]
+        if device_id is not None:
+            seen[device_id] = max(seen.get(device_id, timestamp), timestamp)
+    await db.executemany("""
+        INSERT INTO devices (device_id, first_seen, last_seen) VALUES (?, ?, ?)
+        ON CONFLICT (device_id) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)
+    """, [(device_id, timestamp, timestamp) for device_id, timestamp in seen.items()])
+
+
+async def _ingest_writer():
+    """
+    Single consumer of the ingest queue.
+    Everything queued while the previous commit was running is written in
+    one transaction, so N concurrent readings cost one fsync instead of N.
+    If that transaction fails, each request is retried in its own, so one
+    bad reading fails only the request that sent it.
+    """
+    while True:
+        batch = [await _ingest_queue.get()]
+        pending = len(batch[0][0])
+        while pending < DB_WRITE_BATCH_MAX and not _ingest_queue.empty():
+            item = _ingest_queue.get_nowait()
+            batch.append(item)
+            pending += len(item[0])
+
+        try:
+            try:
+                await _commit_ingest(batch)
+                committed = batch
+            except Exception as e:
+                if len(batch) == 1:
+                    raise
+                log.warning("group_commit_failed", extra={"requests": len(batch), "readings": pending, "error": str(e)})
+                committed = []
+                for item in batch:
+                    try:
+                        await _commit_ingest([item])
+                        committed.append(item)
+                    except Exception as e:
+                        _fail_ingest([item], e)
+
+            for _, ids, future, _ in committed:
+                if not future.done():
+                    future.set_result(ids)
+            try:
+                _log_committed([seq for _, _, _, seq in committed if seq is not None])
+            except Exception as e:
+                # The readings are committed; at worst the next start replays them as no-ops
+                log.error("ingest_log_write_failed", extra={"error": str(e)})
+        except Exception as e:
+            _fail_ingest(batch, e)
+        finally:
+            for _ in batch:
+                _ingest_queue.task_done()
+
+
+async def _commit_ingest(batch: list[tuple]):
+    async with _writing() as db:
+        await _insert_readings(
+            db,
+            [row for rows, _, _, _ in batch for row in rows],
+            [reading_id for _, ids, _, _ in batch for reading_id in ids],
         )
         await db.commit()
-        return cursor.lastrowid
 
 
-async def get_latest_sensor_reading() -> dict | None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+def _fail_ingest(batch: list[tuple], error: Exception):
+    # Enqueue-acked readings stay in the ingest log and are replayed on the next start
+    log.error("ingest_commit_failed", extra={"readings": sum(len(rows) for rows, _, _, _ in batch), "error": str(error)})
+    for _, _, future, _ in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+async def save_sensor_readings(
+    items: list[tuple[dict, dict]],
+    ack: str | None = None,
+    recorded_at: list[datetime | None] | None = None,
+) -> list[int]:
+    """
+    Stores (record, risk) pairs and returns their ids in the same order.
+    recorded_at gives each reading's time as the device reported it, for
+    readings a gateway buffered; None (or a None entry) means now.
+    Goes through the group-commit writer when the DB manager is open, which
+    assigns the ids up front. ack (default INGEST_ACK_MODE) picks when this
+    returns: "commit" once the readings are committed, "enqueue" as soon
+    as they are queued (and written to the ingest log, if enabled).
+    """
+    global _next_reading_id
+    received_at = datetime.now(timezone.utc)
+    rows = [
+        _reading_row(at or received_at, record, risk)
+        for (record, risk), at in zip(items, recorded_at or [None] * len(items))
+    ]
+
+    if _ingest_queue is None:
+        async with _writing() as db:
+            ids = await _insert_readings(db, rows)
+            await db.commit()
+    else:
+        ids = list(range(_next_reading_id, _next_reading_id + len(rows)))
+        _next_reading_id += len(rows)
+        seq = _log_enqueued(ids, rows)
+        future = asyncio.get_running_loop().create_future()
+        await _ingest_queue.put((rows, ids, future, seq))
+        if (ack or INGEST_ACK_MODE) == "commit":
+            await future
+        else:
+            future.add_done_callback(_ignore_result)   # the writer logs failures
+
+    for reading_id, row, (record, _) in zip(ids, rows, items):
+        _remember_latest_reading(reading_id, row[0], record)
+
+    if _reading_listeners:
+        newest_per_device = {}
+        for reading_id, row, (record, _) in zip(ids, rows, items):
+            device_id = record.get("sensor_readings", {}).get("device_id")
+            newest_per_device[device_id] = _reading_view(reading_id, row[0], record)
+        for view in newest_per_device.values():
+            for listener in _reading_listeners:
+                listener(view)
+    return ids
+
+
+def _ignore_result(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+async def _load_next_reading_id():
+    """Ids are handed out before the insert; never reuse one, even if it was archived."""
+    global _next_reading_id
+    async with _writing() as db:
+        cursor = await db.execute("""
+            SELECT MAX(
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sensor_readings'), 0),
+                COALESCE((SELECT MAX(id) FROM sensor_readings), 0)
+            )
+        """)
+        (last_id,) = await cursor.fetchone()
+    _next_reading_id = last_id + 1
+
+
+# ---------------------------------------------------------------------------
+# Ingest log — optional write-ahead for enqueue-acked readings
+# ---------------------------------------------------------------------------
+# With INGEST_LOG_PATH set, every queued batch is appended as one JSON line
+#     {"seq": n, "ids": [...], "rows": [...]}
+# before save_sensor_readings returns, and {"committed": [n, ...]} once the
+# writer has committed it. On startup any batch without a commit marker is
+# inserted again — rows whose id already exists are skipped, so a crash
+# between the commit and its marker does not duplicate anything. The file
+# is emptied whenever nothing is outstanding and it has grown past
+# INGEST_LOG_MAX_BYTES.
+
+_ingest_log = None
+_ingest_log_seq = 0
+_ingest_log_outstanding = 0
+
+
+async def _open_ingest_log():
+    global _ingest_log
+    if not INGEST_LOG_PATH:
+        return
+    path = Path(INGEST_LOG_PATH)
+    if path.exists():
+        replayed = await _replay_ingest_log(path)
+        if replayed:
+            log.warning("ingest_log_replayed", extra={"readings": replayed, "path": str(path)})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _ingest_log = open(path, "wb")   # everything in it is committed now
+
+
+async def _replay_ingest_log(path: Path) -> int:
+    batches, committed = {}, set()
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = loads(line)
+            except ValueError:
+                continue   # torn final write
+            if "seq" in entry:
+                batches[entry["seq"]] = entry
+            else:
+                committed.update(entry.get("committed", []))
+
+    ids, rows = [], []
+    for seq in sorted(set(batches) - committed):
+        ids.extend(batches[seq]["ids"])
+        rows.extend(tuple(row) for row in batches[seq]["rows"])
+    if not rows:
+        return 0
+
+    async with _writing() as db:
         cursor = await db.execute(
-            "SELECT * FROM sensor_readings ORDER BY id DESC LIMIT 1"
+            "SELECT id FROM sensor_readings WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),),
         )
+        existing = {row["id"] for row in await cursor.fetchall()}
+        missing = [(reading_id, row) for reading_id, row in zip(ids, rows) if reading_id not in existing]
+        if not missing:
+            return 0
+        try:
+            await _insert_readings(db, [row for _, row in missing], [reading_id for reading_id, _ in missing])
+            await db.commit()
+            return len(missing)
+        except Exception as e:
+            await db.rollback()
+            log.warning("ingest_log_replay_failed", extra={"readings": len(missing), "error": str(e)})
+
+        # One at a time, so a reading that can never be stored doesn't block startup
+        replayed = 0
+        for reading_id, row in missing:
+            try:
+                await _insert_readings(db, [row], [reading_id])
+                await db.commit()
+                replayed += 1
+            except Exception as e:
+                await db.rollback()
+                log.error("ingest_log_reading_dropped", extra={"id": reading_id, "error": str(e)})
+    return replayed
+
+
+def _log_enqueued(ids: list[int], rows: list[tuple]) -> int | None:
+    global _ingest_log_seq, _ingest_log_outstanding
+    if _ingest_log is None:
+        return None
+    _ingest_log_seq += 1
+    _write_ingest_log({"seq": _ingest_log_seq, "ids": ids, "rows": [_row_as_json(row) for row in rows]})
+    _ingest_log_outstanding += 1
+    return _ingest_log_seq
+
+
+def _log_committed(seqs: list[int]):
+    global _ingest_log_outstanding
+    if _ingest_log is None or not seqs:
+        return
+    _ingest_log_outstanding -= len(seqs)
+    if _ingest_log_outstanding == 0 and _ingest_log.tell() > INGEST_LOG_MAX_BYTES:
+        _ingest_log.truncate(0)
+        _ingest_log.seek(0)
+        return
+    _write_ingest_log({"committed": seqs})
+
+
+def _row_as_json(row: tuple) -> list:
+    """A sensor_readings row with its blobs as JSON text, so the log stays one JSON object per line."""
+    row = list(row)
+    for column in ("sensor_data", "risk_data"):
+        row[_ROW_INDEX[column]] = blob_as_json(row[_ROW_INDEX[column]])
+    return row
+
+
+def _write_ingest_log(entry: dict):
+    _ingest_log.write(dumps(entry) + b"\n")
+    _ingest_log.flush()
+    if INGEST_LOG_FSYNC:
+        os.fsync(_ingest_log.fileno())
+
+
+def _close_ingest_log():
+    global _ingest_log
+    if _ingest_log is None:
+        return
+    if _ingest_log_outstanding == 0:
+        _ingest_log.truncate(0)
+    _ingest_log.close()
+    _ingest_log = None
+
+
+def _remember_latest_reading(reading_id: int, timestamp: str, record: dict):
+    view = _reading_view(reading_id, timestamp, record)
+    current = _hot["latest_reading"]
+    if current is None or current["id"] < reading_id:
+        _hot["latest_reading"] = view
+    _remember_device_reading(view)
+
+
+def _remember_device_reading(view: dict):
+    device_id = view["sensor_readings"].get("device_id")
+    if device_id is None:
+        return
+    current = _hot["latest_by_device"].get(device_id)
+    if current is None or current["id"] < view["id"]:   # a newer reading may have committed first
+        _hot["latest_by_device"][device_id] = view
+
+
+def _reading_view(reading_id: int, timestamp: str, record: dict) -> dict:
+    return {
+        "id":                reading_id,
+        "timestamp":         timestamp,
+        "sensor_readings":   record.get("sensor_readings", {}),
+        "aqi_info":          record.get("aqi_info", {}),
+        "health_assessment": record.get("health_assessment", {}),
+    }
+
+
+async def save_sensor_reading(
+    record: dict,
+    risk: dict,
+    ack: str | None = None,
+    recorded_at: datetime | None = None,
+) -> int:
+    ids = await save_sensor_readings([(record, risk)], ack, [recorded_at])
+    return ids[0]
+
+
+async def get_latest_sensor_reading(device_id: str | None = None) -> dict | None:
+    """Newest reading across the fleet, or for one device if device_id is given."""
+    if device_id is None:
+        if _hot_loaded:
+            return _copy(_hot["latest_reading"])
+        return await _load_latest_sensor_reading()
+
+    if _hot_loaded and device_id in _hot["latest_by_device"]:
+        return _copy(_hot["latest_by_device"][device_id])
+    view = await _load_latest_sensor_reading(device_id)
+    if view is not None and _hot_loaded:
+        _remember_device_reading(view)
+    return _copy(view)
+
+
+async def get_latest_sensor_reading_json(device_id: str | None = None) -> bytes | None:
+    """
+    get_latest_sensor_reading() encoded as JSON. Dashboards poll far more
+    often than devices report, so each reading is encoded once and the
+    bytes are reused until a newer one arrives.
+    """
+    view = await get_latest_sensor_reading(device_id)
+    if view is None:
+        return None
+    cached = _encoded_latest.get(device_id)
+    if cached is None or cached[0] != view["id"]:
+        cached = _encoded_latest[device_id] = (view["id"], dumps(view))
+    return cached[1]
+
+
+async def _load_latest_sensor_reading(device_id: str | None = None) -> dict | None:
+    async with _reading() as db:
+        if device_id is None:
+            cursor = await db.execute(
+                "SELECT id, timestamp, sensor_data FROM sensor_readings ORDER BY id DESC LIMIT 1"
+            )
+        else:
+            cursor = await db.execute(
+                "SELECT id, timestamp, sensor_data FROM sensor_readings "
+                "WHERE device_id = ? ORDER BY id DESC LIMIT 1",
+                (device_id,),
+            )
         row = await cursor.fetchone()
         if not row:
             return None
+        return _reading_view(row["id"], row["timestamp"], decode_blob(row["sensor_data"]))
 
-        record = json.loads(row["sensor_data"])
 
-        return {
-            "id":                row["id"],
-            "timestamp":         row["timestamp"],
-            "sensor_readings":   record.get("sensor_readings", {}),
-            "aqi_info":          record.get("aqi_info", {}),
-            "health_assessment": record.get("health_assessment", {}),
-        }
+async def _load_latest_per_device() -> dict:
+    """One index seek per registered device rather than a GROUP BY over every reading."""
+    async with _reading() as db:
+        cursor = await db.execute("""
+            SELECT sr.id, sr.timestamp, sr.sensor_data
+            FROM devices d
+            JOIN sensor_readings sr ON sr.id = (
+                SELECT MAX(id) FROM sensor_readings WHERE device_id = d.device_id
+            )
+        """)
+        rows = await cursor.fetchall()
+    views = [_reading_view(row["id"], row["timestamp"], decode_blob(row["sensor_data"])) for row in rows]
+    return {view["sensor_readings"].get("device_id"): view for view in views}
 
 
-async def get_reading_history(limit: int = 50) -> list:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM sensor_readings ORDER BY id DESC LIMIT ?", (limit,)
-        )
+async def get_reading_history(limit: int = 50, device_id: str | None = None) -> list:
+    """Recent readings for charts, read from the typed columns only."""
+    where = "WHERE device_id = :device_id" if device_id is not None else ""
+    async with _reading() as db:
+        cursor = await db.execute(f"""
+            SELECT id, timestamp, device_id, temperature, humidity,
+                   device_aqi, aqi, aqi_source, health_score
+            FROM sensor_readings
+            {where}
+            ORDER BY id DESC
+            LIMIT :limit
+        """, {"limit": limit, "device_id": device_id})
         rows = await cursor.fetchall()
         results = [
             {
                 "id":          row["id"],
                 "timestamp":   row["timestamp"],
-                "sensor_readings": json.loads(row["sensor_data"]).get("sensor_readings", {}),
-                "aqi_info":        json.loads(row["sensor_data"]).get("aqi_info", {}),
-                "health_score":    json.loads(row["risk_data"]).get("health_score"),
+                "sensor_readings": {
+                    "temperature": row["temperature"],
+                    "humidity":    row["humidity"],
+                    "aqi":         row["device_aqi"],
+                    "device_id":   row["device_id"],
+                },
+                "aqi_info":        {"aqi": row["aqi"], "source": row["aqi_source"]},
+                "health_score":    row["health_score"],
             }
             for row in rows
         ]
         return list(reversed(results))
 
 
+HISTORY_METRICS = ("temperature", "humidity", "aqi", "health_score")
+
+
+async def get_bucketed_history(
+    start: int,
+    end: int,
+    bucket_seconds: int,
+    device_id: str | None = None,
+) -> list:
+    """
+    Aggregates readings with epoch in [start, end) into fixed UTC buckets,
+    entirely in SQL. One row per non-empty bucket with count and
+    min/avg/max of each HISTORY_METRICS column — aqi is the resolved value
+    the risk was scored on. Payload size depends on the bucket count only.
+    """
+    aggregates = ",\n".join(
+        f"MIN({m}) AS {m}_min, ROUND(AVG({m}), 2) AS {m}_avg, MAX({m}) AS {m}_max"
+        for m in HISTORY_METRICS
+    )
+    if device_id is None:
+        where = "epoch >= :start AND epoch < :end"
+    else:
+        # Same range as an ISO timestamp bound, so it runs on (device_id, timestamp)
+        where = "device_id = :device_id AND timestamp >= :start_ts AND timestamp < :end_ts"
+    async with _reading() as db:
+        cursor = await db.execute(f"""
+            SELECT (epoch / :bucket) * :bucket AS bucket_start,
+                   COUNT(*) AS count,
+                   {aggregates}
+            FROM sensor_readings
+            WHERE {where}
+            GROUP BY bucket_start
+            ORDER BY bucket_start
+        """, {
+            "bucket":    bucket_seconds,
+            "start":     start,
+            "end":       end,
+            "device_id": device_id,
+            "start_ts":  datetime.fromtimestamp(start, timezone.utc).isoformat(),
+            "end_ts":    datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        })
+        rows = await cursor.fetchall()
+
+    return [
+        {
+            "start": datetime.fromtimestamp(row["bucket_start"], timezone.utc).isoformat(),
+            "count": row["count"],
+            **{
+                m: {"min": row[f"{m}_min"], "avg": row[f"{m}_avg"], "max": row[f"{m}_max"]}
+                for m in HISTORY_METRICS
+            },
+        }
+        for row in rows
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Typed-column migration
+# ---------------------------------------------------------------------------
+
+_ALERT_FLAG_CASES = " ".join(
+    f"WHEN '{alert}' THEN {flag}" for alert, flag in ALERT_FLAGS.items()
+)
+
+
+async def backfill_reading_columns(chunk_size: int = DB_MIGRATION_CHUNK) -> int:
+    """
+    Fills the typed columns of rows written before they existed, straight
+    from the JSON blobs. Walks the primary key in chunks and commits each
+    chunk separately, so ingest keeps flowing while it runs.
+    Returns the number of rows updated.
+    """
+    async with _reading() as db:
+        cursor = await db.execute(
+            "SELECT MIN(id), MAX(id) FROM sensor_readings "
+            "WHERE epoch IS NULL OR alert_flags IS NULL"
+        )
+        first_id, last_id = await cursor.fetchone()
+    if first_id is None:
+        return 0
+
+    log.info("backfill_started", extra={"first_id": first_id, "last_id": last_id})
+    updated = 0
+    for start in range(first_id, last_id + 1, chunk_size):
+        async with _writing() as db:
+            cursor = await db.execute(f"""
+                UPDATE sensor_readings SET
+                    epoch              = COALESCE(CAST(strftime('%s', timestamp) AS INTEGER), 0),
+                    device_id          = json_extract(sensor_data, '$.sensor_readings.device_id'),
+                    temperature        = json_extract(sensor_data, '$.sensor_readings.temperature'),
+                    humidity           = json_extract(sensor_data, '$.sensor_readings.humidity'),
+                    device_aqi         = json_extract(sensor_data, '$.sensor_readings.aqi'),
+                    aqi                = json_extract(sensor_data, '$.aqi_info.aqi'),
+                    aqi_source         = json_extract(sensor_data, '$.aqi_info.source'),
+                    health_score       = json_extract(risk_data, '$.health_score'),
+                    overall_status     = json_extract(risk_data, '$.overall_status'),
+                    heat_stress_risk   = json_extract(risk_data, '$.heat_stress_risk'),
+                    respiratory_risk   = json_extract(risk_data, '$.respiratory_risk'),
+                    asthma_attack_risk = json_extract(risk_data, '$.asthma_attack_risk'),
+                    alert_flags        = (
+                        SELECT COALESCE(SUM(CASE value {_ALERT_FLAG_CASES} ELSE 0 END), 0)
+                        FROM json_each(risk_data, '$.active_alerts')
+                    )
+                WHERE id >= ? AND id < ? AND (epoch IS NULL OR alert_flags IS NULL)
+            """, (start, start + chunk_size))
+            await db.commit()
+            updated += cursor.rowcount
+        await asyncio.sleep(0)
+
+    log.info("backfill_finished", extra={"readings": updated})
+    return updated
+
+
+async def _migrate(chunk_size: int = DB_MIGRATION_CHUNK):
+    """
+    Background startup migrations: typed-column backfill, then the device
+    registry and first rollup build for databases that predate them.
+    """
+    await backfill_reading_columns(chunk_size)
+    async with _reading() as db:
+        cursor = await db.execute("""
+            SELECT EXISTS (SELECT 1 FROM sensor_readings)
+               AND NOT EXISTS (SELECT 1 FROM devices),
+                   EXISTS (SELECT 1 FROM sensor_readings)
+               AND NOT EXISTS (SELECT 1 FROM sensor_rollups_daily)
+        """)
+        needs_devices, needs_rollups = await cursor.fetchone()
+    if needs_devices:
+        await register_existing_devices()
+    if needs_rollups:
+        await rebuild_rollups()
+
+
+# ---------------------------------------------------------------------------
+# Rollups — per-device hourly and daily aggregates
+# ---------------------------------------------------------------------------
+# Maintained in the same transaction as every insert, so long-range charts
+# and reports read a few hundred small rows instead of scanning raw
+# readings. Sums and counts (not averages) are stored so buckets merge
+# exactly; rebuild_rollups() recomputes them from raw data if they drift.
+# Devices without an id are rolled up under ''.
+
+ROLLUP_TABLES = {
+    3600:  "sensor_rollups_hourly",
+    86400: "sensor_rollups_daily",
+}
+
+ROLLUP_STATUSES = {
+    "Safe":      "status_safe",
+    "Caution":   "status_caution",
+    "Unsafe":    "status_unsafe",
+    "Dangerous": "status_dangerous",
+}
+
+ROLLUP_ALERTS = {
+    "High Heat Stress":            "alert_high_heat_stress",
+    "Critical Air Quality":        "alert_critical_air_quality",
+    "Poor Air Quality":            "alert_poor_air_quality",
+    "Elevated Asthma Attack Risk": "alert_elevated_asthma_risk",
+}
+
+_ROLLUP_COLUMNS = (
+    ("count", "INTEGER NOT NULL"),
+    *(
+        (f"{m}_{part}", decl)
+        for m in HISTORY_METRICS
+        for part, decl in (("n", "INTEGER NOT NULL"), ("sum", "REAL NOT NULL"), ("min", ""), ("max", ""))
+    ),
+    *((column, "INTEGER NOT NULL") for column in ROLLUP_STATUSES.values()),
+    *((column, "INTEGER NOT NULL") for column in ROLLUP_ALERTS.values()),
+)
+_ROLLUP_NAMES = [column for column, _ in _ROLLUP_COLUMNS]
+
+
+def _rollup_merge(column: str) -> str:
+    """ON CONFLICT expression folding an incoming delta into a stored bucket."""
+    if column.endswith("_min"):
+        return f"{column} = COALESCE(MIN({column}, excluded.{column}), {column}, excluded.{column})"
+    if column.endswith("_max"):
+        return f"{column} = COALESCE(MAX({column}, excluded.{column}), {column}, excluded.{column})"
+    return f"{column} = {column} + excluded.{column}"
+
+
+def _rollup_upsert_sql(table: str) -> str:
+    return (
+        f"INSERT INTO {table} (device_id, bucket_start, {', '.join(_ROLLUP_NAMES)}) "
+        f"VALUES ({', '.join('?' * (2 + len(_ROLLUP_NAMES)))}) "
+        "ON CONFLICT (device_id, bucket_start) DO UPDATE SET "
+        + ", ".join(_rollup_merge(column) for column in _ROLLUP_NAMES)
+    )
+
+
+_ROLLUP_UPSERT_SQL = {seconds: _rollup_upsert_sql(table) for seconds, table in ROLLUP_TABLES.items()}
+_ROW_INDEX = {
+    name: i
+    for i, name in enumerate(("timestamp", "sensor_data", "risk_data", *(c for c, _ in _READING_COLUMNS)))
+}
+
+
+async def _apply_rollups(db: aiosqlite.Connection, rows: list[tuple]):
+    """Folds freshly inserted sensor_readings rows into both rollup tables."""
+    for seconds, sql in _ROLLUP_UPSERT_SQL.items():
+        deltas: dict[tuple, dict] = {}
+        for row in rows:
+            key = (row[_ROW_INDEX["device_id"]] or "", row[_ROW_INDEX["epoch"]] // seconds * seconds)
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = {
+                    column: (None if column.endswith(("_min", "_max")) else 0)
+                    for column in _ROLLUP_NAMES
+                }
+            delta["count"] += 1
+            for m in HISTORY_METRICS:
+                value = row[_ROW_INDEX[m]]
+                if value is None:
+                    continue
+                delta[f"{m}_n"] += 1
+                delta[f"{m}_sum"] += value
+                low, high = delta[f"{m}_min"], delta[f"{m}_max"]
+                delta[f"{m}_min"] = value if low is None else min(low, value)
+                delta[f"{m}_max"] = value if high is None else max(high, value)
+            status_column = ROLLUP_STATUSES.get(row[_ROW_INDEX["overall_status"]])
+            if status_column:
+                delta[status_column] += 1
+            flags = row[_ROW_INDEX["alert_flags"]] or 0
+            for alert, column in ROLLUP_ALERTS.items():
+                if flags & ALERT_FLAGS[alert]:
+                    delta[column] += 1
+
+        await db.executemany(
+            sql,
+            [(*key, *(delta[column] for column in _ROLLUP_NAMES)) for key, delta in deltas.items()],
+        )
+
+
+def _rollup_select_from_raw(seconds: int) -> str:
+    """SELECT producing rollup rows straight from sensor_readings for one granularity."""
+    parts = [
+        "COALESCE(device_id, '')",
+        f"(epoch / {seconds}) * {seconds} AS bucket",
+        "COUNT(*)",
+    ]
+    for m in HISTORY_METRICS:
+        parts += [f"COUNT({m})", f"TOTAL({m})", f"MIN({m})", f"MAX({m})"]
+    parts += [f"COALESCE(SUM(overall_status = '{status}'), 0)" for status in ROLLUP_STATUSES]
+    parts += [f"SUM((COALESCE(alert_flags, 0) & {ALERT_FLAGS[alert]}) != 0)" for alert in ROLLUP_ALERTS]
+    return (
+        f"SELECT {', '.join(parts)} FROM sensor_readings "
+        "WHERE epoch >= ? AND epoch < ? "
+        "GROUP BY COALESCE(device_id, ''), bucket"
+    )
+
+
+async def rebuild_rollups(since: int | None = None) -> int:
+    """
+    Recomputes both rollup tables exactly from raw readings, from the UTC day
+    containing `since` (default: the oldest raw reading) onwards. Runs one
+    day per transaction so ingest is never blocked for long. Days already
+    archived by the retention policy are never rebuilt — their raw rows are
+    gone, so the stored rollups are the only copy.
+    Returns the number of days rebuilt.
+    """
+    async with _reading() as db:
+        cursor = await db.execute("SELECT MIN(epoch), MAX(epoch) FROM sensor_readings")
+        oldest, newest = await cursor.fetchone()
+    if oldest is None:
+        return 0
+    archived_before = int(await get_meta("archived_before") or 0)
+
+    day = 86400
+    first_day = (max(oldest, since or 0, archived_before) // day) * day
+    days = 0
+    for start in range(first_day, newest + 1, day):
+        end = start + day
+        async with _writing() as db:
+            for seconds, table in ROLLUP_TABLES.items():
+                await db.execute(
+                    f"DELETE FROM {table} WHERE bucket_start >= ? AND bucket_start < ?",
+                    (start, end),
+                )
+                await db.execute(
+                    f"INSERT INTO {table} (device_id, bucket_start, {', '.join(_ROLLUP_NAMES)}) "
+                    + _rollup_select_from_raw(seconds),
+                    (start, end),
+                )
+            await db.commit()
+        days += 1
+        await asyncio.sleep(0)
+
+    log.info("rollups_rebuilt", extra={"days": days})
+    return days
+
+
+async def get_rollup_history(
+    start: int,
+    end: int,
+    bucket_seconds: int,
+    device_id: str | None = None,
+) -> list:
+    """
+    Same shape as get_bucketed_history, plus status and alert counts, read
+    from the rollup tables. bucket_seconds must be a multiple of an hour;
+    whole-day buckets read the daily table, everything else the hourly one.
+    """
+    granularity = 86400 if bucket_seconds % 86400 == 0 else 3600
+    table = ROLLUP_TABLES[granularity]
+    # A rollup row can't be split: a start inside it takes the whole row,
+    # as the raw path would include its readings from start on
+    start -= start % granularity
+
+    parts = ["SUM(count) AS count"]
+    for m in HISTORY_METRICS:
+        parts += [
+            f"MIN({m}_min) AS {m}_min",
+            f"ROUND(TOTAL({m}_sum) / NULLIF(SUM({m}_n), 0), 2) AS {m}_avg",
+            f"MAX({m}_max) AS {m}_max",
+        ]
+    parts += [f"SUM({column}) AS {column}" for column in (*ROLLUP_STATUSES.values(), *ROLLUP_ALERTS.values())]
+
+    device_filter = "AND device_id = :device" if device_id is not None else ""
+    async with _reading() as db:
+        cursor = await db.execute(f"""
+            SELECT (bucket_start / :bucket) * :bucket AS bucket, {", ".join(parts)}
+            FROM {table}
+            WHERE bucket_start >= :start AND bucket_start < :end {device_filter}
+            GROUP BY bucket
+            ORDER BY bucket
+        """, {"bucket": bucket_seconds, "start": start, "end": end, "device": device_id})
+        rows = await cursor.fetchall()
+
+    return [
+        {
+            "start":    datetime.fromtimestamp(row["bucket"], timezone.utc).isoformat(),
+            "count":    row["count"],
+            **{
+                m: {"min": row[f"{m}_min"], "avg": row[f"{m}_avg"], "max": row[f"{m}_max"]}
+                for m in HISTORY_METRICS
+            },
+            "statuses": {status: row[column] for status, column in ROLLUP_STATUSES.items()},
+            "alerts":   {alert: row[column] for alert, column in ROLLUP_ALERTS.items()},
+        }
+        for row in rows
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Retention, archival and compaction
+# ---------------------------------------------------------------------------
+# Off by default. With RETENTION_DAYS=N (e.g. 90) the maintenance loop moves
+# raw readings older than N whole UTC days to gzip'd NDJSON files, one per
+# day, under ARCHIVE_DIR/sensor_readings/. Readings with an outcome label
+# stay in the DB for training; archived ones can no longer be labelled.
+# Rollups are kept, so long-range history keeps working after the raw rows
+# are gone.
+# Each chunk is fsync'd to its archive file before the rows are deleted; a
+# crash in between can only duplicate rows in the archive (dedupe on id).
+
+async def get_meta(key: str) -> str | None:
+    async with _reading() as db:
+        cursor = await db.execute("SELECT value FROM db_meta WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        return row["value"] if row else None
+
+
+def _append_archive(path: Path, rows: list[dict]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            row["sensor_data"] = blob_as_json(row["sensor_data"])
+            row["risk_data"]   = blob_as_json(row["risk_data"])
+            f.write(json.dumps(row) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+async def archive_old_readings(
+    retention_days: int = RETENTION_DAYS,
+    archive_dir: str = ARCHIVE_DIR,
+    chunk_size: int = DB_MIGRATION_CHUNK,
+) -> int:
+    """Moves unlabelled raw readings older than the retention window to disk. Returns rows moved."""
+    if retention_days <= 0:
+        return 0
+
+    day = 86400
+    now = int(datetime.now(timezone.utc).timestamp())
+    cutoff = (now // day - retention_days) * day
+    moved = 0
+
+    while True:
+        async with _reading() as db:
+            cursor = await db.execute("""
+                SELECT * FROM sensor_readings sr
+                WHERE epoch < ?
+                  AND NOT EXISTS (SELECT 1 FROM outcome_labels ol WHERE ol.reading_id = sr.id)
+                ORDER BY id
+                LIMIT ?
+            """, (cutoff, chunk_size))
+            rows = [dict(row) for row in await cursor.fetchall()]
+        if not rows:
+            break
+
+        by_day: dict[str, list[dict]] = {}
+        for row in rows:
+            day_name = datetime.fromtimestamp(row["epoch"], timezone.utc).strftime("%Y-%m-%d")
+            by_day.setdefault(day_name, []).append(row)
+        for day_name, day_rows in by_day.items():
+            path = Path(archive_dir) / "sensor_readings" / f"{day_name}.ndjson.gz"
+            await asyncio.to_thread(_append_archive, path, day_rows)
+
+        async with _writing() as db:
+            # A label added since the select keeps its reading; the archive copy is a harmless duplicate
+            await db.executemany("""
+                DELETE FROM sensor_readings
+                WHERE id = ? AND NOT EXISTS (SELECT 1 FROM outcome_labels WHERE reading_id = ?)
+            """, [(row["id"], row["id"]) for row in rows])
+            await db.commit()
+        moved += len(rows)
+        await asyncio.sleep(0)
+
+    async with _writing() as db:
+        await db.execute("""
+            INSERT INTO db_meta (key, value) VALUES ('archived_before', ?)
+            ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), excluded.value)
+        """, (cutoff,))
+        await db.commit()
+
+    if moved:
+        log.info("readings_archived", extra={"readings": moved, "retention_days": retention_days})
+    return moved
+
+
+async def trim_aqi_cache() -> int:
+    """Keeps only the newest aqi_cache row per coordinate cell. Returns rows deleted."""
+    async with _writing() as db:
+        cursor = await db.execute("""
+            DELETE FROM aqi_cache
+            WHERE id NOT IN (SELECT MAX(id) FROM aqi_cache GROUP BY cell)
+        """)
+        await db.commit()
+        return cursor.rowcount
+
+
+async def _incremental_vacuum() -> int:
+    """Returns freed pages to the OS a step at a time. Returns pages freed."""
+    async with _reading() as db:
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        (mode,) = await cursor.fetchone()
+    if mode != 2:   # INCREMENTAL
+        return 0
+
+    freed = 0
+    while True:
+        async with _writing() as db:
+            cursor = await db.execute("PRAGMA freelist_count")
+            (free_pages,) = await cursor.fetchone()
+            if free_pages == 0:
+                break
+            step = min(free_pages, VACUUM_STEP_PAGES)
+            # executescript steps the pragma to completion; execute() would
+            # stop after the first freed page
+            await db.executescript(f"PRAGMA incremental_vacuum({step});")
+        freed += step
+        await asyncio.sleep(0)
+    return freed
+
+
+_maintenance_lock = asyncio.Lock()
+
+
+async def run_maintenance() -> dict:
+    """
+    One maintenance pass: archive old readings, trim aqi_cache, reclaim
+    space and checkpoint the WAL. Every step works in short transactions.
+    Databases created before auto_vacuum was enabled need a one-off manual
+    VACUUM before the space reclaim step has any effect.
+    """
+    async with _maintenance_lock:
+        archived = await archive_old_readings()
+        trimmed = await trim_aqi_cache()
+        freed = await _incremental_vacuum()
+        async with _writing() as db:
+            await db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    return {"archived_readings": archived, "trimmed_aqi_cache": trimmed, "freed_pages": freed}
+
+
+async def _maintenance_loop():
+    try:
+        await _migration_task   # archival relies on the backfilled epoch column
+    except Exception:
+        pass
+    while True:
+        try:
+            summary = await run_maintenance()
+            log.info("maintenance_pass", extra=summary)
+        except Exception:
+            log.exception("maintenance_failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+
 # ---------------------------------------------------------------------------
 # Symptom logs
 # ---------------------------------------------------------------------------
 
 async def save_symptom_log(entry: dict) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    user_id = entry.get("user_id")
+    async with _writing() as db:
         cursor = await db.execute(
-            "INSERT INTO symptom_logs (logged_at, entry) VALUES (?, ?)",
+            "INSERT INTO symptom_logs (logged_at, entry, user_id) VALUES (?, ?, ?)",
             (
                 datetime.now(timezone.utc).isoformat(),
-                json.dumps(entry),
+                encode_blob(entry),
+                user_id,
             )
         )
         await db.commit()
+        _hot["latest_symptoms"] = entry
+        if user_id is not None:
+            _hot["symptoms_by_user"][user_id] = (cursor.lastrowid, entry)
         return cursor.lastrowid
 
 
-async def get_latest_symptom_log() -> dict | None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+async def get_latest_symptom_log(user_id: str | None = None) -> dict | None:
+    """Newest symptom entry from anyone, or from one user if user_id is given."""
+    if user_id is None:
+        if _hot_loaded:
+            return _copy(_hot["latest_symptoms"])
+        return await _load_latest_symptom_log()
+
+    if _hot_loaded and user_id in _hot["symptoms_by_user"]:
+        return _copy(_hot["symptoms_by_user"][user_id][1])
+    log_id, entry = await _load_user_symptom_log(user_id)
+    if _hot_loaded:
+        current = _hot["symptoms_by_user"].get(user_id)
+        if current is None or current[0] < log_id:
+            _hot["symptoms_by_user"][user_id] = (log_id, entry)
+    return _copy(entry)
+
+
+async def get_symptom_context(device_id: str | None) -> dict | None:
+    """
+    Symptoms to score a reading from device_id against: the latest entry of
+    the user the device is registered to. Until any device is registered to
+    a user (a single-household deployment), every device falls back to the
+    latest entry from anyone; after that, a device with no user gets None
+    rather than someone else's symptoms.
+    """
+    user_id = await get_device_user(device_id) if device_id is not None else None
+    if user_id is None and await _has_device_users():
+        return None
+    return await get_latest_symptom_log(user_id)
+
+
+async def _load_latest_symptom_log() -> dict | None:
+    async with _reading() as db:
         cursor = await db.execute(
-            "SELECT * FROM symptom_logs ORDER BY id DESC LIMIT 1"
+            "SELECT entry FROM symptom_logs ORDER BY id DESC LIMIT 1"
         )
         row = await cursor.fetchone()
         if not row:
             return None
-        return json.loads(row["entry"])
+        return decode_blob(row["entry"])
+
+
+async def _load_user_symptom_log(user_id: str) -> tuple[int, dict | None]:
+    async with _reading() as db:
+        cursor = await db.execute(
+            "SELECT id, entry FROM symptom_logs WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+            (user_id,),
+        )
+        row = await cursor.fetchone()
+        if not row:
+            return 0, None
+        return row["id"], decode_blob(row["entry"])
+
+
+# ---------------------------------------------------------------------------
+# Device registry
+# ---------------------------------------------------------------------------
+
+_DEVICE_FIELDS = ("device_id", "user_id", "label", "first_seen", "last_seen")
+
+
+async def register_device(device_id: str, user_id: str | None = None, label: str | None = None) -> dict:
+    """Ties a device to a user (and an optional display label). Creates it if unseen."""
+    async with _writing() as db:
+        await db.execute("""
+            INSERT INTO devices (device_id, user_id, label) VALUES (?, ?, ?)
+            ON CONFLICT (device_id) DO UPDATE SET
+                user_id = excluded.user_id,
+                label   = excluded.label
+        """, (device_id, user_id, label))
+        await db.commit()
+        if user_id is None:
+            _hot["device_users"].pop(device_id, None)
+        else:
+            _hot["device_users"][device_id] = user_id
+        cursor = await db.execute(
+            f"SELECT {', '.join(_DEVICE_FIELDS)} FROM devices WHERE device_id = ?", (device_id,)
+        )
+        return dict(await cursor.fetchone())
+
+
+async def get_device(device_id: str) -> dict | None:
+    async with _reading() as db:
+        cursor = await db.execute(
+            f"SELECT {', '.join(_DEVICE_FIELDS)} FROM devices WHERE device_id = ?", (device_id,)
+        )
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+
+async def list_devices() -> list:
+    async with _reading() as db:
+        cursor = await db.execute(
+            f"SELECT {', '.join(_DEVICE_FIELDS)} FROM devices ORDER BY device_id"
+        )
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def get_device_user(device_id: str) -> str | None:
+    if _hot_loaded:
+        return _hot["device_users"].get(device_id)
+    async with _reading() as db:
+        cursor = await db.execute("SELECT user_id FROM devices WHERE device_id = ?", (device_id,))
+        row = await cursor.fetchone()
+        return row["user_id"] if row else None
+
+
+async def _has_device_users() -> bool:
+    """Whether any device is registered to a user."""
+    if _hot_loaded:
+        return bool(_hot["device_users"])
+    async with _reading() as db:
+        cursor = await db.execute("SELECT 1 FROM devices WHERE user_id IS NOT NULL LIMIT 1")
+        return await cursor.fetchone() is not None
+
+
+async def _load_device_users() -> dict:
+    async with _reading() as db:
+        cursor = await db.execute(
+            "SELECT device_id, user_id FROM devices WHERE user_id IS NOT NULL"
+        )
+        return {row["device_id"]: row["user_id"] for row in await cursor.fetchall()}
+
+
+async def register_existing_devices() -> int:
+    """Fills the registry from readings stored before it existed. Safe to re-run."""
+    async with _writing() as db:
+        cursor = await db.execute("""
+            INSERT OR IGNORE INTO devices (device_id, first_seen, last_seen)
+            SELECT device_id, MIN(timestamp), MAX(timestamp)
+            FROM sensor_readings
+            WHERE device_id IS NOT NULL
+            GROUP BY device_id
+        """)
+        await db.commit()
+        added = cursor.rowcount
+    if _hot_loaded:
+        for view in (await _load_latest_per_device()).values():
+            _remember_device_reading(view)
+    log.info("devices_registered", extra={"devices": added})
+    return added
 
 
 # ---------------------------------------------------------------------------
 # AQI cache — last known good from Open-Meteo
 # ---------------------------------------------------------------------------
 
-async def save_aqi_cache(aqi_data: dict) -> int:
-    """Saves the most recent successful Open-Meteo response."""
-    async with aiosqlite.connect(DB_PATH) as db:
+async def save_aqi_cache(aqi_data: dict, cell: str | None = None) -> int:
+    """
+    Saves the most recent successful Open-Meteo response.
+    cell is the rounded coordinate key aqi_service caches under, if known.
+    """
+    async with _writing() as db:
         cursor = await db.execute(
-            "INSERT INTO aqi_cache (fetched_at, aqi_data) VALUES (?, ?)",
+            "INSERT INTO aqi_cache (fetched_at, aqi_data, cell) VALUES (?, ?, ?)",
             (
                 datetime.now(timezone.utc).isoformat(),
-                json.dumps(aqi_data),
+                encode_blob(aqi_data),
+                cell,
             )
         )
         await db.commit()
+        _hot["last_known_aqi"] = aqi_data
         return cursor.lastrowid
 
 
+async def get_cached_aqi(cell: str, max_age_seconds: float) -> tuple[dict, float] | None:
+    """
+    Returns (aqi_data, age_seconds) for the newest entry in a coordinate
+    cell, or None if there is none younger than max_age_seconds.
+    Second cache tier behind aqi_service's in-memory cache — survives restarts.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=max_age_seconds)).isoformat()
+    async with _reading() as db:
+        cursor = await db.execute(
+            "SELECT fetched_at, aqi_data FROM aqi_cache "
+            "WHERE cell = ? AND fetched_at >= ? ORDER BY id DESC LIMIT 1",
+            (cell, cutoff),
+        )
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        age = (now - datetime.fromisoformat(row["fetched_at"])).total_seconds()
+        return decode_blob(row["aqi_data"]), age
+
+
+async def get_recent_aqi_cells(max_age_seconds: float) -> list:
+    """Coordinate cells with an aqi_cache entry younger than max_age_seconds."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)).isoformat()
+    async with _reading() as db:
+        cursor = await db.execute(
+            "SELECT DISTINCT cell FROM aqi_cache WHERE cell IS NOT NULL AND fetched_at >= ?",
+            (cutoff,),
+        )
+        return [row["cell"] for row in await cursor.fetchall()]
+
+
 async def get_last_known_aqi() -> dict | None:
     """
     Retrieves the most recent cached AQI result.
     Used as the third fallback when Open-Meteo is unreachable.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    if _hot_loaded:
+        return _copy(_hot["last_known_aqi"])
+    return await _load_last_known_aqi()
+
+
+async def _load_last_known_aqi() -> dict | None:
+    async with _reading() as db:
         cursor = await db.execute(
-            "SELECT * FROM aqi_cache ORDER BY id DESC LIMIT 1"
+            "SELECT aqi_data FROM aqi_cache ORDER BY id DESC LIMIT 1"
         )
         row = await cursor.fetchone()
         if not row:
             return None
-        return json.loads(row["aqi_data"])
+        return decode_blob(row["aqi_data"])
 
 
 # ---------------------------------------------------------------------------
 # Outcome labels — XGBoost training data
 # ---------------------------------------------------------------------------
 
-async def save_outcome_label(reading_id: int, had_episode: bool, notes: str = None) -> int:
+async def save_outcome_label(reading_id: int, had_episode: bool, notes: str = None) -> int | None:
     """
     User labels whether they had an asthma episode after a reading.
     This is the training target for the XGBoost model.
     had_episode: True = episode occurred, False = no episode
+    Returns None if the reading is not in the DB (unknown, or archived).
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _writing() as db:
         cursor = await db.execute(
-            "INSERT INTO outcome_labels (reading_id, labeled_at, had_episode, notes) VALUES (?, ?, ?, ?)",
+            """
+            INSERT INTO outcome_labels (reading_id, labeled_at, had_episode, notes)
+            SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sensor_readings WHERE id = ?)
+            """,
             (
                 reading_id,
                 datetime.now(timezone.utc).isoformat(),
                 1 if had_episode else 0,
                 notes,
+                reading_id,
             )
         )
         await db.commit()
-        return cursor.lastrowid
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+_MAX_ROWID = 2**63 - 1
+
+TRAINING_FIELDS = (
+    "id",
+    "timestamp",
+    "temperature",
+    "humidity",
+    "aqi",
+    "heat_score",
+    "heat_risk",
+    "respiratory_risk",
+    "had_episode",
+    "labeled_at",
+)
+
+_TRAINING_SELECT = """
+    SELECT
+        sr.id,
+        sr.timestamp,
+        sr.temperature,
+        sr.humidity,
+        sr.device_aqi,
+        sr.health_score,
+        sr.heat_stress_risk,
+        sr.respiratory_risk,
+        ol.id AS label_id,
+        ol.had_episode,
+        ol.labeled_at
+    FROM sensor_readings sr
+    JOIN outcome_labels ol ON sr.id = ol.reading_id
+"""
+
+
+def _training_record(row) -> dict:
+    return {
+        "id":              row["id"],
+        "timestamp":       row["timestamp"],
+        "temperature":     row["temperature"],
+        "humidity":        row["humidity"],
+        "aqi":             row["device_aqi"],
+        "heat_score":      row["health_score"],
+        "heat_risk":       row["heat_stress_risk"],
+        "respiratory_risk":row["respiratory_risk"],
+        "had_episode":     bool(row["had_episode"]),
+        "labeled_at":      row["labeled_at"],
+    }
 
 
 async def get_training_data(limit: int = 500) -> list:
@@ -198,36 +1646,41 @@ async def get_training_data(limit: int = 500) -> list:
     Joins sensor readings with outcome labels.
     Returns structured training records ready for XGBoost.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("""
-            SELECT
-                sr.id,
-                sr.timestamp,
-                sr.sensor_data,
-                sr.risk_data,
-                ol.had_episode,
-                ol.notes
-            FROM sensor_readings sr
-            JOIN outcome_labels ol ON sr.id = ol.reading_id
-            ORDER BY sr.id DESC
-            LIMIT ?
-        """, (limit,))
-        rows = await cursor.fetchall()
-        results = []
+    async with _reading() as db:
+        cursor = await db.execute(
+            _TRAINING_SELECT + " ORDER BY sr.id DESC LIMIT ?", (limit,)
+        )
+        return [_training_record(row) for row in await cursor.fetchall()]
+
+
+async def iter_training_data(
+    after_id: int = 0,
+    since: str | None = None,
+    chunk_size: int = 500,
+) -> AsyncIterator[dict]:
+    """
+    Streams every labelled reading in ascending id order.
+    Pages with a keyset cursor on (reading id, label id) rather than OFFSET,
+    and only holds a pooled connection while a page is being fetched, so
+    memory stays flat however many labels exist.
+        after_id: only readings with a larger id
+        since:    only labels recorded after this UTC ISO timestamp
+    """
+    cursor_key = (after_id, _MAX_ROWID)   # past every label of after_id itself
+    since_filter = "AND ol.labeled_at > ?" if since else ""
+    while True:
+        params = (*cursor_key, *((since,) if since else ()), chunk_size)
+        async with _reading() as db:
+            cursor = await db.execute(
+                _TRAINING_SELECT
+                + f" WHERE (sr.id, ol.id) > (?, ?) {since_filter}"
+                + " ORDER BY sr.id, ol.id LIMIT ?",
+                params,
+            )
+            rows = await cursor.fetchall()
+
         for row in rows:
-            sensor = json.loads(row["sensor_data"])
-            risk   = json.loads(row["risk_data"])
-            readings = sensor.get("sensor_readings", {})
-            results.append({
-                "id":              row["id"],
-                "timestamp":       row["timestamp"],
-                "temperature":     readings.get("temperature"),
-                "humidity":        readings.get("humidity"),
-                "aqi":             readings.get("aqi"),
-                "heat_score":      risk.get("health_score"),
-                "heat_risk":       risk.get("heat_stress_risk"),
-                "respiratory_risk":risk.get("respiratory_risk"),
-                "had_episode":     bool(row["had_episode"]),
-            })
-        return results
\ No newline at end of file
+            yield _training_record(row)
+        if len(rows) < chunk_size:
+            return
+        cursor_key = (rows[-1]["id"], rows[-1]["label_id"])
@@ -0,0 +1,325 @@
+"""
+Builds the model training set as an on-disk feature matrix.
+
+Reads the sensor_readings ⋈ outcome_labels join in keyset-paged chunks
+straight from SQLite and appends one row per label to raw column files
+that numpy can memory-map, plus a manifest.json:
+
+    features/
+        manifest.json        rows, columns + dtypes, config, high-water mark
+        label_id.i8          one file per column, little-endian, no header
+        had_episode.i1
+        aqi_mean_1h.f4
+        ...
+
+Each run continues from the manifest's high-water mark (the largest
+outcome label id written), so re-running after new /outcome labels only
+reads the new ones. --rebuild starts over, and is required after
+changing --windows or --symptom-hours.
+
+Per label, besides the reading's own values:
+    symptom_score
+        the score of the latest symptom diary entry logged by then — the
+        device's user's entries if it is registered, anyone's otherwise,
+        as when the reading was scored
+    aqi_mean_<w>, aqi_max_<w>, humidity_mean_<w>
+        over the same device's readings in the <w> up to and including it
+    symptom_score_max_<n>h, symptom_logs_<n>h
+        over the same symptom diary entries logged in the <n> hours before it
+
+A model for MODEL_PATH can only use the columns the backend computes when
+it scores a reading — risk_engine.MODEL_FEATURES, named as here; the
+window columns are for offline analysis until the backend computes them.
+
+Windows only see readings still in the DB: unlabelled readings older than
+RETENTION_DAYS (when set) have been archived.
+
+    cd backend
+    python features.py --out features --windows 1h,6h,24h --symptom-hours 24
+
+Load with open_feature_matrix("features") — a dict of read-only memmaps.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from codec import decode_blob, loads
+from risk_engine import _score_symptoms
+
+MANIFEST_FORMAT = 2
+
+_WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+# ---------------------------------------------------------------------------
+# Columns
+# ---------------------------------------------------------------------------
+
+def _columns(windows: list[str], symptom_hours: int) -> list[tuple[str, str]]:
+    """(name, numpy dtype) in file order."""
+    columns = [
+        ("label_id",    "<i8"),
+        ("reading_id",  "<i8"),
+        ("epoch",       "<i8"),
+        ("had_episode", "i1"),
+        ("temperature", "<f4"),
+        ("humidity",    "<f4"),
+        ("aqi",         "<f4"),
+        ("device_aqi",  "<f4"),
+    ]
+    for window in windows:
+        columns += [
+            (f"aqi_mean_{window}",      "<f4"),
+            (f"aqi_max_{window}",       "<f4"),
+            (f"humidity_mean_{window}", "<f4"),
+        ]
+    columns += [
+        ("symptom_score",                       "<f4"),
+        (f"symptom_score_max_{symptom_hours}h", "<f4"),
+        (f"symptom_logs_{symptom_hours}h",      "<f4"),
+    ]
+    return columns
+
+
+def _file_name(name: str, dtype: str) -> str:
+    return f"{name}.{np.dtype(dtype).kind}{np.dtype(dtype).itemsize}"
+
+
+def _window_seconds(window: str) -> int:
+    try:
+        return int(window[:-1]) * _WINDOW_UNITS[window[-1]]
+    except (KeyError, ValueError):
+        raise SystemExit(f"bad window {window!r} — use e.g. 30m, 1h, 1d")
+
+
+# ---------------------------------------------------------------------------
+# Reading the DB
+# ---------------------------------------------------------------------------
+
+def _window_select(window: str) -> str:
+    """
+    One correlated subquery per window, on the (device_id, timestamp) index.
+    The three aggregates come back as a JSON array so the window's rows are
+    fetched once rather than once per aggregate.
+    """
+    seconds = _window_seconds(window)
+    return f"""(
+        SELECT json_array(AVG(w.aqi), MAX(w.aqi), AVG(w.humidity))
+        FROM sensor_readings w
+        WHERE w.device_id IS sr.device_id
+          AND w.timestamp >= strftime('%Y-%m-%dT%H:%M:%S', sr.epoch - {seconds}, 'unixepoch')
+          AND w.timestamp <= sr.timestamp
+    ) AS window_{window}"""
+
+
+def _chunk_sql(windows: list[str]) -> str:
+    columns = [
+        "ol.id AS label_id", "sr.id AS reading_id", "sr.epoch", "ol.had_episode",
+        "sr.temperature", "sr.humidity", "sr.aqi", "sr.device_aqi",
+        "d.user_id",
+        *(_window_select(window) for window in windows),   # none with --windows ""
+    ]
+    return f"""
+        SELECT {", ".join(columns)}
+        FROM outcome_labels ol
+        CROSS JOIN sensor_readings sr ON sr.id = ol.reading_id   -- CROSS: page through labels by id
+        LEFT JOIN devices d ON d.device_id = sr.device_id
+        WHERE ol.id > ?
+        ORDER BY ol.id
+        LIMIT ?
+    """
+
+
+class _SymptomIndex:
+    """
+    Symptom diary scores by time, per user. Diaries are small; loaded once.
+    Readings with no user are scored as database.get_symptom_context does:
+    against everyone's entries until any device is registered to a user,
+    against none after that.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        shared = db.execute("SELECT 1 FROM devices WHERE user_id IS NOT NULL LIMIT 1").fetchone() is None
+        by_user: dict[str | None, list[tuple[int, int]]] = {None: []}
+        for logged_at, entry, user_id in db.execute("SELECT logged_at, entry, user_id FROM symptom_logs"):
+            epoch = int(datetime.fromisoformat(logged_at).timestamp())
+            score = _score_symptoms(decode_blob(entry))
+            if shared:
+                by_user[None].append((epoch, score))
+            if user_id is not None:
+                by_user.setdefault(user_id, []).append((epoch, score))
+        self._series = {}
+        for user_id, entries in by_user.items():
+            entries.sort()
+            self._series[user_id] = ([epoch for epoch, _ in entries], [score for _, score in entries])
+
+    def features(self, user_id: str | None, epoch: int, seconds: int) -> tuple[float, float, float]:
+        """(latest score, max score, entry count) — the last two over (epoch - seconds, epoch]."""
+        epochs, scores = self._series.get(user_id, ([], []))
+        hi = bisect_right(epochs, epoch)
+        lo = bisect_right(epochs, epoch - seconds, 0, hi)
+        return (scores[hi - 1] if hi else 0.0), (max(scores[lo:hi]) if hi > lo else 0.0), float(hi - lo)
+
+
+# ---------------------------------------------------------------------------
+# Manifest and column files
+# ---------------------------------------------------------------------------
+
+def _read_manifest(out: Path) -> dict | None:
+    path = out / "manifest.json"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(out: Path, manifest: dict):
+    """Written after the column files are flushed, and swapped in atomically."""
+    tmp = out / "manifest.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out / "manifest.json")
+
+
+def _truncate_to(out: Path, manifest: dict):
+    """Drops rows a crashed run appended after the last manifest write."""
+    for column in manifest["columns"]:
+        path = out / column["file"]
+        size = manifest["rows"] * np.dtype(column["dtype"]).itemsize
+        if path.exists() and path.stat().st_size > size:
+            os.truncate(path, size)
+
+
+def open_feature_matrix(out: str | Path) -> dict[str, np.memmap]:
+    """Every column of a built feature matrix as a read-only memmap, by name."""
+    out = Path(out)
+    manifest = _read_manifest(out)
+    if manifest is None:
+        raise FileNotFoundError(f"no manifest.json in {out}")
+    return {
+        column["name"]: (
+            np.memmap(out / column["file"], dtype=column["dtype"], mode="r", shape=(manifest["rows"],))
+            if manifest["rows"] else np.empty(0, dtype=column["dtype"])
+        )
+        for column in manifest["columns"]
+    }
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def build(
+    db_path: str,
+    out: str | Path,
+    windows: list[str],
+    symptom_hours: int,
+    chunk_size: int = 5000,
+    rebuild: bool = False,
+) -> dict:
+    """Appends every label past the high-water mark. Returns the new manifest."""
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    columns = _columns(windows, symptom_hours)
+    config = {"windows": windows, "symptom_hours": symptom_hours}
+
+    manifest = None if rebuild else _read_manifest(out)
+    if manifest is not None and manifest.get("format") != MANIFEST_FORMAT:
+        raise SystemExit(f"{out} has an older set of columns — pass --rebuild to build it again")
+    if manifest is not None and manifest["config"] != config:
+        raise SystemExit(
+            f"{out} was built with {manifest['config']} — pass --rebuild to build with {config}"
+        )
+    if manifest is None:
+        manifest = {
+            "format":  MANIFEST_FORMAT,
+            "config":  config,
+            "columns": [{"name": name, "dtype": dtype, "file": _file_name(name, dtype)} for name, dtype in columns],
+            "rows":    0,
+            "high_water_label_id": 0,
+        }
+        for column in manifest["columns"]:
+            open(out / column["file"], "wb").close()
+    _truncate_to(out, manifest)
+
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    symptoms = _SymptomIndex(db)
+    symptom_seconds = symptom_hours * 3600
+    sql = _chunk_sql(windows)
+    files = {column["name"]: open(out / column["file"], "ab") for column in manifest["columns"]}
+    try:
+        while True:
+            rows = db.execute(sql, (manifest["high_water_label_id"], chunk_size)).fetchall()
+            if not rows:
+                break
+            _append_chunk(files, columns, rows, symptoms, symptom_seconds)
+            manifest["rows"] += len(rows)
+            manifest["high_water_label_id"] = rows[-1][0]
+            manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+            _write_manifest(out, manifest)
+            if len(rows) < chunk_size:
+                break
+    finally:
+        for f in files.values():
+            f.close()
+        db.close()
+    return manifest
+
+
+def _append_chunk(files: dict, columns: list, rows: list, symptoms: _SymptomIndex, symptom_seconds: int):
+    # rows: label_id, reading_id, epoch, had_episode, temperature, humidity, aqi,
+    # device_aqi, user_id, then one JSON array per window, in column order
+    values = np.array(
+        [[*row[:8], *(value for window in row[9:] for value in loads(window))] for row in rows],
+        dtype=np.float64,   # NULL → NaN
+    )
+    symptom_columns = np.array(
+        [symptoms.features(row[8], row[2], symptom_seconds) for row in rows], dtype=np.float32
+    ).reshape(len(rows), 3)
+
+    for i, (name, dtype) in enumerate(columns[:-3]):
+        files[name].write(values[:, i].astype(dtype).tobytes())
+    for i, (name, dtype) in enumerate(columns[-3:]):
+        files[name].write(symptom_columns[:, i].astype(dtype).tobytes())
+    for f in files.values():
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the EcoBreathe training feature matrix")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "ecobreathe.db"))
+    parser.add_argument("--out", default="features")
+    parser.add_argument("--windows", default="1h,6h,24h", help="rolling windows, e.g. 30m,1h,1d; empty for none")
+    parser.add_argument("--symptom-hours", type=int, default=24)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--rebuild", action="store_true", help="discard the existing matrix and start over")
+    args = parser.parse_args()
+
+    windows = [window.strip() for window in args.windows.split(",") if window.strip()]
+    for window in windows:
+        _window_seconds(window)
+
+    started = time.perf_counter()
+    previous = 0 if args.rebuild else (_read_manifest(Path(args.out)) or {}).get("rows", 0)
+    manifest = build(args.db, args.out, windows, args.symptom_hours, args.chunk_size, args.rebuild)
+    print(json.dumps({
+        "rows":                manifest["rows"],
+        "appended":            manifest["rows"] - previous,
+        "high_water_label_id": manifest["high_water_label_id"],
+        "seconds":             round(time.perf_counter() - started, 2),
+    }), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
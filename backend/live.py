@@ -0,0 +1,106 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator
+
+from fastapi import Request
+
+from codec import dumps
+
+# ---------------------------------------------------------------------------
+# Config
+# ---------------------------------------------------------------------------
+LIVE_QUEUE_SIZE      = int(os.getenv("LIVE_QUEUE_SIZE", 8))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", 1000))
+LIVE_HEARTBEAT       = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+
+
+# ---------------------------------------------------------------------------
+# Fan-out
+# ---------------------------------------------------------------------------
+# Each open dashboard gets a small bounded queue. A reading is encoded once
+# and pushed to every matching queue. When a consumer falls behind, its
+# oldest update is dropped — the newest state supersedes it anyway — so a
+# slow client never holds up ingest or grows memory.
+
+class Subscriber:
+    __slots__ = ("device_id", "queue", "dropped")
+
+    def __init__(self, device_id: str | None):
+        self.device_id = device_id
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, data: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+
+_subscribers: set[Subscriber] = set()
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def subscribe(device_id: str | None = None) -> Subscriber:
+    if len(_subscribers) >= LIVE_MAX_SUBSCRIBERS:
+        raise TooManySubscribers()
+    subscriber = Subscriber(device_id)
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    _subscribers.discard(subscriber)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def encode_event(reading: dict) -> str:
+    return dumps(reading).decode()
+
+
+def publish_reading(reading: dict):
+    """Pushes a stored reading (the /latest-data shape) to every matching subscriber."""
+    if not _subscribers:
+        return
+    device_id = reading.get("sensor_readings", {}).get("device_id")
+    data = encode_event(reading)
+    for subscriber in _subscribers:
+        if subscriber.device_id is None or subscriber.device_id == device_id:
+            subscriber.offer(data)
+
+
+# ---------------------------------------------------------------------------
+# Server-sent events
+# ---------------------------------------------------------------------------
+
+async def sse_events(
+    subscriber: Subscriber,
+    request: Request,
+    initial: dict | None = None,
+) -> AsyncIterator[str]:
+    """
+    Yields the SSE wire format for one subscriber until the client goes away.
+    Sends `initial` first so a fresh dashboard does not need a separate poll.
+    """
+    try:
+        yield f"retry: {int(LIVE_HEARTBEAT * 1000)}\n\n"
+        if initial is not None:
+            yield f"event: reading\ndata: {encode_event(initial)}\n\n"
+
+        while True:
+            try:
+                data = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: reading\ndata: {data}\n\n"
+    finally:
+        unsubscribe(subscriber)
@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# ---------------------------------------------------------------------------
+# Structured logging
+# ---------------------------------------------------------------------------
+# Every module logs an event name plus fields:
+#     log.warning("open_meteo_timeout", extra={"lat": lat, "lon": lon})
+# LOG_FORMAT=json (default) writes one JSON object per line for log
+# shippers; LOG_FORMAT=text writes "level logger event key=value ..." for
+# reading in a terminal.
+
+LOG_LEVEL  = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+_ROOT = "ecobreathe"
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts":     datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level":  record.levelname.lower(),
+            "logger": record.name,
+            "event":  record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in _fields(record).items())
+        line = f"{record.levelname:<7} {record.name} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def _configure():
+    root = logging.getLogger(_ROOT)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a backend module, e.g. get_logger("aqi_service")."""
+    _configure()
+    return logging.getLogger(f"{_ROOT}.{name}")
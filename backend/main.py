@@ -1,35 +1,120 @@
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from fastapi import FastAPI, HTTPException, Request
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-
-from schemas import SensorPayload, SymptomEntry, OutcomeLabel
-from risk_engine import assess_environment_risk
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+from schemas import SensorPayload, SymptomEntry, OutcomeLabel, DeviceRegistration
+from risk_engine import (
+    assess_risk,
+    assess_environment_risk_batch,
+    load_model,
+    unload_model,
+    model_info,
+    ModelError,
+    reload_rules,
+    rules_for,
+    rules_info,
+    RuleError,
+)
 from aqi_service import (
     resolve_aqi_from_device,
     get_aqi_with_fallback,
     fetch_aqi_forecast,
+    forecast_window,
+    open_http_client,
+    close_http_client,
+    start_aqi_refresher,
+    stop_aqi_refresher,
+    upstream_health,
     DEFAULT_LAT,
     DEFAULT_LON,
+    FORECAST_CACHE_TTL,
+)
+from cache import TTLCache
+from codec import dumps
+from log import get_logger
+from metrics import (
+    CACHE_LOOKUPS,
+    SENSOR_STAGE_SECONDS,
+    MetricsMiddleware,
+    render as render_metrics,
+)
+from live import (
+    TooManySubscribers,
+    publish_reading,
+    sse_events,
+    subscribe,
+    unsubscribe,
 )
 from database import (
-    init_db,
+    open_db,
+    close_db,
     save_sensor_reading,
+    save_sensor_readings,
     get_latest_sensor_reading,
+    get_latest_sensor_reading_json,
     get_reading_history,
+    get_bucketed_history,
+    get_rollup_history,
     save_symptom_log,
-    get_latest_symptom_log,
-    save_aqi_cache,
+    get_symptom_context,
     get_last_known_aqi,
+    register_device,
+    get_device,
+    list_devices,
     save_outcome_label,
-    get_training_data,
+    iter_training_data,
+    on_reading_saved,
+    TRAINING_FIELDS,
+    INGEST_ACK_MODE,
 )
 
+log = get_logger("main")
+
+SENSOR_BATCH_MAX = int(os.getenv("SENSOR_BATCH_MAX", 500))
+HISTORY_MAX_BUCKETS = int(os.getenv("HISTORY_MAX_BUCKETS", 1000))
+HISTORY_DEFAULT_BUCKETS = 288
+
+FORECAST_HORIZONS = (6, 12, 24, 48)
+FORECAST_RISK_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_RISK_CACHE_MAX_ENTRIES", 1024))
+
+HISTORY_BUCKETS = {
+    "1m":  60,
+    "5m":  300,
+    "15m": 900,
+    "1h":  3600,
+    "6h":  21600,
+    "1d":  86400,
+}
+
+on_reading_saved(publish_reading)
+
+_forecast_risk_cache = TTLCache(maxsize=FORECAST_RISK_CACHE_MAX_ENTRIES, ttl=FORECAST_CACHE_TTL)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    await open_db()
+    await open_http_client()
+    await start_aqi_refresher()
+    try:
+        load_model()
+    except ModelError as e:
+        log.error("risk_model_load_failed", extra={"error": str(e)})   # rules only
     yield
+    unload_model()
+    await stop_aqi_refresher()
+    await close_http_client()
+    await close_db()
 
 
 app = FastAPI(
@@ -39,6 +124,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -52,35 +138,102 @@ app.add_middleware(
 # Hardware endpoint
 # ---------------------------------------------------------------------------
 
-@app.post("/sensor-data", summary="Receive data from ESP32")
-async def receive_sensor_data(payload: SensorPayload, request: Request):
-    last_known = await get_last_known_aqi()
-    aqi_info = await resolve_aqi_from_device(
-        device_aqi=payload.aqi,
-        request=request,
-        last_known=last_known,
-    )
-
-    if aqi_info.get("source") == "open-meteo":
-        await save_aqi_cache(aqi_info)
-
-    latest_symptoms = await get_latest_symptom_log()
-
-    risk = assess_environment_risk(
-        temperature=payload.temperature,
-        humidity=payload.humidity,
-        aqi=aqi_info["aqi"],
-        symptoms=latest_symptoms,
-    )
+async def _assess_reading(
+    payload: SensorPayload,
+    request: Request,
+    last_known: dict | None,
+    latest_symptoms: dict | None,
+) -> tuple[dict, dict]:
+    """Resolves AQI and scores one reading. Returns (record, risk) ready to store."""
+    with SENSOR_STAGE_SECONDS.time(stage="aqi_resolution"):
+        aqi_info = await resolve_aqi_from_device(
+            device_aqi=payload.aqi,
+            request=request,
+            last_known=last_known,
+        )
+
+    with SENSOR_STAGE_SECONDS.time(stage="risk_scoring"):
+        if payload.latitude is not None and payload.longitude is not None:
+            rules = rules_for(payload.latitude, payload.longitude)
+        else:
+            rules = rules_for(aqi_info.get("latitude"), aqi_info.get("longitude"))
+        risk = await assess_risk(
+            temperature=payload.temperature,
+            humidity=payload.humidity,
+            aqi=aqi_info["aqi"],
+            symptoms=latest_symptoms,
+            rules=rules,
+        )
 
     record = {
-        "sensor_readings":   payload.model_dump(),
+        "sensor_readings":   payload.model_dump(exclude={"recorded_at"}),   # it becomes the reading's timestamp
         "aqi_info":          aqi_info,
         "health_assessment": risk,
     }
-    doc_id = await save_sensor_reading(record, risk)
+    return record, risk
 
-    return {"status": "success", "id": doc_id}
+
+@app.post("/sensor-data", summary="Receive data from ESP32")
+async def receive_sensor_data(
+    payload: SensorPayload,
+    request: Request,
+    ack: Literal["commit", "enqueue"] = None,
+):
+    """
+    Scores and stores one reading. ack="commit" (the INGEST_ACK_MODE
+    default) replies once the reading is committed; ack="enqueue" replies
+    as soon as it is queued for the writer, with status "accepted".
+    """
+    with SENSOR_STAGE_SECONDS.time(stage="last_known_lookup"):
+        last_known = await get_last_known_aqi()
+    with SENSOR_STAGE_SECONDS.time(stage="symptom_lookup"):
+        latest_symptoms = await get_symptom_context(payload.device_id)
+
+    record, risk = await _assess_reading(payload, request, last_known, latest_symptoms)
+    with SENSOR_STAGE_SECONDS.time(stage="insert"):
+        doc_id = await save_sensor_reading(record, risk, ack, payload.recorded_at)
+
+    return {"status": _ingest_status(ack), "id": doc_id}
+
+
+@app.post("/sensor-data/batch", summary="Receive buffered readings from a gateway")
+async def receive_sensor_data_batch(
+    payloads: list[SensorPayload],
+    request: Request,
+    ack: Literal["commit", "enqueue"] = None,
+):
+    """
+    Accepts readings a gateway buffered while offline and stores them in a
+    single transaction. Ids are returned in the order the readings were sent.
+    Each reading should carry recorded_at, so it is stored at the time it
+    was taken rather than at upload time. ack works as for /sensor-data.
+    """
+    if not payloads:
+        raise HTTPException(status_code=422, detail="Batch is empty.")
+    if len(payloads) > SENSOR_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large — send at most {SENSOR_BATCH_MAX} readings.",
+        )
+
+    last_known = await get_last_known_aqi()
+    symptoms_by_device = {}
+    for payload in payloads:
+        if payload.device_id not in symptoms_by_device:
+            symptoms_by_device[payload.device_id] = await get_symptom_context(payload.device_id)
+
+    # Concurrently, so the readings share model inference batches
+    items = await asyncio.gather(*(
+        _assess_reading(payload, request, last_known, symptoms_by_device[payload.device_id])
+        for payload in payloads
+    ))
+    doc_ids = await save_sensor_readings(items, ack, [payload.recorded_at for payload in payloads])
+
+    return {"status": _ingest_status(ack), "count": len(doc_ids), "ids": doc_ids}
+
+
+def _ingest_status(ack: str | None) -> str:
+    return "accepted" if (ack or INGEST_ACK_MODE) == "enqueue" else "success"
 
 
 # ---------------------------------------------------------------------------
@@ -96,8 +249,6 @@ async def get_aqi(request: Request, latitude: float = None, longitude: float = N
         request=request,
         last_known=last_known,
     )
-    if aqi_info.get("source") == "open-meteo":
-        await save_aqi_cache(aqi_info)
     return aqi_info
 
 
@@ -105,43 +256,44 @@ async def get_aqi(request: Request, latitude: float = None, longitude: float = N
 # Forecast endpoint — AI prevention feature
 # ---------------------------------------------------------------------------
 
-@app.get("/forecast", summary="6 hour air quality forecast with risk trajectory")
-async def get_forecast(latitude: float = None, longitude: float = None):
+@app.get("/forecast", summary="Air quality forecast with risk trajectory")
+async def get_forecast(
+    latitude: float = None,
+    longitude: float = None,
+    device_id: str = None,
+    hours: int = 6,
+):
     """
-    Fetches 6 hour AQI forecast and runs each hour through the risk engine.
+    Fetches the hourly AQI forecast and runs each hour through the risk engine.
     Returns a risk trajectory — improving, stable, or worsening.
     This is prevention not reaction: act before conditions deteriorate.
+    hours is the horizon from the current hour: 6 (default), 12, 24 or 48.
+    With device_id, temperature/humidity (and, if sent, coordinates) come
+    from that device's latest reading instead of the fleet's newest.
     """
-    lat = latitude or DEFAULT_LAT
-    lon = longitude or DEFAULT_LON
+    if hours not in FORECAST_HORIZONS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"hours must be one of {', '.join(map(str, FORECAST_HORIZONS))}.",
+        )
+
+    # Get current reading for temperature and humidity context
+    current = await get_latest_sensor_reading(device_id)
+    readings = current["sensor_readings"] if current else {}
+
+    lat = latitude or (device_id and readings.get("latitude")) or DEFAULT_LAT
+    lon = longitude or (device_id and readings.get("longitude")) or DEFAULT_LON
 
-    forecast_data = await fetch_aqi_forecast(lat, lon)
+    forecast = await fetch_aqi_forecast(lat, lon)
 
-    if not forecast_data:
+    if not forecast:
         raise HTTPException(status_code=503, detail="Forecast data unavailable.")
 
-    # Get current reading for temperature and humidity context
-    current = await get_latest_sensor_reading()
-    current_temp     = current["sensor_readings"].get("temperature", 30) if current else 30
-    current_humidity = current["sensor_readings"].get("humidity", 70)    if current else 70
-
-    forecast_risk = []
-    for hour in forecast_data:
-        if hour["aqi"] is not None:
-            risk = assess_environment_risk(
-                temperature=current_temp,
-                humidity=current_humidity,
-                aqi=hour["aqi"],
-            )
-            forecast_risk.append({
-                "time":             hour["time"],
-                "aqi":              hour["aqi"],
-                "pm2_5":            hour["pm2_5"],
-                "pm10":             hour["pm10"],
-                "health_score":     risk["health_score"],
-                "overall_status":   risk["overall_status"],
-                "respiratory_risk": risk["respiratory_risk"],
-            })
+    current_temp     = readings.get("temperature", 30)
+    current_humidity = readings.get("humidity", 70)
+
+    scored = _scored_forecast(forecast, current_temp, current_humidity)
+    forecast_risk = forecast_window({"hours": scored}, hours)
 
     # Determine trajectory from first to last hour
     trajectory = "Stable"
@@ -153,13 +305,50 @@ async def get_forecast(latitude: float = None, longitude: float = None):
             trajectory = "Worsening"
 
     return {
-        "trajectory":     trajectory,
-        "forecast_hours": forecast_risk,
-        "coordinates":    {"latitude": lat, "longitude": lon},
-        "generated_at":   datetime.now(timezone.utc).isoformat(),
+        "trajectory":          trajectory,
+        "horizon_hours":       hours,
+        "forecast_hours":      forecast_risk,
+        "coordinates":         {"latitude": lat, "longitude": lon},
+        "forecast_fetched_at": forecast["fetched_at"],
+        "generated_at":        datetime.now(timezone.utc).isoformat(),
     }
 
 
+def _scored_forecast(forecast: dict, temperature: float, humidity: float) -> list:
+    """
+    Every hour of a cached forecast run through the risk engine once per
+    (forecast, temperature, humidity, rule set) — each horizon is a slice of this.
+    """
+    rules = rules_for(forecast["latitude"], forecast["longitude"])
+    key = (forecast["cell"], forecast["fetched_at"], temperature, humidity, rules)
+    scored = _forecast_risk_cache.get(key)
+    CACHE_LOOKUPS.inc(cache="forecast_risk", result="miss" if scored is None else "hit")
+    if scored is not None:
+        return scored
+
+    hours = [hour for hour in forecast["hours"] if hour["aqi"] is not None]
+    risk = assess_environment_risk_batch(
+        temperature=[temperature] * len(hours),
+        humidity=[humidity] * len(hours),
+        aqi=[hour["aqi"] for hour in hours],
+        rules=rules,
+    )
+    scored = [
+        {
+            "time":             hour["time"],
+            "aqi":              hour["aqi"],
+            "pm2_5":            hour["pm2_5"],
+            "pm10":             hour["pm10"],
+            "health_score":     int(risk["health_score"][i]),
+            "overall_status":   risk["overall_status"][i],
+            "respiratory_risk": risk["respiratory_risk"][i],
+        }
+        for i, hour in enumerate(hours)
+    ]
+    _forecast_risk_cache.set(key, scored)
+    return scored
+
+
 # ---------------------------------------------------------------------------
 # Symptom diary
 # ---------------------------------------------------------------------------
@@ -185,20 +374,82 @@ async def label_outcome(entry: OutcomeLabel):
         had_episode=entry.had_episode,
         notes=entry.notes,
     )
+    if doc_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Reading {entry.reading_id} not found — it may have been archived.",
+        )
     return {"status": "success", "id": doc_id}
 
 
 @app.get("/training-data", summary="Export labelled records for XGBoost training")
-async def export_training_data():
+async def export_training_data(
+    format: Literal["json", "ndjson", "csv"] = "json",
+    since: datetime = None,
+    after_id: int = 0,
+    limit: int = None,
+):
     """
-    Returns all readings that have been labelled with outcomes.
+    Streams all readings that have been labelled with outcomes.
     This is the dataset the XGBoost model trains on.
+    Rows are written as they are read, oldest first, so the export is never
+    truncated and never built in memory.
+        format:   json (default), ndjson or csv
+        since:    only labels recorded after this time — for incremental pulls
+        after_id: resume after this reading id
+        limit:    stop after this many records
     """
-    records = await get_training_data(limit=500)
-    return {
-        "count":   len(records),
-        "records": records,
+    if since is not None:
+        since = _as_utc(since).isoformat()
+
+    records = _limited(iter_training_data(after_id=after_id, since=since), limit)
+    media_types = {
+        "json":   "application/json",
+        "ndjson": "application/x-ndjson",
+        "csv":    "text/csv",
+    }
+    writers = {
+        "json":   _training_json,
+        "ndjson": _training_ndjson,
+        "csv":    _training_csv,
     }
+    return StreamingResponse(writers[format](records), media_type=media_types[format])
+
+
+async def _limited(records: AsyncIterator[dict], limit: int | None) -> AsyncIterator[dict]:
+    count = 0
+    async for record in records:
+        if limit is not None and count >= limit:
+            return
+        count += 1
+        yield record
+
+
+async def _training_json(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    # Same {"records": [...], "count": n} body as before, written incrementally
+    yield '{"records": ['
+    count = 0
+    async for record in records:
+        yield ("," if count else "") + json.dumps(record)
+        count += 1
+    yield f'], "count": {count}}}'
+
+
+async def _training_ndjson(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for record in records:
+        yield json.dumps(record) + "\n"
+
+
+async def _training_csv(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=TRAINING_FIELDS)
+    writer.writeheader()
+    async for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
 
 
 # ---------------------------------------------------------------------------
@@ -207,10 +458,10 @@ async def export_training_data():
 
 @app.get("/latest-data", summary="Full latest record for the dashboard")
 async def get_latest_data():
-    doc = await get_latest_sensor_reading()
-    if not doc:
+    body = await get_latest_sensor_reading_json()
+    if body is None:
         raise HTTPException(status_code=404, detail="No sensor data received yet.")
-    return doc
+    return _json_response(body)
 
 
 @app.get("/risk-level", summary="Lightweight risk summary for frequent polling")
@@ -218,6 +469,10 @@ async def get_risk_level():
     doc = await get_latest_sensor_reading()
     if not doc:
         raise HTTPException(status_code=404, detail="No data yet.")
+    return _risk_summary(doc)
+
+
+def _risk_summary(doc: dict) -> dict:
     assessment = doc.get("health_assessment", {})
     aqi_info   = doc.get("aqi_info", {})
     return {
@@ -230,12 +485,185 @@ async def get_risk_level():
     }
 
 
+@app.get("/stream/risk", summary="Live push of every new reading (server-sent events)")
+async def stream_risk(request: Request, device_id: str = None):
+    """
+    Replaces polling /latest-data and /risk-level. Sends the current latest
+    reading on connect, then one `reading` event per stored reading with the
+    same body as /latest-data. Pass device_id to follow a single device.
+    """
+    try:
+        subscriber = subscribe(device_id)
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many live connections. Poll /risk-level instead.")
+
+    # Subscribed first so nothing stored during the lookup is missed; until
+    # the stream owns the subscriber, a failed or cancelled lookup must drop it
+    try:
+        latest = await get_latest_sensor_reading(device_id)
+    except BaseException:
+        unsubscribe(subscriber)
+        raise
+
+    return StreamingResponse(
+        sse_events(subscriber, request, initial=latest),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/history", summary="Trend data for dashboard charts")
-async def get_history():
-    readings = await get_reading_history(limit=50)
-    return {"readings": readings}
+async def get_history(
+    bucket: Literal["1m", "5m", "15m", "1h", "6h", "1d"] = None,
+    start: datetime = Query(default=None, alias="from"),
+    end: datetime = Query(default=None, alias="to"),
+    limit: int = Query(default=50, ge=1, le=1000),
+):
+    """
+    Without `bucket`: the last `limit` raw readings, as before.
+    With `bucket`: min/avg/max of temperature, humidity, AQI and health score
+    per bucket between `from` and `to` (default: the last 288 buckets up to now).
+    Hour-aligned buckets (1h, 6h, 1d) are served from the rollup tables and
+    also carry per-status and per-alert counts.
+    """
+    return _json_response(dumps(await _history(bucket, start, end, limit)))
+
+
+async def _history(
+    bucket: str | None,
+    start: datetime | None,
+    end: datetime | None,
+    limit: int,
+    device_id: str | None = None,
+) -> dict:
+    if bucket is None:
+        readings = await get_reading_history(limit=limit, device_id=device_id)
+        return {"readings": readings}
+
+    bucket_seconds = HISTORY_BUCKETS[bucket]
+    # `to` is exclusive, and readings are bucketed by whole-second epoch:
+    # round up so the default end (now) keeps readings from this second
+    if end is None:
+        end_epoch = math.floor(datetime.now(timezone.utc).timestamp()) + 1
+    else:
+        end_epoch = math.ceil(_as_utc(end).timestamp())
+    start_epoch = (
+        int(_as_utc(start).timestamp()) if start
+        else end_epoch - bucket_seconds * HISTORY_DEFAULT_BUCKETS
+    )
+    if start_epoch >= end_epoch:
+        raise HTTPException(status_code=422, detail="'from' must be before 'to'.")
+    if (end_epoch - start_epoch) / bucket_seconds > HISTORY_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Range spans more than {HISTORY_MAX_BUCKETS} buckets — use a larger bucket.",
+        )
+
+    if bucket_seconds % 3600 == 0:
+        # Hour-aligned buckets come from the rollup tables, not raw readings
+        buckets = await get_rollup_history(start_epoch, end_epoch, bucket_seconds, device_id)
+    else:
+        buckets = await get_bucketed_history(start_epoch, end_epoch, bucket_seconds, device_id)
+    return {
+        "bucket":  bucket,
+        "from":    datetime.fromtimestamp(start_epoch, timezone.utc).isoformat(),
+        "to":      datetime.fromtimestamp(end_epoch, timezone.utc).isoformat(),
+        "buckets": buckets,
+    }
+
+
+def _json_response(body: bytes) -> Response:
+    """Already-encoded JSON, sent as is — skips FastAPI's jsonable_encoder pass."""
+    return Response(content=body, media_type="application/json")
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Query datetimes without an offset are taken as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+# ---------------------------------------------------------------------------
+# Devices — one deployment, many ESP32s
+# ---------------------------------------------------------------------------
+
+@app.get("/devices", summary="Every device that has reported or been registered")
+async def get_devices():
+    return {"devices": await list_devices()}
+
+
+@app.put("/devices/{device_id}", summary="Tie a device to a user")
+async def put_device(device_id: str, registration: DeviceRegistration):
+    """
+    Readings from this device are scored against the symptom diary of
+    user_id from now on. Unregistered devices use the latest entry from anyone.
+    """
+    return await register_device(device_id, user_id=registration.user_id, label=registration.label)
+
+
+@app.get("/devices/{device_id}/latest-data", summary="Full latest record for one device")
+async def get_device_latest_data(device_id: str):
+    body = await get_latest_sensor_reading_json(device_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"No sensor data received yet from {device_id}.")
+    return _json_response(body)
+
+
+@app.get("/devices/{device_id}/risk-level", summary="Lightweight risk summary for one device")
+async def get_device_risk_level(device_id: str):
+    doc = await get_latest_sensor_reading(device_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail=f"No data yet from {device_id}.")
+    return _risk_summary(doc)
+
+
+@app.get("/devices/{device_id}/history", summary="Trend data for one device")
+async def get_device_history(
+    device_id: str,
+    bucket: Literal["1m", "5m", "15m", "1h", "6h", "1d"] = None,
+    start: datetime = Query(default=None, alias="from"),
+    end: datetime = Query(default=None, alias="to"),
+    limit: int = Query(default=50, ge=1, le=1000),
+):
+    """Same parameters and body as /history, restricted to one device."""
+    if await get_device(device_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown device {device_id}.")
+    return _json_response(dumps(await _history(bucket, start, end, limit, device_id)))
+
+
+# ---------------------------------------------------------------------------
+# Risk rules
+# ---------------------------------------------------------------------------
+
+@app.get("/risk-rules", summary="Active risk rule version and regions")
+async def get_risk_rules():
+    return rules_info()
+
+
+@app.post("/risk-rules/reload", summary="Recompile the risk rules file")
+async def post_risk_rules_reload():
+    """
+    Reads RISK_RULES_PATH again and swaps the compiled rules in for every
+    request that starts after this one. An invalid file is rejected with
+    422 and the current rules stay active.
+    """
+    try:
+        return reload_rules()
+    except RuleError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health", summary="Service health check")
 async def health_check():
-    return {"status": "ok", "service": "EcoBreathe AI"}
\ No newline at end of file
+    return {
+        "status":     "ok",
+        "service":    "EcoBreathe AI",
+        "upstreams":  upstream_health(),
+        "risk_model": model_info(),
+    }
\ No newline at end of file
@@ -0,0 +1,177 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------------
+# Prometheus text-format metrics
+# ---------------------------------------------------------------------------
+# A few counters and histograms rendered in the Prometheus exposition
+# format at /metrics. Everything is updated from the event loop, so plain
+# dicts are enough — no locks, no client library.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry: list = []
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}   # key -> [per-bucket counts..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                le = 'le="' + (bound if bound == "+Inf" else f"{bound:g}") + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ecobreathe_http_request_duration_seconds",
+    "Time from request to response headers, per endpoint.",
+    ("method", "route", "status"),
+)
+SENSOR_STAGE_SECONDS = Histogram(
+    "ecobreathe_sensor_data_stage_seconds",
+    "Time spent in each stage of storing a reading.",
+    ("stage",),
+)
+AQI_RESOLUTIONS = Counter(
+    "ecobreathe_aqi_resolutions_total",
+    "AQI values handed to the risk engine, by source and coordinate source.",
+    ("source", "coordinate_source"),
+)
+AQI_CHAIN_SKIPS = Counter(
+    "ecobreathe_aqi_chain_skips_total",
+    "Fallback-chain steps that gave no result, by step and reason.",
+    ("step", "outcome"),
+)
+FLAGGED_DEVICE_READINGS = Counter(
+    "ecobreathe_flagged_device_readings_total",
+    "Device AQI values rejected as sensor faults.",
+)
+UPSTREAM_ERRORS = Counter(
+    "ecobreathe_upstream_errors_total",
+    "Failed upstream calls, by upstream and kind (timeout or error).",
+    ("upstream", "kind"),
+)
+RISK_SCORER = Counter(
+    "ecobreathe_risk_scorer_total",
+    "Readings scored, by scorer (model or rules) and why the rules were used.",
+    ("scorer", "reason"),
+)
+CACHE_LOOKUPS = Counter(
+    "ecobreathe_cache_lookups_total",
+    "Cache lookups, by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+
+
+# ---------------------------------------------------------------------------
+# ASGI middleware
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request up to its response headers — for streamed
+    responses (SSE, exports) that is time to first byte, not stream length.
+    Labelled with the route template, so path parameters don't explode
+    the series count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            observe(500)   # no-op unless the app failed before responding
@@ -1,5 +1,20 @@
+import asyncio
+import json
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from pathlib import Path
 from typing import Optional
 
+import numpy as np
+
+from log import get_logger
+from metrics import RISK_SCORER
+
+log = get_logger("risk_engine")
+
+RISK_RULES_PATH = os.getenv("RISK_RULES_PATH", str(Path(__file__).with_name("risk_rules.json")))
+
 SEVERITY_WEIGHTS = {
     "mild":     1,
     "moderate": 2,
@@ -19,135 +34,593 @@ def _score_symptoms(symptoms: dict) -> int:
     return min(9, total)
 
 
+# ----------------------------------------------------------------------
+# Rule sets — thresholds, penalties and advice from risk_rules.json
+# ----------------------------------------------------------------------
+# The file holds a versioned default rule set plus optional regions, each
+# with a lat/lon bounding box and the sections it overrides:
+#     "regions": {"sahel": {"bounds": [south, west, north, east],
+#                           "rules": {"heat": {...}}}}
+# Every rule set is compiled once into sorted cut-off tuples (for bisect)
+# and numpy arrays (for the batch path), and every combination of tiers is
+# mapped ahead of time to its alert and recommendation tuples — scoring a
+# reading is a few bisects and tuple lookups. Alert names should stay those
+# in database.ALERT_FLAGS so rollup alert counts keep working.
+#
+# reload_rules() compiles the file again and swaps it in with a single
+# assignment; a bad file raises RuleError and the old rules stay active.
+
+
+class RuleError(ValueError):
+    pass
+
+
+class RuleSet:
+    """One compiled rule set. Read-only once built."""
+
+    __slots__ = (
+        "version", "region",
+        "heat_temperatures", "heat_humidities", "heat_tiers", "heat_penalties",
+        "aqi_cutoffs", "respiratory_tiers", "aqi_penalties",
+        "amplifier_humidity", "amplifier_aqi", "amplifier_penalty",
+        "symptom_penalty", "symptom_min_scores", "asthma_tiers", "symptom_fallback",
+        "elevated_heat", "elevated_respiratory",
+        "status_cutoffs", "status_bands",
+        "advice", "arrays",
+    )
+
+    def __init__(self, rules: dict, version: str, region: str):
+        self.version = version
+        self.region = region
+        try:
+            self._compile_heat(rules["heat"])
+            self._compile_aqi(rules["aqi"], rules["humidity_amplifier"])
+            self._compile_symptoms(rules["symptoms"])
+            self._compile_status(rules["status"])
+            self._compile_advice(rules)
+        except (KeyError, TypeError, ValueError) as e:
+            if isinstance(e, RuleError):
+                raise
+            raise RuleError(f"{region}: malformed rules ({type(e).__name__}: {e})") from e
+
+        self.arrays = {
+            "heat_temperatures": np.array(self.heat_temperatures, dtype=float),
+            "heat_humidities":   np.array(self.heat_humidities, dtype=float),
+            "heat_tiers":        np.array(self.heat_tiers, dtype=object),
+            "heat_penalties":    np.array(self.heat_penalties, dtype=np.int64),
+            "aqi_cutoffs":       np.array(self.aqi_cutoffs, dtype=float),
+            "respiratory_tiers": np.array(self.respiratory_tiers, dtype=object),
+            "aqi_penalties":     np.array(self.aqi_penalties, dtype=np.int64),
+            "symptom_min_scores": np.array(self.symptom_min_scores, dtype=np.int64),
+            "asthma_tiers":      np.array(self.asthma_tiers, dtype=object),
+            "symptom_fallback":  np.array(self.symptom_fallback, dtype=np.int64),
+            "status_cutoffs":    np.array(self.status_cutoffs, dtype=np.int64),
+            "status_bands":      np.array(self.status_bands, dtype=object),
+        }
+
+    # Tier 0 of every table is the "nothing matched" tier, so a bisect
+    # count of cut-offs passed is the tier index directly.
+
+    def _compile_heat(self, heat: dict):
+        tiers = heat["tiers"]
+        self.heat_temperatures = tuple(_number(t["above_temperature"]) for t in tiers)
+        self.heat_humidities   = tuple(_number(t["above_humidity"]) for t in tiers)
+        _require_sorted(self.region, "heat temperatures", self.heat_temperatures)
+        _require_sorted(self.region, "heat humidities", self.heat_humidities)
+        self.heat_tiers     = (heat["default_tier"], *(t["tier"] for t in tiers))
+        self.heat_penalties = (0, *(int(t["penalty"]) for t in tiers))
+
+    def _compile_aqi(self, aqi: dict, amplifier: dict):
+        tiers = aqi["tiers"]
+        self.aqi_cutoffs = tuple(_number(t["above"]) for t in tiers)
+        _require_sorted(self.region, "AQI cut-offs", self.aqi_cutoffs)
+        # Index 0 is unknown AQI, 1 the default tier, then one per cut-off passed
+        self.respiratory_tiers = (aqi["unknown"]["tier"], aqi["default_tier"], *(t["tier"] for t in tiers))
+        self.aqi_penalties     = (0, 0, *(int(t["penalty"]) for t in tiers))
+        self.amplifier_humidity = _number(amplifier["above_humidity"])
+        self.amplifier_aqi      = _number(amplifier["above_aqi"])
+        self.amplifier_penalty  = int(amplifier["penalty"])
+
+    def _compile_symptoms(self, symptoms: dict):
+        tiers = symptoms["tiers"]
+        self.symptom_penalty    = int(symptoms["penalty_per_point"])
+        self.symptom_min_scores = tuple(int(t["min_score"]) for t in tiers)
+        _require_sorted(self.region, "symptom scores", self.symptom_min_scores)
+        self.asthma_tiers = (symptoms["default_tier"], *(t["tier"] for t in tiers))
+
+        # Tiers that need an elevated environment fall back to the highest lower tier that doesn't
+        fallback = [0]
+        for level, tier in enumerate(tiers, start=1):
+            fallback.append(fallback[level - 1] if tier.get("requires_elevated_environment") else level)
+        self.symptom_fallback = tuple(fallback)
+
+        elevated = symptoms["elevated_environment"]
+        self.elevated_heat        = _tier_index(self.region, self.heat_tiers, elevated["heat_tier"])
+        self.elevated_respiratory = _tier_index(self.region, self.respiratory_tiers, elevated["respiratory_tier"])
+
+    def _compile_status(self, status: dict):
+        bands = sorted(status["bands"], key=lambda band: band["min_score"])
+        self.status_bands   = tuple(band["status"] for band in bands)
+        self.status_cutoffs = tuple(int(band["min_score"]) for band in bands[1:])
+
+    def _compile_advice(self, rules: dict):
+        """advice[heat][respiratory][amplified][symptom level] -> (alerts, recommendations)."""
+        heat_tiers    = ({}, *rules["heat"]["tiers"])
+        aqi_tiers     = (rules["aqi"]["unknown"], {}, *rules["aqi"]["tiers"])
+        amplifier     = rules["humidity_amplifier"]
+        symptom_tiers = ({}, *rules["symptoms"]["tiers"])
+        optimal       = (rules["status"]["optimal_recommendation"],)
+
+        def advice(*parts: dict) -> tuple[tuple, tuple]:
+            alerts = tuple(sys.intern(p["alert"]) for p in parts if p.get("alert"))
+            recommendations = tuple(sys.intern(p["recommendation"]) for p in parts if p.get("recommendation"))
+            return alerts, recommendations or optimal
+
+        self.advice = tuple(
+            tuple(
+                tuple(
+                    tuple(
+                        advice(heat, aqi, amplifier if amplified else {}, symptom)
+                        for symptom in symptom_tiers
+                    )
+                    for amplified in (False, True)
+                )
+                for aqi in aqi_tiers
+            )
+            for heat in heat_tiers
+        )
+
+
+def _number(value) -> int | float:
+    """Cut-offs keep the type they were written in: int-to-int compares are the cheapest."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"expected a number, got {value!r}")
+    return value
+
+
+def _require_sorted(region: str, what: str, values: tuple):
+    if list(values) != sorted(values):
+        raise RuleError(f"{region}: {what} must be in ascending order, got {list(values)}")
+
+
+def _tier_index(region: str, tiers: tuple, name: str) -> int:
+    if name not in tiers:
+        raise RuleError(f"{region}: unknown tier {name!r}, expected one of {list(tiers)}")
+    return tiers.index(name)
+
+
+class CompiledRules:
+    def __init__(self, config: dict, path: str):
+        if not isinstance(config, dict) or "version" not in config or "rules" not in config:
+            raise RuleError("rules file needs 'version' and 'rules'")
+        self.path = path
+        self.version = str(config["version"])
+        self.default = RuleSet(config["rules"], self.version, "default")
+        self.regions = []   # (name, south, west, north, east, RuleSet), first match wins
+        for name, region in config.get("regions", {}).items():
+            try:
+                south, west, north, east = (float(v) for v in region["bounds"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise RuleError(f"{name}: bounds must be [south, west, north, east]") from e
+            rules = {**config["rules"], **region.get("rules", {})}
+            self.regions.append((name, south, west, north, east, RuleSet(rules, self.version, name)))
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "path":    self.path,
+            "regions": [
+                {"region": name, "bounds": [south, west, north, east]}
+                for name, south, west, north, east, _ in self.regions
+            ],
+        }
+
+
+def _load(path: str) -> CompiledRules:
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuleError(f"cannot read {path}: {e}") from e
+    return CompiledRules(config, path)
+
+
+_rules = _load(RISK_RULES_PATH)
+
+
+def reload_rules(path: str | None = None) -> dict:
+    """Compiles the rules file again and makes it active. Raises RuleError and keeps the old rules if it is invalid."""
+    global _rules
+    _rules = _load(path or _rules.path)
+    return _rules.info()
+
+
+def rules_info() -> dict:
+    return _rules.info()
+
+
+def rules_for(latitude: float | None = None, longitude: float | None = None) -> RuleSet:
+    """The rule set of the first region containing the point, else the default."""
+    rules = _rules
+    if latitude is not None and longitude is not None:
+        for _, south, west, north, east, ruleset in rules.regions:
+            if south <= latitude <= north and west <= longitude <= east:
+                return ruleset
+    return rules.default
+
+
+# ----------------------------------------------------------------------
+# Scoring
+# ----------------------------------------------------------------------
+
 def assess_environment_risk(
     temperature: float,
     humidity: float,
     aqi: int | None,
     symptoms: Optional[dict] = None,
+    rules: RuleSet | None = None,
 ) -> dict:
+    """
+    Scores one reading. rules defaults to the default rule set; pass
+    rules_for(lat, lon) to apply a region's. active_alerts and
+    recommendations are shared tuples — do not modify them.
+    """
+    r = rules or _rules.default
+    heat, respiratory, amplified, level, final_score = _tier_indices(r, temperature, humidity, aqi, symptoms)
+    alerts, recommendations = r.advice[heat][respiratory][amplified][level]
 
-    score = 100
-    recommendations = []
-    alerts = []
+    return {
+        "health_score":       final_score,
+        "overall_status":     r.status_bands[bisect_right(r.status_cutoffs, final_score)],
+        "heat_stress_risk":   r.heat_tiers[heat],
+        "respiratory_risk":   r.respiratory_tiers[respiratory],
+        "asthma_attack_risk": r.asthma_tiers[level],
+        "active_alerts":      alerts,
+        "recommendations":    recommendations,
+    }
 
-    # ------------------------------------------------------------------
-    # Stage 1: Heat Stress
-    # ------------------------------------------------------------------
-    if temperature > 32 and humidity > 70:
-        heat_risk = "High"
-        score -= 40
-        alerts.append("High Heat Stress")
-        recommendations.append(
-            "Hydrate immediately and avoid outdoor physical activity."
-        )
-    elif temperature > 29 and humidity > 60:
-        heat_risk = "Moderate"
-        score -= 15
-        recommendations.append(
-            "Drink water regularly and take breaks in cool areas."
-        )
-    else:
-        heat_risk = "Low"
 
-    # ------------------------------------------------------------------
-    # Stage 2: Respiratory / AQI
-    # ------------------------------------------------------------------
+def _tier_indices(
+    r: RuleSet,
+    temperature: float,
+    humidity: float,
+    aqi: int | None,
+    symptoms: Optional[dict],
+) -> tuple[int, int, bool, int, int]:
+    """(heat, respiratory, amplified, symptom level, health score) — indices into r's tier tables and r.advice."""
+    # Stage 1: Heat Stress — a tier needs both its temperature and humidity passed
+    heat = bisect_left(r.heat_temperatures, temperature)
+    humid = bisect_left(r.heat_humidities, humidity)
+    if humid < heat:
+        heat = humid
+
+    # Stage 2: Respiratory / AQI — high humidity makes particulate matter worse
     if aqi is None:
-        respiratory_risk = "Unknown"
-        recommendations.append(
-            "Air quality data is currently unavailable. Take precautions if outdoors."
-        )
-    elif aqi > 200:
-        respiratory_risk = "Critical"
-        score -= 45
-        alerts.append("Critical Air Quality")
-        recommendations.append(
-            "Air quality is hazardous. Stay indoors, keep windows closed, and use an air purifier."
-        )
-    elif aqi > 150:
-        respiratory_risk = "High"
-        score -= 35
-        alerts.append("Poor Air Quality")
-        recommendations.append(
-            "Unhealthy air quality. Avoid all outdoor activity, especially for asthma patients."
-        )
-    elif aqi > 100:
-        respiratory_risk = "Moderate"
-        score -= 20
-        recommendations.append(
-            "Air quality is unhealthy for sensitive groups. Asthma patients should limit outdoor exposure."
-        )
-    elif aqi > 50:
-        respiratory_risk = "Low-Moderate"
-        score -= 10
-        recommendations.append(
-            "Moderate air quality. Sensitive individuals should monitor symptoms."
-        )
+        respiratory = 0
+        amplified = False
     else:
-        respiratory_risk = "Low"
-
-    # Humidity interaction — high humidity makes particulate matter worse
-    # Only applies when air quality is already a concern
-    if humidity > 75 and aqi is not None and aqi > 100:
-        score -= 5
-        recommendations.append(
-            "High humidity is amplifying air quality risk. Ensure good indoor ventilation."
-        )
+        respiratory = bisect_left(r.aqi_cutoffs, aqi) + 1
+        amplified = humidity > r.amplifier_humidity and aqi > r.amplifier_aqi
 
-    # ------------------------------------------------------------------
-    # Stage 3: Symptom Scoring
-    # ------------------------------------------------------------------
-    asthma_attack_risk = "Low"
+    score = 100 - r.heat_penalties[heat] - r.aqi_penalties[respiratory]
+    if amplified:
+        score -= r.amplifier_penalty
 
+    # Stage 3: Symptom Scoring
+    level = 0
     if symptoms:
         symptom_score = _score_symptoms(symptoms)
-        score -= symptom_score * 3
+        score -= symptom_score * r.symptom_penalty
+        level = bisect_right(r.symptom_min_scores, symptom_score)
+        if heat < r.elevated_heat and respiratory < r.elevated_respiratory:
+            level = r.symptom_fallback[level]
 
-        env_is_elevated = (
-            heat_risk in ("Moderate", "High") or
-            respiratory_risk in ("Moderate", "High", "Critical", "Low-Moderate")
-        )
+    # Stage 4: Aggregation
+    return heat, respiratory, amplified, level, max(0, score)
 
-        if symptom_score >= 6 and env_is_elevated:
-            asthma_attack_risk = "High"
-            alerts.append("Elevated Asthma Attack Risk")
-            recommendations.append(
-                "Your reported symptoms combined with current conditions are concerning. "
-                "Use your reliever inhaler if prescribed and move indoors."
-            )
-        elif symptom_score >= 3:
-            asthma_attack_risk = "Moderate"
-            recommendations.append(
-                "Noticeable symptoms reported. Reduce physical exertion and monitor closely."
-            )
-        elif symptom_score > 0:
-            recommendations.append(
-                "Mild symptoms noted. Continue monitoring how you feel."
-            )
 
-    # ------------------------------------------------------------------
-    # Stage 4: Aggregation
-    # ------------------------------------------------------------------
-    final_score = max(0, score)
-
-    if final_score >= 85:
-        overall_status = "Safe"
-    elif final_score >= 60:
-        overall_status = "Caution"
-    elif final_score >= 35:
-        overall_status = "Unsafe"
+# ----------------------------------------------------------------------
+# Batch scoring — vectorised equivalent of assess_environment_risk
+# ----------------------------------------------------------------------
+
+def assess_environment_risk_batch(
+    temperature,
+    humidity,
+    aqi,
+    symptom_scores=None,
+    rules: RuleSet | None = None,
+) -> dict:
+    """
+    Scores many readings at once with the same rules as assess_environment_risk.
+    aqi may contain None / NaN for unknown air quality.
+    symptom_scores are _score_symptoms() results per reading (0 or None = no symptoms).
+    Returns columns: health_score, overall_status, heat_stress_risk,
+    respiratory_risk, asthma_attack_risk — one entry per reading.
+    """
+    r = rules or _rules.default
+    a = r.arrays
+    temperature = np.asarray(temperature, dtype=float)
+    humidity    = np.asarray(humidity, dtype=float)
+    aqi         = np.asarray(aqi, dtype=float)
+    if symptom_scores is None:
+        symptoms = np.zeros(temperature.shape, dtype=np.int64)
     else:
-        overall_status = "Dangerous"
+        symptoms = np.nan_to_num(np.asarray(symptom_scores, dtype=float)).astype(np.int64)
+
+    # Stage 1: Heat Stress
+    heat_idx = np.minimum(
+        np.searchsorted(a["heat_temperatures"], temperature),
+        np.searchsorted(a["heat_humidities"], humidity),
+    )
+    score = 100 - a["heat_penalties"][heat_idx]
+
+    # Stage 2: Respiratory / AQI — index 0 is Unknown, then one tier per cut-off passed
+    known    = ~np.isnan(aqi)
+    resp_idx = np.where(known, np.searchsorted(a["aqi_cutoffs"], np.where(known, aqi, 0)) + 1, 0)
+    score -= a["aqi_penalties"][resp_idx]
+    amplified = known & (humidity > r.amplifier_humidity) & (np.where(known, aqi, 0) > r.amplifier_aqi)
+    score -= np.where(amplified, r.amplifier_penalty, 0)
 
-    if not recommendations:
-        recommendations = ["Conditions are optimal. Safe for all activities."]
+    # Stage 3: Symptom Scoring
+    score -= symptoms * r.symptom_penalty
+    env_is_elevated = (heat_idx >= r.elevated_heat) | (resp_idx >= r.elevated_respiratory)
+    level = np.searchsorted(a["symptom_min_scores"], symptoms, side="right")
+    asthma_idx = np.where(env_is_elevated, level, a["symptom_fallback"][level])
+
+    # Stage 4: Aggregation
+    final_score = np.maximum(score, 0)
+    status_idx  = np.searchsorted(a["status_cutoffs"], final_score, side="right")
 
     return {
         "health_score":       final_score,
-        "overall_status":     overall_status,
-        "heat_stress_risk":   heat_risk,
-        "respiratory_risk":   respiratory_risk,
-        "asthma_attack_risk": asthma_attack_risk,
-        "active_alerts":      alerts,
-        "recommendations":    recommendations,
-    }
\ No newline at end of file
+        "overall_status":     a["status_bands"][status_idx],
+        "heat_stress_risk":   a["heat_tiers"][heat_idx],
+        "respiratory_risk":   a["respiratory_tiers"][resp_idx],
+        "asthma_attack_risk": a["asthma_tiers"][asthma_idx],
+    }
+
+
+# ----------------------------------------------------------------------
+# Model scoring — XGBoost tree ensemble trained on /outcome labels
+# ----------------------------------------------------------------------
+# With MODEL_PATH pointing at a model saved by XGBoost's
+# Booster.save_model("model.json"), load_model() (called from the app
+# lifespan) flattens every tree into numpy arrays and the model predicts
+# the probability of an asthma episode for each reading. That probability
+# sets asthma_attack_risk, and the alerts and recommendations are those the
+# rules give for that tier; everything else still comes from the rules.
+#
+# Concurrent readings are micro-batched: everything submitted during one
+# event-loop iteration (or within MODEL_BATCH_WINDOW_MS, if set — the
+# loop's timers are only millisecond-precise) goes through one vectorised
+# predict on the event loop, tens of microseconds for a small ensemble.
+# A reading whose prediction is not back within MODEL_LATENCY_BUDGET_MS —
+# or any reading when no model is loaded — keeps the rule engine's
+# assessment.
+
+MODEL_PATH                 = os.getenv("MODEL_PATH", "")
+MODEL_BATCH_MAX            = int(os.getenv("MODEL_BATCH_MAX", 64))
+MODEL_BATCH_WINDOW_MS      = float(os.getenv("MODEL_BATCH_WINDOW_MS", 0))
+MODEL_LATENCY_BUDGET_MS    = float(os.getenv("MODEL_LATENCY_BUDGET_MS", 1.0))
+MODEL_MODERATE_PROBABILITY = float(os.getenv("MODEL_MODERATE_PROBABILITY", 0.3))
+MODEL_HIGH_PROBABILITY     = float(os.getenv("MODEL_HIGH_PROBABILITY", 0.6))
+
+# Features the backend can compute at request time, by XGBoost feature name
+MODEL_FEATURES = ("temperature", "humidity", "aqi", "symptom_score")
+
+
+class ModelError(ValueError):
+    pass
+
+
+class TreeEnsemble:
+    """
+    An XGBoost gbtree model evaluated with numpy. All trees share flat node
+    arrays; a leaf points at itself, so stepping every (row, tree) pair
+    max_depth times lands each on its leaf. XGBoost compares in float32 and
+    sends a split left when x < threshold, or by default_left when missing.
+    """
+
+    def __init__(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as f:
+                learner = json.load(f)["learner"]
+            booster = learner["gradient_booster"]
+            if booster["name"] != "gbtree":
+                raise ModelError(f"unsupported booster {booster['name']!r}")
+            objective = learner["objective"]["name"]
+            if objective not in ("binary:logistic", "reg:logistic"):
+                raise ModelError(f"unsupported objective {objective!r}")
+            base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+            num_feature = int(learner["learner_model_param"]["num_feature"])
+            names = learner.get("feature_names") or list(MODEL_FEATURES[:num_feature])
+            trees = booster["model"]["trees"]
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            if isinstance(e, ModelError):
+                raise
+            raise ModelError(f"cannot load {path}: {type(e).__name__}: {e}") from e
+
+        unknown = [name for name in names if name not in MODEL_FEATURES]
+        if unknown:
+            raise ModelError(f"model needs features this backend does not compute: {unknown}")
+        if any(tree.get("categories_nodes") for tree in trees):
+            raise ModelError("categorical splits are not supported")
+
+        self.path = path
+        self.feature_names = tuple(names)
+        self.trees = len(trees)
+        self.base_margin = float(np.log(base_score / (1 - base_score)))
+
+        roots, left, right, feature, threshold, default_left = [], [], [], [], [], []
+        depth = 0
+        for tree in trees:
+            offset = len(left)
+            roots.append(offset)
+            for node, (l, r) in enumerate(zip(tree["left_children"], tree["right_children"])):
+                left.append(offset + l if l != -1 else offset + node)
+                right.append(offset + r if r != -1 else offset + node)
+            feature.extend(tree["split_indices"])
+            threshold.extend(tree["split_conditions"])   # holds the leaf value on leaves
+            default_left.extend(tree["default_left"])
+            depth = max(depth, _tree_depth(tree["left_children"], tree["right_children"]))
+
+        self.roots        = np.array(roots, dtype=np.int64)
+        self.left         = np.array(left, dtype=np.int64)
+        self.right        = np.array(right, dtype=np.int64)
+        self.feature      = np.array(feature, dtype=np.int64)
+        self.threshold    = np.array(threshold, dtype=np.float32)
+        self.default_left = np.array(default_left, dtype=bool)
+        self.depth        = depth
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Episode probability per row of an (n, len(feature_names)) matrix; NaN = missing."""
+        x = np.asarray(features, dtype=np.float32)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(x), self.trees))
+        for _ in range(self.depth):
+            value = x[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(value), self.default_left[nodes], value < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        margin = self.base_margin + self.threshold[nodes].sum(axis=1, dtype=np.float64)
+        return 1 / (1 + np.exp(-margin))
+
+    def info(self) -> dict:
+        return {"path": self.path, "trees": self.trees, "depth": self.depth, "features": list(self.feature_names)}
+
+
+def _tree_depth(left: list, right: list) -> int:
+    depth, level = 0, [0]
+    while True:
+        level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+class _Batcher:
+    """Collects concurrent predict requests and runs them as one matrix."""
+
+    def __init__(self, model: TreeEnsemble):
+        self.model = model
+        self.pending: list[tuple[tuple, asyncio.Future]] = []
+        self.flush_handle: asyncio.Handle | None = None
+
+    def submit(self, features: tuple) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((features, future))
+        if len(self.pending) >= MODEL_BATCH_MAX:
+            self.flush()
+        elif self.flush_handle is None:
+            if MODEL_BATCH_WINDOW_MS > 0:
+                self.flush_handle = loop.call_later(MODEL_BATCH_WINDOW_MS / 1000, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            probabilities = self.model.predict(np.array([features for features, _ in batch], dtype=np.float32))
+        except Exception as e:
+            log.error("model_predict_failed", extra={"batch": len(batch), "error": str(e)})
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), probability in zip(batch, probabilities):
+            if not future.done():
+                future.set_result(float(probability))
+
+    def close(self):
+        self.flush()
+
+
+_batcher: _Batcher | None = None
+
+
+def load_model(path: str = MODEL_PATH) -> dict | None:
+    """Loads the model at path (no-op when empty). Raises ModelError if it cannot be used."""
+    global _batcher
+    if not path:
+        return None
+    model = TreeEnsemble(path)
+    if _batcher is not None:
+        _batcher.close()
+    _batcher = _Batcher(model)
+    log.info("risk_model_loaded", extra=model.info())
+    return model.info()
+
+
+def unload_model():
+    global _batcher
+    if _batcher is not None:
+        _batcher.close()
+        _batcher = None
+
+
+def model_info() -> dict | None:
+    return _batcher.model.info() if _batcher is not None else None
+
+
+async def assess_risk(
+    temperature: float,
+    humidity: float,
+    aqi: int | None,
+    symptoms: Optional[dict] = None,
+    rules: RuleSet | None = None,
+) -> dict:
+    """
+    assess_environment_risk plus, when a model is loaded, its episode
+    probability. The result carries "scorer": "model" or "rules".
+    """
+    r = rules or _rules.default
+    risk = assess_environment_risk(temperature, humidity, aqi, symptoms, r)
+    batcher = _batcher
+    if batcher is None:
+        RISK_SCORER.inc(scorer="rules", reason="no_model")
+        return {**risk, "scorer": "rules"}
+
+    values = {
+        "temperature":   temperature,
+        "humidity":      humidity,
+        "aqi":           np.nan if aqi is None else aqi,
+        "symptom_score": _score_symptoms(symptoms) if symptoms else 0,
+    }
+    future = batcher.submit(tuple(values[name] for name in batcher.model.feature_names))
+    done, _ = await asyncio.wait((future,), timeout=MODEL_LATENCY_BUDGET_MS / 1000)
+    if not done or future.exception() is not None:
+        if not done:
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        RISK_SCORER.inc(scorer="rules", reason="timeout" if not done else "error")
+        return {**risk, "scorer": "rules"}
+
+    probability = future.result()
+    RISK_SCORER.inc(scorer="model", reason="")
+    if probability >= MODEL_HIGH_PROBABILITY:
+        asthma = "High"
+    elif probability >= MODEL_MODERATE_PROBABILITY:
+        asthma = "Moderate"
+    else:
+        asthma = "Low"
+
+    # Advice as if the symptom stage had landed on the model's tier. The
+    # first match is the one without symptom advice when a name repeats.
+    heat, respiratory, amplified, level, _ = _tier_indices(r, temperature, humidity, aqi, symptoms)
+    if asthma in r.asthma_tiers:
+        level = r.asthma_tiers.index(asthma)
+    alerts, recommendations = r.advice[heat][respiratory][amplified][level]
+
+    return {
+        **risk,
+        "asthma_attack_risk":  asthma,
+        "active_alerts":       alerts,
+        "recommendations":     recommendations,
+        "episode_probability": round(probability, 4),
+        "scorer":              "model",
+    }
@@ -1,7 +1,14 @@
-from pydantic import BaseModel, Field
+import os
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 from enum import Enum
 
+# How far back a gateway may date buffered readings, and how far ahead of
+# the server clock a device's clock may run before a reading is refused
+RECORDED_AT_MAX_AGE_HOURS = float(os.getenv("RECORDED_AT_MAX_AGE_HOURS", 72))
+RECORDED_AT_MAX_SKEW      = float(os.getenv("RECORDED_AT_MAX_SKEW_SECONDS", 60))
+
 
 class SymptomSeverity(str, Enum):
     mild     = "mild"
@@ -22,6 +29,24 @@ class SensorPayload(BaseModel):
     device_id:   Optional[str] = Field(default="esp32-001")
     latitude:    Optional[float] = Field(default=None, ge=-90,  le=90,  description="GPS lat from frontend")
     longitude:   Optional[float] = Field(default=None, ge=-180, le=180, description="GPS lon from frontend")
+    recorded_at: Optional[datetime] = Field(
+        default=None,
+        description="When the device took the reading (UTC if no offset); defaults to when it is received",
+    )
+
+    @field_validator("recorded_at")
+    @classmethod
+    def _recent_past(cls, value: datetime | None) -> datetime | None:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        if value > now + timedelta(seconds=RECORDED_AT_MAX_SKEW):
+            raise ValueError("recorded_at is in the future")
+        if value < now - timedelta(hours=RECORDED_AT_MAX_AGE_HOURS):
+            raise ValueError(f"recorded_at is more than {RECORDED_AT_MAX_AGE_HOURS:g} hours old")
+        return min(value, now)   # within the allowed skew: never stored ahead of the server
 
 
 class SymptomEntry(BaseModel):
@@ -30,10 +55,19 @@ class SymptomEntry(BaseModel):
     - symptoms: the predefined buttons the user selected
     - other_symptoms: anything typed into the Other field
     - notes: the free text box
+    - user_id: whose symptoms these are — readings from that user's devices
+      are scored against them
     """
     symptoms:       list[SymptomItem] = Field(default_factory=list)
     other_symptoms: list[SymptomItem] = Field(default_factory=list)
     notes:          Optional[str]     = Field(default=None, max_length=500)
+    user_id:        Optional[str]     = Field(default=None, min_length=1, max_length=100)
+
+
+class DeviceRegistration(BaseModel):
+    """Ties an ESP32 to the user wearing or owning it."""
+    user_id: Optional[str] = Field(default=None, min_length=1, max_length=100)
+    label:   Optional[str] = Field(default=None, max_length=100, description="Display name, e.g. Bedroom")
 
 
 class OutcomeLabel(BaseModel):
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import aqi_service
+import database
+import live
+import main
+
+
+@contextmanager
+def _client():
+    """The app with its lifespan run against a fresh DB, and no background AQI refresher."""
+    saved = database.DB_PATH, aqi_service.AQI_REFRESH_INTERVAL
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "test.db")
+        aqi_service.AQI_REFRESH_INTERVAL = 0
+        try:
+            with TestClient(main.app) as client:
+                yield client
+        finally:
+            database.DB_PATH, aqi_service.AQI_REFRESH_INTERVAL = saved
+
+
+def _reading(**fields) -> dict:
+    return {"temperature": 30.0, "humidity": 60.0, "aqi": 80, "device_id": "gw-1", **fields}
+
+
+# ---------------------------------------------------------------------------
+# Ingest
+# ---------------------------------------------------------------------------
+
+def test_batch_keeps_each_readings_recorded_at():
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    hour = now.replace(minute=0, second=0)
+    taken = [hour - timedelta(hours=3, minutes=-10), hour - timedelta(hours=2, minutes=-20), hour - timedelta(minutes=50)]
+
+    with _client() as client:
+        response = client.post("/sensor-data/batch", json=[
+            *(_reading(recorded_at=at.isoformat()) for at in taken),
+            _reading(),   # no recorded_at: stored at upload time
+        ])
+        assert response.status_code == 200, response.text
+        ids = response.json()["ids"]
+
+        db = sqlite3.connect(database.DB_PATH)
+        rows = db.execute(
+            "SELECT id, epoch, timestamp FROM sensor_readings WHERE id IN (?, ?, ?, ?) ORDER BY id", ids
+        ).fetchall()
+        db.close()
+        assert [epoch for _, epoch, _ in rows[:3]] == [int(at.timestamp()) for at in taken]
+        assert datetime.fromisoformat(rows[0][2]) == taken[0]
+        assert abs(rows[3][1] - now.timestamp()) < 5
+
+        history = client.get("/history", params={
+            "bucket": "1h",
+            "from": (hour - timedelta(hours=4)).isoformat(),
+            "to":   (now + timedelta(minutes=1)).isoformat(),
+        }).json()
+        counts = {bucket["start"]: bucket["count"] for bucket in history["buckets"]}
+        expected = {(hour - timedelta(hours=h)).isoformat(): 1 for h in (3, 2, 1)}
+        expected[datetime.fromtimestamp(rows[3][1] // 3600 * 3600, timezone.utc).isoformat()] = 1
+        assert counts == expected
+
+
+def test_recorded_at_is_bounded():
+    now = datetime.now(timezone.utc)
+    with _client() as client:
+        for at in (now + timedelta(minutes=10), now - timedelta(days=30)):
+            response = client.post("/sensor-data/batch", json=[_reading(recorded_at=at.isoformat())])
+            assert response.status_code == 422, (at, response.text)
+        # A few seconds of device clock skew is accepted and stored as now
+        response = client.post("/sensor-data", json=_reading(recorded_at=(now + timedelta(seconds=5)).isoformat()))
+        assert response.status_code == 200, response.text
+
+
+# ---------------------------------------------------------------------------
+# Live stream
+# ---------------------------------------------------------------------------
+
+def test_stream_releases_subscriber_when_it_cannot_start():
+    saved = live.LIVE_MAX_SUBSCRIBERS, main.get_latest_sensor_reading
+
+    async def lookup_fails(device_id=None):
+        raise RuntimeError("database is locked")
+
+    try:
+        with _client() as client:
+            live.LIVE_MAX_SUBSCRIBERS = 0
+            response = client.get("/stream/risk")
+            assert response.status_code == 503, response.text
+
+            live.LIVE_MAX_SUBSCRIBERS = 10
+            main.get_latest_sensor_reading = lookup_fails
+            try:
+                client.get("/stream/risk")
+                raise AssertionError("the failed lookup did not surface")
+            except RuntimeError:
+                pass
+            assert live.subscriber_count() == 0
+    finally:
+        live.LIVE_MAX_SUBSCRIBERS, main.get_latest_sensor_reading = saved
+
+
+if __name__ == "__main__":
+    test_batch_keeps_each_readings_recorded_at()
+    test_recorded_at_is_bounded()
+    test_stream_releases_subscriber_when_it_cannot_start()
+    print("--- All API tests passed ---")
@@ -0,0 +1,250 @@
+import asyncio
+import time
+
+import httpx
+from starlette.requests import Request
+
+import aqi_service
+import breaker as breaker_module
+from breaker import CircuitBreaker
+
+IP_LOCATION = {"status": "success", "lat": 9.0765, "lon": 7.3986, "city": "Abuja"}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def _request(ip: str = "8.8.8.8") -> Request:
+    return Request({"type": "http", "headers": [], "client": (ip, 40000)})
+
+
+def _run_chain(body, handler, **breaker_settings):
+    """Runs `await body()` with both upstreams answered by handler, through fresh caches and breakers."""
+    saved = {
+        name: getattr(aqi_service, name)
+        for name in ("_client", "_open_meteo_breaker", "_ip_geo_breaker")
+    }
+
+    async def run():
+        aqi_service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        aqi_service._open_meteo_breaker = CircuitBreaker("open-meteo", **breaker_settings)
+        aqi_service._ip_geo_breaker = CircuitBreaker("ip-api", **breaker_settings)
+        for cache in (aqi_service._aqi_cache, aqi_service._ip_geo_cache):
+            cache.clear()
+        try:
+            return await body()
+        finally:
+            await aqi_service._client.aclose()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        for name, value in saved.items():
+            setattr(aqi_service, name, value)
+
+
+def _open_meteo(request: httpx.Request, aqi: int) -> httpx.Response:
+    return httpx.Response(200, json={
+        "latitude":  float(request.url.params["latitude"]),
+        "longitude": float(request.url.params["longitude"]),
+        "current":   {"us_aqi": aqi, "pm2_5": 10.0, "pm10": 20.0},
+    })
+
+
+def _is_default_cell(request: httpx.Request) -> bool:
+    _, lat, _ = aqi_service.coordinate_cell(aqi_service.DEFAULT_LAT, aqi_service.DEFAULT_LON)
+    return float(request.url.params["latitude"]) == lat
+
+
+# ---------------------------------------------------------------------------
+# IP geolocation
+# ---------------------------------------------------------------------------
+
+def test_unroutable_ip_ranges():
+    for ip in ("172.16.0.1", "172.20.5.5", "172.31.255.255", "10.1.2.3", "192.168.1.1",
+               "127.0.0.1", "100.64.0.1", "169.254.1.1", "::1", "fd00::1", "::ffff:192.168.0.1",
+               "", "unknown", "999.1.1.1"):
+        assert aqi_service.is_unroutable_ip(ip), ip
+    for ip in ("172.15.255.255", "172.32.0.0", "100.63.255.255", "100.128.0.0",
+               "8.8.8.8", "2001:4860:4860::8888", "::ffff:8.8.8.8"):
+        assert not aqi_service.is_unroutable_ip(ip), ip
+
+
+def test_failed_ip_lookup_is_cached_for_the_negative_ttl():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"status": "fail"} if len(calls) == 1 else IP_LOCATION)
+
+    async def body():
+        assert await aqi_service.get_location_from_ip(_request()) is None
+        assert await aqi_service.get_location_from_ip(_request()) is None   # from the negative cache
+        assert calls == ["/json/8.8.8.8"]
+        _, expires_at = aqi_service._ip_geo_cache._data["8.8.8.8"]
+        assert abs(expires_at - time.monotonic() - aqi_service.IP_GEO_NEGATIVE_TTL) < 1
+
+        aqi_service._ip_geo_cache.set("8.8.8.8", None, ttl=0)   # as if IP_GEO_NEGATIVE_TTL had passed
+        location = await aqi_service.get_location_from_ip(_request())
+        assert (location["city"], location["source"]) == ("Abuja", "ip")
+        assert await aqi_service.get_location_from_ip(_request()) == location
+        assert len(calls) == 2
+
+    _run_chain(body, handler)
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+def test_breaker_state_transitions():
+    clock, real_time = _Clock(), breaker_module.time
+    breaker_module.time = clock
+    try:
+        breaker = CircuitBreaker("test", failure_rate=0.5, window=4, min_calls=4, open_seconds=10)
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED   # below min_calls
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow() and breaker.refusing()
+
+        clock.now += 10
+        assert not breaker.refusing()
+        assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow() and breaker.refusing()   # one probe at a time
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now += 10
+        assert breaker.allow()
+        clock.now += 10   # the probe never reported back
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.snapshot() == {"state": "closed", "recent_calls": 1, "error_rate": 0.0}
+    finally:
+        breaker_module.time = real_time
+
+
+def test_tripping_failure_is_not_reported_as_breaker_open():
+    async def handler(request):
+        return httpx.Response(500)
+
+    async def body():
+        outcomes = []
+        for lat in (1.0, 2.0, 3.0):
+            result = await aqi_service.get_aqi_with_fallback(lat=lat, lon=3.0)
+            assert result["source"] == "unavailable"
+            outcomes += [attempt["outcome"] for attempt in result["resolution"]["attempts"]]
+        # The second failure trips the breaker, the third call is refused
+        assert outcomes == ["no_result", "no_result", "breaker_open"]
+
+    _run_chain(body, handler, failure_rate=1.0, min_calls=2)
+
+
+# ---------------------------------------------------------------------------
+# Concurrent resolution
+# ---------------------------------------------------------------------------
+
+def test_ip_step_wins_over_faster_default():
+    async def handler(request):
+        if request.url.host == "ip-api.com":
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json=IP_LOCATION)
+        if _is_default_cell(request):
+            return _open_meteo(request, 60)
+        await asyncio.sleep(0.05)
+        return _open_meteo(request, 90)
+
+    async def body():
+        result = await aqi_service.get_aqi_with_fallback(request=_request())
+        assert (result["resolution"]["step"], result["coordinate_source"], result["aqi"]) == ("ip", "ip", 90)
+        assert result["city"] == "Abuja"
+        assert result["resolution"]["attempts"] == []
+
+    _run_chain(body, handler)
+
+
+def test_default_answers_when_ip_lookup_fails():
+    async def handler(request):
+        if request.url.host == "ip-api.com":
+            return httpx.Response(200, json={"status": "fail"})
+        return _open_meteo(request, 60)
+
+    async def body():
+        result = await aqi_service.get_aqi_with_fallback(request=_request())
+        assert (result["resolution"]["step"], result["aqi"]) == ("default", 60)
+        assert result["resolution"]["attempts"] == [{"step": "ip", "outcome": "no_result"}]
+
+    _run_chain(body, handler)
+
+
+def test_cancelled_default_step_still_fills_cache():
+    async def handler(request):
+        if request.url.host == "ip-api.com":
+            return httpx.Response(200, json=IP_LOCATION)
+        if _is_default_cell(request):
+            await asyncio.sleep(0.3)
+            return _open_meteo(request, 60)
+        return _open_meteo(request, 90)
+
+    async def body():
+        started = time.monotonic()
+        result = await aqi_service.get_aqi_with_fallback(request=_request())
+        assert result["resolution"]["step"] == "ip"
+        assert time.monotonic() - started < 0.25   # did not wait for the default step
+
+        cell, _, _ = aqi_service.coordinate_cell(aqi_service.DEFAULT_LAT, aqi_service.DEFAULT_LON)
+        assert aqi_service._aqi_cache.get(cell) is None
+        await asyncio.sleep(0.4)
+        assert aqi_service._aqi_cache.get(cell)["aqi"] == 60
+
+    _run_chain(body, handler)
+
+
+# ---------------------------------------------------------------------------
+# Background refresher
+# ---------------------------------------------------------------------------
+
+def test_tracked_cells_evict_least_recently_seen():
+    saved = aqi_service._tracked_cells.copy(), aqi_service.AQI_REFRESH_MAX_CELLS
+    aqi_service._tracked_cells.clear()
+    aqi_service.AQI_REFRESH_MAX_CELLS = 3
+    try:
+        default = aqi_service.coordinate_cell(aqi_service.DEFAULT_LAT, aqi_service.DEFAULT_LON)
+        a, b, c = (aqi_service.coordinate_cell(lat, 3.0) for lat in (1.0, 2.0, 4.0))
+        aqi_service._track_cell(*default, "aqi")
+        aqi_service._track_cell(*a, "aqi")
+        aqi_service._track_cell(*b, "aqi")
+        aqi_service._track_cell(*a, "forecast")   # a seen again: b is now least recent
+        aqi_service._track_cell(*c, "aqi")
+        # The default cell is the oldest but is always kept
+        assert list(aqi_service._tracked_cells) == [default[0], a[0], c[0]]
+        assert None not in (aqi_service._tracked_cells[a[0]]["aqi"], aqi_service._tracked_cells[a[0]]["forecast"])
+
+        for lat in range(10, 20):
+            aqi_service._track_cell(*aqi_service.coordinate_cell(float(lat), 3.0), "aqi")
+        assert len(aqi_service._tracked_cells) == 3 and default[0] in aqi_service._tracked_cells
+    finally:
+        aqi_service._tracked_cells.clear()
+        aqi_service._tracked_cells.update(saved[0])
+        aqi_service.AQI_REFRESH_MAX_CELLS = saved[1]
+
+
+if __name__ == "__main__":
+    test_unroutable_ip_ranges()
+    test_failed_ip_lookup_is_cached_for_the_negative_ttl()
+    test_breaker_state_transitions()
+    test_tripping_failure_is_not_reported_as_breaker_open()
+    test_ip_step_wins_over_faster_default()
+    test_default_answers_when_ip_lookup_fails()
+    test_cancelled_default_step_still_fills_cache()
+    test_tracked_cells_evict_least_recently_seen()
+    print("--- All AQI chain tests passed ---")
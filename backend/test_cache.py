@@ -0,0 +1,121 @@
+import asyncio
+
+import cache as cache_module
+from cache import SingleFlight, TTLCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def _with_clock(test):
+    def run():
+        clock, real_time = _Clock(), cache_module.time
+        cache_module.time = clock
+        try:
+            test(clock)
+        finally:
+            cache_module.time = real_time
+    run.__name__ = test.__name__
+    return run
+
+
+# ---------------------------------------------------------------------------
+# TTLCache
+# ---------------------------------------------------------------------------
+
+@_with_clock
+def test_ttl_expiry(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    clock.now += 59.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0   # expired entries are dropped on read
+
+
+@_with_clock
+def test_per_entry_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("miss", None, ttl=5)   # a cached negative result
+    cache.set("hit", {"lat": 1})
+    missing = object()
+    assert cache.get("miss", missing) is None
+    clock.now += 5
+    assert cache.get("miss", missing) is missing
+    assert cache.get("hit") == {"lat": 1}
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")   # b is now least recently used
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+# ---------------------------------------------------------------------------
+# SingleFlight
+# ---------------------------------------------------------------------------
+
+def test_single_flight_coalesces_concurrent_misses():
+    async def body():
+        flight, calls = SingleFlight(), []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {"key": key}
+
+        results = await asyncio.gather(
+            *(flight.do("a", lambda: fetch("a")) for _ in range(5)),
+            flight.do("b", lambda: fetch("b")),
+        )
+        assert calls == ["a", "b"]
+        assert results[:5] == [{"key": "a"}] * 5 and results[0] is results[4]
+        assert len(flight) == 0
+
+        await flight.do("a", lambda: fetch("a"))   # nothing in flight: runs again
+        assert calls == ["a", "b", "a"]
+
+    asyncio.run(body())
+
+
+def test_single_flight_shares_errors_and_survives_cancellation():
+    async def body():
+        flight, calls = SingleFlight(), []
+
+        async def fail():
+            calls.append("fail")
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert calls == ["fail"] and all(isinstance(r, RuntimeError) for r in results)
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return 42
+
+        first = asyncio.create_task(flight.do("k", slow))
+        second = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 42   # a caller going away does not cancel the shared work
+
+    asyncio.run(body())
+
+
+if __name__ == "__main__":
+    test_ttl_expiry()
+    test_per_entry_ttl()
+    test_lru_eviction()
+    test_single_flight_coalesces_concurrent_misses()
+    test_single_flight_shares_errors_and_survives_cancellation()
+    print("--- All cache tests passed ---")
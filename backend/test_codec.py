@@ -0,0 +1,31 @@
+import codec
+
+PACKED = b"\x82\xa3aqi\xcc\xa0\xa6source\xa6device"   # MessagePack for {"aqi": 160, "source": "device"}
+
+
+def test_blobs_read_back_in_either_format():
+    assert codec.decode_blob('{"aqi":160,"source":"device"}') == {"aqi": 160, "source": "device"}
+    if codec.msgpack is not None:
+        assert codec.decode_blob(PACKED) == {"aqi": 160, "source": "device"}
+        assert codec.blob_as_json(PACKED) == '{"aqi":160,"source":"device"}'
+
+
+def test_msgpack_blob_without_msgpack_is_a_clear_error():
+    saved = codec.msgpack
+    codec.msgpack = None   # as if the "fast" extra were not installed
+    try:
+        for read in (codec.decode_blob, codec.blob_as_json):
+            try:
+                read(PACKED)
+                raise AssertionError(f"{read.__name__} decoded MessagePack without msgpack")
+            except RuntimeError as e:
+                assert "msgpack package is not installed" in str(e) and "'fast' extra" in str(e)
+        assert codec.decode_blob('{"aqi":160}') == {"aqi": 160}   # JSON rows are unaffected
+    finally:
+        codec.msgpack = saved
+
+
+if __name__ == "__main__":
+    test_blobs_read_back_in_either_format()
+    test_msgpack_blob_without_msgpack_is_a_clear_error()
+    print("--- All codec tests passed ---")
@@ -0,0 +1,348 @@
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+import database
+from codec import dumps
+
+HOUR = 3600
+# 2026-10-17T22:00:00Z
+BASE = 1792274400
+
+
+def _run(body, **settings):
+    """Runs `await body(tmp_dir)` against a fresh DB with the connection manager open."""
+    saved = {name: getattr(database, name) for name in ("DB_PATH", *settings)}
+
+    async def run(tmp: str):
+        database._write_lock = asyncio.Lock()   # bound to the previous test's loop otherwise
+        database._maintenance_lock = asyncio.Lock()
+        await database.open_db()
+        try:
+            return await body(tmp)
+        finally:
+            await database.close_db()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "test.db")
+        for name, value in settings.items():
+            setattr(database, name, value)
+        try:
+            return asyncio.run(run(tmp))
+        finally:
+            for name, value in saved.items():
+                setattr(database, name, value)
+
+
+def _record(temperature: float, aqi: int, device_id: str = "dev-1") -> tuple[dict, dict]:
+    record = {
+        "sensor_readings": {"temperature": temperature, "humidity": 60.0, "aqi": aqi, "device_id": device_id},
+        "aqi_info":        {"aqi": aqi, "source": "device"},
+    }
+    risk = {"health_score": 100 - aqi // 4, "overall_status": "Safe", "active_alerts": []}
+    return record, risk
+
+
+async def _insert_at(epoch: int, temperature: float, aqi: int, device_id: str = "dev-1") -> int:
+    """Stores a reading as if it had been received at epoch."""
+    received_at = datetime.fromtimestamp(epoch, timezone.utc)
+    row = database._reading_row(received_at, *_record(temperature, aqi, device_id))
+    async with database._writing() as db:
+        (reading_id,) = await database._insert_readings(db, [row])
+        await db.commit()
+    return reading_id
+
+
+async def _stored_ids() -> list[int]:
+    async with database._reading() as db:
+        cursor = await db.execute("SELECT id FROM sensor_readings ORDER BY id")
+        return [row["id"] for row in await cursor.fetchall()]
+
+
+# ---------------------------------------------------------------------------
+# Ingest
+# ---------------------------------------------------------------------------
+
+def test_ack_modes():
+    async def body(_):
+        committed = await database.save_sensor_readings([_record(25, 40), _record(26, 45)], ack="commit")
+        assert await _stored_ids() == committed
+
+        (queued,) = await database.save_sensor_readings([_record(27, 50)], ack="enqueue")
+        assert queued == committed[-1] + 1
+        await database._ingest_queue.join()
+        assert await _stored_ids() == [*committed, queued]
+
+    _run(body)
+
+
+def test_bad_request_fails_alone():
+    async def body(_):
+        (existing,) = await database.save_sensor_readings([_record(25, 40)])
+        loop = asyncio.get_running_loop()
+        good, bad = loop.create_future(), loop.create_future()
+        row = database._reading_row(datetime.now(timezone.utc), *_record(26, 45))
+        good_id = database._next_reading_id
+        database._next_reading_id += 1
+        # Queued together so they share a group commit; the second reuses an id
+        database._ingest_queue.put_nowait(([row], [good_id], good, None))
+        database._ingest_queue.put_nowait(([row], [existing], bad, None))
+        assert await good == [good_id]
+        try:
+            await bad
+            raise AssertionError("a duplicate id was committed")
+        except Exception as e:
+            assert "UNIQUE" in str(e), e
+        assert await _stored_ids() == [existing, good_id]
+
+    _run(body)
+
+
+def test_ingest_log_failure_keeps_writer_running():
+    async def body(_):
+        def broken(seqs):
+            raise OSError("disk full")
+
+        log_committed, database._log_committed = database._log_committed, broken
+        try:
+            first = await asyncio.wait_for(database.save_sensor_readings([_record(25, 40)]), 5)
+            second = await asyncio.wait_for(database.save_sensor_readings([_record(26, 45)]), 5)
+        finally:
+            database._log_committed = log_committed
+        assert await _stored_ids() == [*first, *second]
+        await asyncio.wait_for(database._ingest_queue.join(), 5)
+
+    _run(body)
+
+
+def test_ingest_log_replays_uncommitted_batches():
+    async def body(tmp):
+        (existing,) = await database.save_sensor_readings([_record(25, 40)])
+        await database.close_db()
+
+        path = os.path.join(tmp, "ingest.log")
+        row = database._row_as_json(database._reading_row(datetime.now(timezone.utc), *_record(26, 45)))
+        with open(path, "wb") as f:
+            f.write(dumps({"seq": 1, "ids": [existing, existing + 1], "rows": [row, row]}) + b"\n")
+            f.write(dumps({"seq": 2, "ids": [existing + 2], "rows": [row]}) + b"\n")
+            f.write(dumps({"committed": [2]}) + b"\n")
+            f.write(b'{"seq": 3, "ids": [')   # torn final write
+
+        database.INGEST_LOG_PATH = path
+        await database.open_db()
+        # existing is already stored and seq 2 was committed: only existing + 1 is missing
+        assert await _stored_ids() == [existing, existing + 1]
+        assert os.path.getsize(path) == 0
+        (queued,) = await database.save_sensor_readings([_record(27, 50)], ack="enqueue")
+        assert queued == existing + 2
+
+    _run(body, INGEST_LOG_PATH="")
+
+
+# ---------------------------------------------------------------------------
+# History
+# ---------------------------------------------------------------------------
+
+def test_rollup_history_keeps_partial_leading_bucket():
+    async def body(_):
+        await _insert_at(BASE + 48 * 60, 30, 80)   # 22:48
+        buckets = await database.get_rollup_history(BASE + 30 * 60, BASE + 2 * HOUR, HOUR)   # from 22:30
+        assert [b["start"] for b in buckets] == ["2026-10-17T22:00:00+00:00"]
+        assert buckets[0]["count"] == 1
+
+    _run(body)
+
+
+def test_rollup_history_matches_raw_buckets():
+    async def body(_):
+        for i in range(48):
+            await _insert_at(BASE + i * 1337, 20 + i % 7, 30 + (i * 11) % 150, f"dev-{i % 2}")
+        start, end = BASE - HOUR, BASE + 20 * HOUR
+        for bucket in (HOUR, 6 * HOUR, 86400):
+            for device_id in (None, "dev-1"):
+                raw = await database.get_bucketed_history(start - start % bucket, end, bucket, device_id)
+                rollup = await database.get_rollup_history(start, end, bucket, device_id)
+                assert [{k: b[k] for k in raw[0]} for b in rollup] == raw, (bucket, device_id)
+
+    _run(body)
+
+
+# ---------------------------------------------------------------------------
+# Symptoms
+# ---------------------------------------------------------------------------
+
+def test_symptom_context_stays_with_the_devices_user():
+    async def body(_):
+        await database.save_symptom_log({"user_id": "ada", "symptoms": [{"name": "cough", "severity": "mild"}]})
+        # Nobody registered yet: every device shares the latest entry
+        assert (await database.get_symptom_context("dev-3"))["user_id"] == "ada"
+        assert (await database.get_symptom_context(None))["user_id"] == "ada"
+
+        await database.register_device("dev-1", "ada")
+        await database.register_device("dev-2", "bo")
+        await database.save_symptom_log({"user_id": "bo", "symptoms": [{"name": "wheeze", "severity": "severe"}]})
+        assert (await database.get_symptom_context("dev-1"))["user_id"] == "ada"
+        assert (await database.get_symptom_context("dev-2"))["user_id"] == "bo"
+        assert await database.get_symptom_context("dev-3") is None   # unregistered
+        assert await database.get_symptom_context(None) is None
+
+        await database.register_device("dev-3", "cy")
+        assert await database.get_symptom_context("dev-3") is None   # cy has logged nothing
+
+    _run(body)
+
+
+# ---------------------------------------------------------------------------
+# Migration
+# ---------------------------------------------------------------------------
+
+_LEGACY_READINGS = [
+    # (timestamp, sensor_data, risk_data) as the JSON-only schema stored them
+    (
+        "2026-02-21T22:05:00.123456+00:00",
+        {"sensor_readings": {"temperature": 33.5, "humidity": 72.0, "aqi": 160, "device_id": "esp32-001"},
+         "aqi_info": {"aqi": 155, "source": "open-meteo"}},
+        {"health_score": 40, "overall_status": "Unsafe", "heat_stress_risk": "High",
+         "respiratory_risk": "High", "asthma_attack_risk": "Low",
+         "active_alerts": ["High Heat Stress", "Poor Air Quality"]},
+    ),
+    (
+        "2026-02-21T22:35:00+00:00",
+        {"sensor_readings": {"temperature": 28.0, "humidity": 50.0, "aqi": 40}},   # no device, no aqi_info
+        {"health_score": 100, "overall_status": "Safe"},                            # no alerts
+    ),
+    (
+        "2026-02-21T23:10:00+00:00",
+        {"sensor_readings": {"temperature": None, "humidity": 65.0, "aqi": 0, "device_id": "esp32-001"},
+         "aqi_info": {"aqi": None, "source": "unavailable"}},
+        {"health_score": 85, "overall_status": "Safe", "active_alerts": None},
+    ),
+    (
+        "2026-02-22T01:00:00+00:00",
+        {"sensor_readings": {"temperature": 30.0, "humidity": 80.0, "aqi": 220, "device_id": "esp32-002"},
+         "aqi_info": {"aqi": 220, "source": "device"}},
+        {"health_score": 30, "overall_status": "Dangerous",
+         "active_alerts": ["Critical Air Quality", "Elevated Asthma Attack Risk", "Not A Known Alert"]},
+    ),
+    (
+        "2026-02-22T02:00:00+00:00",
+        {"sensor_readings": {"temperature": 25.0, "humidity": 40.0, "aqi": 30, "device_id": "esp32-002"}},
+        {"health_score": 100, "overall_status": "Safe", "active_alerts": []},
+    ),
+]
+
+
+def test_migrate_backfills_legacy_rows():
+    async def body():
+        db = sqlite3.connect(database.DB_PATH)
+        db.execute("""
+            CREATE TABLE sensor_readings (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp   TEXT NOT NULL,
+                sensor_data TEXT NOT NULL,
+                risk_data   TEXT NOT NULL
+            )
+        """)
+        db.executemany(
+            "INSERT INTO sensor_readings (timestamp, sensor_data, risk_data) VALUES (?, ?, ?)",
+            [(ts, json.dumps(sensor), json.dumps(risk)) for ts, sensor, risk in _LEGACY_READINGS],
+        )
+        db.commit()
+        db.close()
+
+        await database.init_db()
+        await database._migrate(chunk_size=2)
+
+        db = sqlite3.connect(database.DB_PATH)
+        db.row_factory = sqlite3.Row
+        rows = db.execute("SELECT * FROM sensor_readings ORDER BY id").fetchall()
+        assert [row["epoch"] for row in rows] == [
+            int(datetime.fromisoformat(ts).timestamp()) for ts, _, _ in _LEGACY_READINGS
+        ]
+        assert [row["device_id"] for row in rows] == ["esp32-001", None, "esp32-001", "esp32-002", "esp32-002"]
+        assert [row["temperature"] for row in rows] == [33.5, 28.0, None, 30.0, 25.0]
+        assert [row["device_aqi"] for row in rows] == [160, 40, 0, 220, 30]
+        assert [row["aqi"] for row in rows] == [155, None, None, 220, None]
+        assert [row["aqi_source"] for row in rows] == ["open-meteo", None, "unavailable", "device", None]
+        assert [row["health_score"] for row in rows] == [40, 100, 85, 30, 100]
+        assert [row["heat_stress_risk"] for row in rows] == ["High", None, None, None, None]
+        assert [row["alert_flags"] for row in rows] == [
+            database.ALERT_FLAGS["High Heat Stress"] | database.ALERT_FLAGS["Poor Air Quality"],
+            0,
+            0,
+            database.ALERT_FLAGS["Critical Air Quality"] | database.ALERT_FLAGS["Elevated Asthma Attack Risk"],
+            0,
+        ]
+        devices = [row[0] for row in db.execute("SELECT device_id FROM devices ORDER BY device_id")]
+        assert devices == ["esp32-001", "esp32-002"]
+        (rolled_up,) = db.execute("SELECT SUM(count) FROM sensor_rollups_hourly").fetchone()
+        assert rolled_up == len(_LEGACY_READINGS)
+        before = [tuple(row) for row in rows]
+        db.close()
+
+        # A second run finds nothing left to do
+        assert await database.backfill_reading_columns(chunk_size=2) == 0
+        await database._migrate(chunk_size=2)
+        db = sqlite3.connect(database.DB_PATH)
+        assert db.execute("SELECT * FROM sensor_readings ORDER BY id").fetchall() == before
+        assert db.execute("SELECT SUM(count) FROM sensor_rollups_hourly").fetchone() == (rolled_up,)
+        db.close()
+
+    saved = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "legacy.db")   # no open_db(): nothing runs _migrate behind our back
+        try:
+            asyncio.run(body())
+        finally:
+            database.DB_PATH = saved
+
+
+# ---------------------------------------------------------------------------
+# Retention
+# ---------------------------------------------------------------------------
+
+def test_archive_moves_old_unlabelled_readings():
+    async def body(tmp):
+        day = 86400
+        today = int(datetime.now(timezone.utc).timestamp()) // day * day
+        old = today - 10 * day + 6 * HOUR
+        archived = [await _insert_at(old + i * HOUR, 20 + i, 50 + i) for i in range(3)]
+        labelled = await _insert_at(old + 3 * HOUR, 24, 90)
+        recent = await _insert_at(today - day + HOUR, 25, 60)
+        assert await database.save_outcome_label(labelled, True) is not None
+        before = await database.get_rollup_history(old - 6 * HOUR, today, 86400)
+
+        assert await database.archive_old_readings(5, archive_dir=tmp) == 3
+        assert await _stored_ids() == [labelled, recent]
+        assert int(await database.get_meta("archived_before")) == today - 5 * day
+
+        path = os.path.join(tmp, "sensor_readings", datetime.fromtimestamp(old, timezone.utc).strftime("%Y-%m-%d") + ".ndjson.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        assert [row["id"] for row in rows] == archived
+        assert json.loads(rows[0]["sensor_data"])["sensor_readings"]["temperature"] == 20
+
+        # Rollups outlive the raw rows, and archived readings can't be labelled
+        assert await database.get_rollup_history(old - 6 * HOUR, today, 86400) == before
+        assert before[0]["count"] == 4
+        assert await database.save_outcome_label(archived[0], False) is None
+        assert await database.archive_old_readings(0, archive_dir=tmp) == 0
+
+    _run(body)
+
+
+if __name__ == "__main__":
+    test_ack_modes()
+    test_bad_request_fails_alone()
+    test_ingest_log_failure_keeps_writer_running()
+    test_ingest_log_replays_uncommitted_batches()
+    test_rollup_history_keeps_partial_leading_bucket()
+    test_rollup_history_matches_raw_buckets()
+    test_symptom_context_stays_with_the_devices_user()
+    test_migrate_backfills_legacy_rows()
+    test_archive_moves_old_unlabelled_readings()
+    print("--- All database tests passed ---")
@@ -0,0 +1,118 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+import database
+import features
+from codec import encode_blob
+from risk_engine import MODEL_FEATURES
+from test_database import BASE, HOUR, _insert_at, _run
+
+MILD   = {"symptoms": [{"name": "cough", "severity": "mild"}], "other_symptoms": []}
+SEVERE = {"symptoms": [{"name": "wheeze", "severity": "severe"}] * 2, "other_symptoms": []}
+
+
+async def _log_symptoms_at(epoch: int, entry: dict, user_id: str | None = None):
+    logged_at = datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+    async with database._writing() as db:
+        await db.execute(
+            "INSERT INTO symptom_logs (logged_at, entry, user_id) VALUES (?, ?, ?)",
+            (logged_at, encode_blob(entry), user_id),
+        )
+        await db.commit()
+
+
+def test_build_appends_new_labels_and_reads_back():
+    async def body(tmp):
+        out = os.path.join(tmp, "features")
+        ids = [await _insert_at(BASE + i * HOUR, 25 + i, 40 + 10 * i) for i in range(6)]
+        await _log_symptoms_at(BASE + HOUR + 60, MILD)
+        await _log_symptoms_at(BASE + 3 * HOUR + 60, SEVERE)
+
+        for reading_id in ids[:3]:
+            await database.save_outcome_label(reading_id, reading_id == ids[2])
+        first = features.build(database.DB_PATH, out, ["2h"], 24, chunk_size=2)
+        assert first["rows"] == 3
+
+        for reading_id in ids[3:]:
+            await database.save_outcome_label(reading_id, False)
+        second = features.build(database.DB_PATH, out, ["2h"], 24, chunk_size=2)
+        assert second["rows"] == 6 and second["high_water_label_id"] > first["high_water_label_id"]
+
+        matrix = features.open_feature_matrix(out)
+        assert list(matrix["reading_id"]) == ids
+        assert list(matrix["had_episode"]) == [0, 0, 1, 0, 0, 0]
+        assert list(matrix["aqi"]) == [40, 50, 60, 70, 80, 90]
+        assert list(matrix["aqi_mean_2h"]) == [40, 45, 50, 60, 70, 80]
+        assert list(matrix["aqi_max_2h"]) == [40, 50, 60, 70, 80, 90]
+        assert list(matrix["symptom_score"]) == [0, 0, 1, 1, 6, 6]
+        assert list(matrix["symptom_score_max_24h"]) == [0, 0, 1, 1, 6, 6]
+        assert list(matrix["symptom_logs_24h"]) == [0, 0, 1, 1, 2, 2]
+        assert set(MODEL_FEATURES) <= set(matrix)
+
+    _run(body)
+
+
+def test_build_rejects_changed_config():
+    async def body(tmp):
+        out = os.path.join(tmp, "features")
+        await database.save_outcome_label(await _insert_at(BASE, 25, 40), False)
+        features.build(database.DB_PATH, out, ["1h"], 24)
+        try:
+            features.build(database.DB_PATH, out, ["6h"], 24)
+            raise AssertionError("a matrix built with other windows was appended to")
+        except SystemExit:
+            pass
+        rebuilt = features.build(database.DB_PATH, out, ["6h"], 24, rebuild=True)
+        assert rebuilt["rows"] == 1
+        assert np.isclose(features.open_feature_matrix(out)["aqi_mean_6h"][0], 40)
+
+    _run(body)
+
+
+def test_unregistered_device_gets_no_one_elses_symptoms():
+    async def body(tmp):
+        await database.register_device("dev-1", "ada")
+        await _log_symptoms_at(BASE - 120, MILD, "ada")
+        await _log_symptoms_at(BASE - 60, SEVERE, "bo")
+        ids = [await _insert_at(BASE, 25, 40, device_id) for device_id in ("dev-1", "dev-2")]
+        for reading_id in ids:
+            await database.save_outcome_label(reading_id, False)
+
+        features.build(database.DB_PATH, os.path.join(tmp, "features"), [], 24)
+        matrix = features.open_feature_matrix(os.path.join(tmp, "features"))
+        # Scored as get_symptom_context would: dev-2 has no user, so bo's entry is not its
+        assert list(matrix["symptom_score"]) == [1, 0]
+        assert list(matrix["symptom_logs_24h"]) == [1, 0]
+        assert await database.get_symptom_context("dev-2") is None
+
+    _run(body)
+
+
+def test_build_without_windows():
+    async def body(tmp):
+        await database.save_outcome_label(await _insert_at(BASE, 25, 40), True)
+        await _log_symptoms_at(BASE - 60, MILD)
+
+        argv = sys.argv
+        sys.argv = ["features.py", "--db", database.DB_PATH, "--out", os.path.join(tmp, "features"), "--windows", ","]
+        try:
+            features.main()
+        finally:
+            sys.argv = argv
+
+        matrix = features.open_feature_matrix(os.path.join(tmp, "features"))
+        assert not any(name.startswith(("aqi_mean_", "aqi_max_", "humidity_mean_")) for name in matrix)
+        assert (list(matrix["aqi"]), list(matrix["had_episode"]), list(matrix["symptom_score"])) == ([40], [1], [1])
+
+    _run(body)
+
+
+if __name__ == "__main__":
+    test_build_appends_new_labels_and_reads_back()
+    test_build_rejects_changed_config()
+    test_unregistered_device_gets_no_one_elses_symptoms()
+    test_build_without_windows()
+    print("--- All feature matrix tests passed ---")
@@ -0,0 +1,102 @@
+import asyncio
+
+from starlette.requests import Request
+
+import live
+
+
+def _reading(device_id: str, n: int) -> dict:
+    return {"sensor_readings": {"device_id": device_id, "aqi": n}}
+
+
+def _with_settings(**settings):
+    """Runs the test with live settings overridden and no subscribers left behind."""
+    def wrap(test):
+        def run():
+            saved = {name: getattr(live, name) for name in settings}
+            for name, value in settings.items():
+                setattr(live, name, value)
+            try:
+                test()
+                assert live.subscriber_count() == 0
+            finally:
+                live._subscribers.clear()
+                for name, value in saved.items():
+                    setattr(live, name, value)
+        run.__name__ = test.__name__
+        return run
+    return wrap
+
+
+# ---------------------------------------------------------------------------
+# Fan-out
+# ---------------------------------------------------------------------------
+
+@_with_settings(LIVE_QUEUE_SIZE=3)
+def test_slow_subscriber_drops_oldest():
+    everyone, dev_1, dev_2 = live.subscribe(), live.subscribe("dev-1"), live.subscribe("dev-2")
+    for n in range(5):
+        live.publish_reading(_reading("dev-1", n))
+
+    queued = [everyone.queue.get_nowait() for _ in range(everyone.queue.qsize())]
+    assert queued == [live.encode_event(_reading("dev-1", n)) for n in (2, 3, 4)]
+    assert (everyone.dropped, dev_1.dropped, dev_1.queue.qsize()) == (2, 2, 3)
+    assert dev_2.queue.empty() and dev_2.dropped == 0   # another device's readings never reach it
+
+    for subscriber in (everyone, dev_1, dev_2):
+        live.unsubscribe(subscriber)
+    live.unsubscribe(everyone)   # twice is harmless
+
+
+@_with_settings(LIVE_MAX_SUBSCRIBERS=2)
+def test_subscriber_limit():
+    first, second = live.subscribe(), live.subscribe()
+    try:
+        live.subscribe()
+        raise AssertionError("subscribed past LIVE_MAX_SUBSCRIBERS")
+    except live.TooManySubscribers:
+        pass
+    assert live.subscriber_count() == 2
+
+    live.unsubscribe(first)
+    third = live.subscribe()   # a freed slot can be taken again
+    live.unsubscribe(second)
+    live.unsubscribe(third)
+
+
+# ---------------------------------------------------------------------------
+# Server-sent events
+# ---------------------------------------------------------------------------
+
+@_with_settings(LIVE_HEARTBEAT=0.01)
+def test_stream_ends_and_unsubscribes_when_client_leaves():
+    async def body():
+        connected = True
+
+        async def receive():
+            if connected:
+                await asyncio.sleep(1)
+            return {"type": "http.disconnect"}
+
+        subscriber = live.subscribe()
+        request = Request({"type": "http", "headers": []}, receive)
+        events = live.sse_events(subscriber, request, initial=_reading("dev-1", 0))
+        assert (await anext(events)).startswith("retry: ")
+        assert await anext(events) == f"event: reading\ndata: {live.encode_event(_reading('dev-1', 0))}\n\n"
+
+        live.publish_reading(_reading("dev-1", 1))
+        assert await anext(events) == f"event: reading\ndata: {live.encode_event(_reading('dev-1', 1))}\n\n"
+        assert await anext(events) == ": keep-alive\n\n"
+
+        connected = False
+        assert [event async for event in events] == []
+        assert live.subscriber_count() == 0
+
+    asyncio.run(body())
+
+
+if __name__ == "__main__":
+    test_slow_subscriber_drops_oldest()
+    test_subscriber_limit()
+    test_stream_ends_and_unsubscribes_when_client_leaves()
+    print("--- All live stream tests passed ---")
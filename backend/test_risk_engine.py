@@ -0,0 +1,189 @@
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+
+import risk_engine
+from risk_engine import (
+    assess_environment_risk,
+    assess_environment_risk_batch,
+    assess_risk,
+    load_model,
+    reload_rules,
+    rules_for,
+    RuleError,
+    TreeEnsemble,
+    unload_model,
+)
+
+COLUMNS = (
+    "health_score",
+    "overall_status",
+    "heat_stress_risk",
+    "respiratory_risk",
+    "asthma_attack_risk",
+)
+
+# Values either side of every cut-off in the rule engine
+TEMPERATURES = [-10, 0, 28.9, 29, 29.1, 31.9, 32, 32.1, 45, 60]
+HUMIDITIES   = [0, 59.9, 60, 60.1, 69.9, 70, 70.1, 74.9, 75, 75.1, 100]
+AQIS         = [None, 0, 1, 49, 50, 51, 99, 100, 101, 149, 150, 151, 199, 200, 201, 400, 500]
+
+
+def _symptoms_for(score: int) -> dict | None:
+    """Builds a symptom entry whose _score_symptoms() value is `score`."""
+    if score == 0:
+        return None
+    severe, rest = divmod(score, 3)
+    entries = [{"name": "s", "severity": "severe"}] * severe
+    if rest:
+        entries.append({"name": "r", "severity": "moderate" if rest == 2 else "mild"})
+    return {"symptoms": entries, "other_symptoms": []}
+
+
+def _assert_matches(temperatures, humidities, aqis, symptom_scores):
+    batch = assess_environment_risk_batch(temperatures, humidities, aqis, symptom_scores)
+    for i, (t, h, a, s) in enumerate(zip(temperatures, humidities, aqis, symptom_scores)):
+        expected = assess_environment_risk(t, h, a, symptoms=_symptoms_for(s))
+        for column in COLUMNS:
+            assert batch[column][i] == expected[column], (
+                f"{column} mismatch for t={t} h={h} aqi={a} symptoms={s}: "
+                f"batch={batch[column][i]!r} scalar={expected[column]!r}"
+            )
+
+
+def test_batch_matches_scalar_on_boundaries():
+    rows = [
+        (t, h, a, s)
+        for t in TEMPERATURES
+        for h in HUMIDITIES
+        for a in AQIS
+        for s in (0, 2, 3, 6, 9)
+    ]
+    _assert_matches(*map(list, zip(*rows)))
+
+
+def test_batch_matches_scalar_on_random_inputs():
+    rng = random.Random(2026)
+    n = 20_000
+    temperatures   = [rng.uniform(-10, 60) for _ in range(n)]
+    humidities     = [rng.uniform(0, 100) for _ in range(n)]
+    aqis           = [None if rng.random() < 0.1 else rng.randint(0, 500) for _ in range(n)]
+    symptom_scores = [rng.choice([0, 0, 0, rng.randint(1, 9)]) for _ in range(n)]
+    _assert_matches(temperatures, humidities, aqis, symptom_scores)
+
+
+def test_batch_accepts_missing_symptom_scores():
+    batch = assess_environment_risk_batch([30, 33], [65, 80], [80, None])
+    assert list(batch["health_score"]) == [75, 60]
+    assert list(batch["respiratory_risk"]) == ["Low-Moderate", "Unknown"]
+
+
+def test_region_rules_and_reload():
+    with open(risk_engine.RISK_RULES_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    heat = {"default_tier": "Low", "tiers": [
+        {"tier": "Moderate", "above_temperature": 35, "above_humidity": 60, "penalty": 15},
+    ]}
+    config["regions"] = {"sahel": {"bounds": [10, -5, 20, 15], "rules": {"heat": heat}}}
+
+    fd, path = tempfile.mkstemp(suffix=".json")
+    original = risk_engine.RISK_RULES_PATH
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        reload_rules(path)
+        sahel = rules_for(13.5, 2.1)
+        assert sahel.region == "sahel" and rules_for(6.5, 3.4).region == "default"
+        assert assess_environment_risk(33, 80, 40, rules=sahel)["heat_stress_risk"] == "Low"
+        assert assess_environment_risk(33, 80, 40)["heat_stress_risk"] == "High"
+        batch = assess_environment_risk_batch([33, 36], [80, 80], [40, 40], rules=sahel)
+        assert list(batch["heat_stress_risk"]) == ["Low", "Moderate"]
+
+        config["rules"]["aqi"]["tiers"].reverse()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        try:
+            reload_rules(path)
+            raise AssertionError("unsorted AQI cut-offs were accepted")
+        except RuleError:
+            pass
+        assert rules_for(13.5, 2.1) is sahel   # the previous rules stay active
+    finally:
+        reload_rules(original)
+        os.unlink(path)
+
+
+def _write_stump_model() -> str:
+    """Two stumps in Booster.save_model() JSON layout: aqi < 100 → -1 each, else +1, missing → left."""
+    stump = {
+        "left_children":    [1, -1, -1],
+        "right_children":   [2, -1, -1],
+        "split_indices":    [2, 0, 0],
+        "split_conditions": [100.0, -1.0, 1.0],
+        "default_left":     [1, 0, 0],
+        "categories_nodes": [],
+    }
+    model = {"learner": {
+        "feature_names": ["temperature", "humidity", "aqi", "symptom_score"],
+        "learner_model_param": {"base_score": "[5E-1]", "num_feature": "4"},
+        "objective": {"name": "binary:logistic"},
+        "gradient_booster": {"name": "gbtree", "model": {"trees": [stump, stump]}},
+    }}
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(model, f)
+    return path
+
+
+def test_tree_ensemble_matches_xgboost_semantics():
+    path = _write_stump_model()
+    try:
+        ensemble = TreeEnsemble(path)
+    finally:
+        os.unlink(path)
+
+    probabilities = ensemble.predict([[30, 60, 99.9, 0], [30, 60, 100, 0], [30, 60, float("nan"), 0]])
+    low, high = 1 / (1 + math.exp(2)), 1 / (1 + math.exp(-2))
+    assert [round(p, 6) for p in probabilities] == [round(low, 6), round(high, 6), round(low, 6)]
+
+
+def test_model_tier_brings_its_advice():
+    severe = _symptoms_for(9)
+    path = _write_stump_model()
+    budget = risk_engine.MODEL_LATENCY_BUDGET_MS
+    risk_engine.MODEL_LATENCY_BUDGET_MS = 1000
+    try:
+        load_model(path)
+        # Rules say High on the symptoms, the model says Low (p ≈ 0.12)
+        low = asyncio.run(assess_risk(30, 65, 80, severe))
+        expected = assess_environment_risk(30, 65, 80)
+        assert assess_environment_risk(30, 65, 80, severe)["asthma_attack_risk"] == "High"
+        assert (low["scorer"], low["asthma_attack_risk"]) == ("model", "Low")
+        assert low["active_alerts"] == expected["active_alerts"]
+        assert low["recommendations"] == expected["recommendations"]
+        assert low["health_score"] == assess_environment_risk(30, 65, 80, severe)["health_score"]
+
+        # No symptoms, the model says High (p ≈ 0.88): the High tier's alert and advice
+        high = asyncio.run(assess_risk(30, 65, 120))
+        expected = assess_environment_risk(30, 65, 120, severe)
+        assert (high["scorer"], high["asthma_attack_risk"]) == ("model", "High")
+        assert high["active_alerts"] == expected["active_alerts"]
+        assert high["recommendations"] == expected["recommendations"]
+        assert high["health_score"] == assess_environment_risk(30, 65, 120)["health_score"]
+    finally:
+        unload_model()
+        risk_engine.MODEL_LATENCY_BUDGET_MS = budget
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    test_batch_matches_scalar_on_boundaries()
+    test_batch_matches_scalar_on_random_inputs()
+    test_batch_accepts_missing_symptom_scores()
+    test_region_rules_and_reload()
+    test_tree_ensemble_matches_xgboost_semantics()
+    test_model_tier_brings_its_advice()
+    print("--- All risk engine tests passed ---")
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import type { DashboardMetrics } from '../services/types';
-import { fetchLatestMetrics } from '../services/api';
+import { fetchLatestMetrics, subscribeToMetrics } from '../services/api';
 
 export const useMetrics = (pollingIntervalMs = 15000) => {
     const [metrics, setMetrics] = useState<DashboardMetrics | null>(null);
@@ -21,11 +21,31 @@ export const useMetrics = (pollingIntervalMs = 15000) => {
     };
 
     useEffect(() => {
-        loadData(); // Initial load
+        let interval: ReturnType<typeof setInterval> | undefined;
+        const startPolling = () => {
+            if (interval) return;
+            loadData(); // Initial load
+            interval = setInterval(loadData, pollingIntervalMs);
+        };
 
-        const interval = setInterval(loadData, pollingIntervalMs);
+        // Prefer server push; fall back to polling if the stream is unavailable or keeps dropping
+        const unsubscribe = subscribeToMetrics(
+            (data) => {
+                setMetrics(data);
+                setLastUpdated(new Date());
+                setError(null);
+                setLoading(false);
+            },
+            startPolling,
+            // Connected: stop showing the spinner even if the backend has no reading to send yet
+            () => setLoading(false)
+        );
+        if (!unsubscribe) startPolling();
 
-        return () => clearInterval(interval);
+        return () => {
+            unsubscribe?.();
+            if (interval) clearInterval(interval);
+        };
     }, [pollingIntervalMs]);
 
     return { metrics, loading, error, lastUpdated, refetch: loadData };
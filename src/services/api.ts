@@ -24,6 +24,26 @@ const mapBackendAirRisk = (asthmaRisk: string): 'LOW' | 'MEDIUM' | 'HIGH' => {
     return mapBackendRiskLevel(asthmaRisk);
 };
 
+// Shared by /latest-data and the /stream/risk push events, which use the same body
+const mapLatestData = (data: any): DashboardMetrics => {
+    const sensors = data.sensor_readings || {};
+    const health = data.health_assessment || {};
+
+    return {
+        temperature: sensors.temperature || 0,
+        humidity: sensors.humidity || 0,
+        airQuality: sensors.aqi || 0,
+        healthScore: health.health_score || 0,
+        overallRisk: mapBackendRiskLevel(health.overall_status),
+        heatRisk: mapBackendRiskLevel(health.heat_stress_risk),
+        airRisk: mapBackendAirRisk(health.asthma_attack_risk),
+        recommendation: (health.recommendations && health.recommendations.length > 0)
+            ? health.recommendations[0]
+            : "Maintain current activities.",
+        timestamp: data.timestamp || new Date().toISOString(),
+    };
+};
+
 export const fetchLatestMetrics = async (): Promise<DashboardMetrics> => {
     if (FORCE_MOCK_DATA) {
         return new Promise((resolve) => setTimeout(() => resolve(generateMockMetrics()), 500));
@@ -31,29 +51,69 @@ export const fetchLatestMetrics = async (): Promise<DashboardMetrics> => {
 
     try {
         const response = await apiClient.get('/latest-data');
-        const data = response.data;
-        const sensors = data.sensor_readings || {};
-        const health = data.health_assessment || {};
-
-        return {
-            temperature: sensors.temperature || 0,
-            humidity: sensors.humidity || 0,
-            airQuality: sensors.aqi || 0,
-            healthScore: health.health_score || 0,
-            overallRisk: mapBackendRiskLevel(health.overall_status),
-            heatRisk: mapBackendRiskLevel(health.heat_stress_risk),
-            airRisk: mapBackendAirRisk(health.asthma_attack_risk),
-            recommendation: (health.recommendations && health.recommendations.length > 0)
-                ? health.recommendations[0]
-                : "Maintain current activities.",
-            timestamp: data.timestamp || new Date().toISOString(),
-        };
+        return mapLatestData(response.data);
     } catch (error) {
         console.warn("Backend API unavailable (/latest-data). Falling back to mock data.", error);
         return generateMockMetrics();
     }
 };
 
+// Reconnect attempts after the stream drops (1s, 2s, 4s, ... capped) before giving up on push
+const STREAM_MAX_RETRIES = 5;
+const STREAM_RETRY_BASE_MS = 1000;
+const STREAM_RETRY_MAX_MS = 30000;
+
+// Live updates pushed by the backend as soon as a reading is stored.
+// A dropped stream is reopened with exponential backoff; onError is only called once
+// STREAM_MAX_RETRIES attempts in a row have failed, and the caller should then poll.
+// onOpen is called each time the stream connects, before any reading may have arrived.
+// Returns an unsubscribe function, or null when push is unavailable and the caller should poll.
+export const subscribeToMetrics = (
+    onMetrics: (metrics: DashboardMetrics) => void,
+    onError: () => void,
+    onOpen?: () => void,
+    deviceId?: string
+): (() => void) | null => {
+    if (FORCE_MOCK_DATA || typeof EventSource === 'undefined') return null;
+
+    const query = deviceId ? `?device_id=${encodeURIComponent(deviceId)}` : '';
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let failures = 0;
+    let stopped = false;
+
+    const connect = () => {
+        source = new EventSource(`${BASE_URL}/stream/risk${query}`);
+        source.onopen = () => {
+            failures = 0;
+            onOpen?.();
+        };
+        source.addEventListener('reading', (event) => {
+            onMetrics(mapLatestData(JSON.parse((event as MessageEvent).data)));
+        });
+        source.onerror = () => {
+            source?.close();
+            source = null;
+            if (stopped) return;
+            failures += 1;
+            if (failures > STREAM_MAX_RETRIES) {
+                stopped = true;
+                onError();
+                return;
+            }
+            const delay = Math.min(STREAM_RETRY_BASE_MS * 2 ** (failures - 1), STREAM_RETRY_MAX_MS);
+            retryTimer = setTimeout(connect, delay);
+        };
+    };
+    connect();
+
+    return () => {
+        stopped = true;
+        clearTimeout(retryTimer);
+        source?.close();
+    };
+};
+
 export const fetchHistoryData = async (): Promise<HistoryDataPoint[]> => {
     if (FORCE_MOCK_DATA) {
         return new Promise((resolve) => setTimeout(() => resolve(generateMockHistory()), 500));